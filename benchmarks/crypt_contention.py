@@ -0,0 +1,113 @@
+"""
+Measure read latency on a single worker while publishes and updates hash and
+verify secrets with bcrypt.
+
+    $ python -m benchmarks.crypt_contention --writers 4 --duration 5
+
+Each scenario runs the real ASGI app against in-memory backends. The baseline
+has no concurrent writers, the others run bcrypt inline on the event loop or in
+the configured pool.
+"""
+
+import argparse
+import asyncio
+import math
+import statistics
+import time
+
+import httpx
+
+from benchmarks import fakes
+from easypub import config
+from easypub.asgi import app
+from easypub.executors import BoundedExecutor
+
+
+async def writer(client, index, stop):
+    title = f"writer {index}"
+    response = await client.post(
+        "/api/publish", json={"title": title, "content": fakes.body(2048)}
+    )
+    data = response.json()
+    slug = data["url"].rsplit("/", 1)[-1]
+
+    while not stop.is_set():
+        await client.post(
+            f"/api/{slug}/update",
+            json={"secret": data["secret"], "content": fakes.body(2048)},
+        )
+
+
+async def reader(client, stop, latencies):
+    while not stop.is_set():
+        start = time.perf_counter()
+        response = await client.get("/read")
+        latencies.append(time.perf_counter() - start)
+        response.raise_for_status()
+
+
+async def scenario(writers, duration, executor):
+    fakes.install(config)
+    config.__dict__["crypt_executor"] = executor
+
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(
+        transport=transport, base_url=f"http://{config.host}"
+    ) as client:
+        await client.post(
+            "/api/publish", json={"title": "read", "content": fakes.body(2048)}
+        )
+
+        stop = asyncio.Event()
+        latencies = []
+
+        tasks = [asyncio.create_task(writer(client, i, stop)) for i in range(writers)]
+        tasks.append(asyncio.create_task(reader(client, stop, latencies)))
+
+        await asyncio.sleep(duration)
+        stop.set()
+        await asyncio.gather(*tasks)
+
+    executor.shutdown()
+
+    # Quantiles need two reads at least, which a short run may not get to.
+    samples = latencies if len(latencies) >= 2 else (latencies or [math.nan]) * 2
+
+    quantiles = statistics.quantiles(samples, n=100, method="inclusive")
+    return {
+        "reads": len(latencies),
+        "p50_ms": quantiles[49] * 1000,
+        "p99_ms": quantiles[98] * 1000,
+        "max_ms": max(samples) * 1000,
+    }
+
+
+async def main(args):
+    scenarios = {
+        "baseline": (0, BoundedExecutor("thread", args.pool_size, args.max_pending)),
+        "inline": (args.writers, BoundedExecutor("thread", 0, 0)),
+        "pool": (
+            args.writers,
+            BoundedExecutor(args.pool, args.pool_size, args.max_pending),
+        ),
+    }
+
+    print(f"{'scenario':<10} {'reads':>8} {'p50 ms':>10} {'p99 ms':>10} {'max ms':>10}")
+
+    for name, (writers, executor) in scenarios.items():
+        result = await scenario(writers, args.duration, executor)
+        print(
+            f"{name:<10} {result['reads']:>8} {result['p50_ms']:>10.2f} "
+            f"{result['p99_ms']:>10.2f} {result['max_ms']:>10.2f}"
+        )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--duration", type=float, default=5)
+    parser.add_argument("--writers", type=int, default=4)
+    parser.add_argument("--pool", choices=["thread", "process"], default="thread")
+    parser.add_argument("--pool-size", type=int, default=2)
+    parser.add_argument("--max-pending", type=int, default=64)
+
+    asyncio.run(main(parser.parse_args()))
@@ -0,0 +1,356 @@
+"""
+In-memory stand-ins for the redis and S3 clients used by easypub.
+
+They implement just enough of each client for the endpoints to run without any
+network, so that benchmarks measure the application rather than the backends.
+"""
+
+import asyncio
+import fnmatch
+import time
+from datetime import datetime, timezone
+
+from miniopy_async.datatypes import Object
+from miniopy_async.error import S3Error
+
+from easypub import content, reconcile, uploads
+
+
+def _bytes(value):
+    if isinstance(value, bytes):
+        return value
+    return str(value).encode()
+
+
+def _str(value):
+    if isinstance(value, bytes):
+        return value.decode()
+    return value
+
+
+class FakeScript:
+    def __init__(self, client, func):
+        self.client = client
+        self.func = func
+
+    async def __call__(self, keys=None, args=None):
+        return await self.func(self.client, list(keys or []), list(args or []))
+
+
+async def _reserve(client, keys, args):
+    if await client.exists(keys[0]):
+        return 0
+
+    await client.hset(keys[0], mapping=dict(zip(args[::2], args[1::2])))
+    return 1
+
+
+async def _discard(client, keys, args):
+    hash = client.data.get(keys[0], {})
+    if (
+        hash.get(b"etag", b"") != _bytes(args[0])
+        or content.INLINE_FIELD.encode() in hash
+        or content.PENDING_FIELD.encode() in hash
+    ):
+        return 0
+
+    return await client.delete(keys[0])
+
+
+async def _enqueue(client, keys, args):
+    if args[0] == "reserve" and await client.exists(keys[0]):
+        return None
+
+    entry_id = await client.xadd(keys[1], {"slug": args[1], "content": args[2]})
+
+    await client.hdel(keys[0], content.INLINE_FIELD)
+    mapping = {content.PENDING_FIELD: entry_id, **dict(zip(args[3::2], args[4::2]))}
+    await client.hset(keys[0], mapping=mapping)
+
+    return entry_id
+
+
+async def _finish(client, keys, args):
+    if await client.hget(keys[0], content.PENDING_FIELD) != _bytes(args[0]):
+        return 0
+
+    return await client.hdel(keys[0], content.PENDING_FIELD)
+
+
+class FakeStream:
+    def __init__(self):
+        self.entries = {}
+        self.sequence = 0
+        # The last delivered sequence and the entries delivered but not yet
+        # acknowledged, with their consumer and delivery time, of each group.
+        self.groups = {}
+
+    @staticmethod
+    def sequence_of(entry_id):
+        return int(_bytes(entry_id).split(b"-")[0])
+
+    def add(self, fields):
+        self.sequence += 1
+        entry_id = f"{self.sequence}-0".encode()
+        self.entries[entry_id] = {_bytes(k): _bytes(v) for k, v in fields.items()}
+        return entry_id
+
+    def deliver(self, group, consumer, entry_ids):
+        for entry_id in entry_ids:
+            group["pending"][entry_id] = (consumer, time.monotonic())
+
+        return [(entry_id, self.entries.get(entry_id)) for entry_id in entry_ids]
+
+
+class FakeRedis:
+    # Lua scripts are emulated by python functions with the same semantics.
+    SCRIPTS = {
+        content.ENQUEUE_SCRIPT: _enqueue,
+        content.RESERVE_SCRIPT: _reserve,
+        reconcile.DISCARD_SCRIPT: _discard,
+        uploads.FINISH_SCRIPT: _finish,
+    }
+
+    def __init__(self):
+        self.data = {}
+
+    def register_script(self, script):
+        return FakeScript(self, self.SCRIPTS[script])
+
+    async def ping(self):
+        return True
+
+    async def exists(self, *keys):
+        return sum(_str(key) in self.data for key in keys)
+
+    async def delete(self, *keys):
+        return sum(self.data.pop(key, None) is not None for key in keys)
+
+    async def get(self, key):
+        return self.data.get(key)
+
+    async def set(self, key, value, nx=False, px=None):
+        # Expiry is not emulated, coalesced reads delete their locks.
+        if nx and key in self.data:
+            return None
+
+        self.data[key] = _bytes(value)
+        return True
+
+    async def hgetall(self, key):
+        return dict(self.data.get(_str(key), {}))
+
+    async def hset(self, key, field=None, value=None, mapping=None):
+        items = dict(mapping or {})
+        if field is not None:
+            items[field] = value
+
+        hash = self.data.setdefault(key, {})
+        added = sum(_bytes(field) not in hash for field in items)
+        hash.update({_bytes(field): _bytes(value) for field, value in items.items()})
+
+        return added
+
+    async def hget(self, key, field):
+        return self.data.get(_str(key), {}).get(_bytes(field))
+
+    async def hexists(self, key, field):
+        return _bytes(field) in self.data.get(_str(key), {})
+
+    async def hdel(self, key, *fields):
+        hash = self.data.get(key, {})
+        return sum(hash.pop(_bytes(field), None) is not None for field in fields)
+
+    async def publish(self, channel, message):
+        return 0
+
+    async def scan(self, cursor=0, match=None, count=10):
+        # The cursor is an offset into the sorted keys, so keys added or removed
+        # during a scan can be missed or repeated like with a real one.
+        keys = sorted(key for key in self.data if fnmatch.fnmatch(key, match or "*"))
+        end = cursor + count
+
+        return end if end < len(keys) else 0, [key.encode() for key in keys[cursor:end]]
+
+    def pipeline(self, transaction=True):
+        return FakePipeline(self)
+
+    # Streams support a single group reading every entry, blocking reads return
+    # at once.
+
+    async def xadd(self, name, fields):
+        return self.data.setdefault(_str(name), FakeStream()).add(fields)
+
+    async def xrange(self, name, min="-", max="+"):
+        stream = self.data.get(_str(name), FakeStream())
+        low = 0 if min == "-" else stream.sequence_of(min)
+        high = stream.sequence if max == "+" else stream.sequence_of(max)
+
+        return [
+            (entry_id, dict(fields))
+            for entry_id, fields in stream.entries.items()
+            if low <= stream.sequence_of(entry_id) <= high
+        ]
+
+    async def xgroup_create(self, name, groupname, id="$", mkstream=False):
+        from redis.exceptions import ResponseError
+
+        stream = self.data.setdefault(_str(name), FakeStream())
+        if groupname in stream.groups:
+            raise ResponseError("BUSYGROUP Consumer Group name already exists")
+
+        last = stream.sequence if id == "$" else stream.sequence_of(id)
+        stream.groups[groupname] = {"last": last, "pending": {}}
+        return True
+
+    async def xreadgroup(
+        self, groupname, consumername, streams, count=None, block=None
+    ):
+        ((name, _),) = streams.items()
+        stream = self.data[_str(name)]
+        group = stream.groups[groupname]
+
+        entry_ids = [
+            entry_id
+            for entry_id in stream.entries
+            if stream.sequence_of(entry_id) > group["last"]
+        ][:count]
+
+        if not entry_ids:
+            return []
+
+        group["last"] = stream.sequence_of(entry_ids[-1])
+        return [[_bytes(name), stream.deliver(group, consumername, entry_ids)]]
+
+    async def xautoclaim(
+        self, name, groupname, consumername, min_idle_time, start_id=0, count=None
+    ):
+        stream = self.data[_str(name)]
+        group = stream.groups[groupname]
+        cutoff = time.monotonic() - min_idle_time / 1000
+
+        entry_ids = [
+            entry_id
+            for entry_id, (_, delivered) in group["pending"].items()
+            if delivered <= cutoff
+        ][:count]
+
+        return [b"0-0", stream.deliver(group, consumername, entry_ids), []]
+
+    async def xack(self, name, groupname, *ids):
+        pending = self.data[_str(name)].groups[groupname]["pending"]
+        return sum(pending.pop(_bytes(entry_id), None) is not None for entry_id in ids)
+
+    async def xdel(self, name, *ids):
+        entries = self.data[_str(name)].entries
+        return sum(entries.pop(_bytes(entry_id), None) is not None for entry_id in ids)
+
+
+class FakePipeline:
+    def __init__(self, client):
+        self.client = client
+        self.commands = []
+
+    def exists(self, *keys):
+        self.commands.append(self.client.exists(*keys))
+        return self
+
+    def hexists(self, key, field):
+        self.commands.append(self.client.hexists(key, field))
+        return self
+
+    def hgetall(self, key):
+        self.commands.append(self.client.hgetall(key))
+        return self
+
+    async def execute(self):
+        return [await command for command in self.commands]
+
+
+class FakeS3Response:
+    def __init__(self, body):
+        self.body = body
+        self.status = 200
+
+    async def read(self):
+        return self.body
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb):
+        pass
+
+
+class FakeS3:
+    # Objects stored without a modification time are treated as long settled.
+    EPOCH = datetime.fromtimestamp(0, timezone.utc)
+
+    def __init__(self):
+        self.objects = {}
+        self.modified = {}
+
+    async def bucket_exists(self, bucket_name):
+        return True
+
+    async def put_object(self, bucket_name, object_name, data, length, **kwargs):
+        self.objects[object_name] = data.read(length)
+        self.modified[object_name] = datetime.now(timezone.utc)
+        await asyncio.sleep(0)
+
+    async def get_object(self, bucket_name, object_name):
+        if object_name not in self.objects:
+            raise S3Error("NoSuchKey", "", "", "", "", None)
+
+        return FakeS3Response(self.objects[object_name])
+
+    async def stream_object(self, bucket_name, object_name, chunk_size=65536):
+        if object_name not in self.objects:
+            raise S3Error("NoSuchKey", "", "", "", "", None)
+
+        body = self.objects[object_name]
+
+        for start in range(0, len(body), chunk_size):
+            end = start + chunk_size
+            yield body[start:end]
+            await asyncio.sleep(0)
+
+    def _object(self, bucket_name, object_name):
+        return Object(
+            bucket_name,
+            object_name,
+            last_modified=self.modified.get(object_name, self.EPOCH),
+            size=len(self.objects[object_name]),
+        )
+
+    async def stat_object(self, bucket_name, object_name):
+        if object_name not in self.objects:
+            raise S3Error("NoSuchKey", "", "", "", "", None)
+
+        return self._object(bucket_name, object_name)
+
+    async def iter_objects(self, bucket_name, page_size=1000):
+        for object_name in sorted(self.objects):
+            yield self._object(bucket_name, object_name)
+
+    async def remove_object(self, bucket_name, object_name):
+        self.objects.pop(object_name, None)
+
+    async def get_presigned_url(self, method, bucket_name, object_name):
+        return f"memory://{bucket_name}/{object_name}"
+
+
+def install(config):
+    """
+    Replace the redis and S3 clients on config with in-memory stand-ins.
+    """
+    config.__dict__["redis"] = FakeRedis()
+    config.__dict__["s3"] = FakeS3()
+    config.limiter.enabled = False
+
+    return config.redis, config.s3
+
+
+def body(size: int) -> str:
+    paragraph = "<p>The quick brown fox jumps over the lazy dog.</p>"
+    return (paragraph * (size // len(paragraph) + 1))[:size]
@@ -0,0 +1,323 @@
+"""
+Measure the throughput and latency of every endpoint on a single worker.
+
+    $ python -m benchmarks.load run --output report.json
+    $ python -m benchmarks.load compare before.json report.json
+
+Each operation runs against the real ASGI app and in-memory backends, for
+every combination of document size and concurrency. The report is written as
+json so that runs, for instance before and after a change, can be compared.
+
+Content is kept in a local directory instead of in memory with
+
+    $ python -m benchmarks.load run --set storage_url=file:///tmp/easypub
+"""
+
+import argparse
+import asyncio
+import datetime
+import itertools
+import json
+import logging
+import platform
+import statistics
+import subprocess
+import sys
+import time
+import uuid
+
+import httpx
+
+from benchmarks import fakes
+from easypub import config, encoding
+from easypub.asgi import app
+from easypub.content import INLINE_FIELD, metadata_key, should_inline
+from easypub.crypto import get_crypt_context, hash_secret
+from easypub.endpoints import content_metadata
+from easypub.fields import clean
+
+OPERATIONS = ["read", "admin", "publish", "update", "delete"]
+
+# Read, admin and update requests are spread over this many publications.
+POOL_SIZE = 16
+
+SECRET = "benchmark"
+
+
+class Seeder:
+    """
+    Write publications straight into the backends, which is much
+    faster than publishing them through the app.
+    """
+
+    def __init__(self, redis):
+        self.redis = redis
+        self.secret_hash = hash_secret(SECRET)
+
+    async def __call__(self, size, count):
+        encoded_content = encoding.compress(clean(fakes.body(size)).encode())
+        slugs = []
+
+        for _ in range(count):
+            slug = f"seed-{uuid.uuid4().hex}"
+            mapping = {
+                "secret_hash": self.secret_hash,
+                "title": slug,
+                **content_metadata(encoded_content),
+            }
+
+            if should_inline(encoded_content):
+                mapping[INLINE_FIELD] = encoded_content
+            else:
+                await config.storage.put(slug, encoded_content, "gzip")
+
+            await self.redis.hset(metadata_key(slug), mapping=mapping)
+            slugs.append(slug)
+
+        return slugs
+
+
+async def requests_for(operation, size, count, seed):
+    """
+    Return count (method, url, json) tuples which perform operation.
+    """
+    content = fakes.body(size)
+
+    if operation == "publish":
+        return [
+            ("POST", "/api/publish", {"title": uuid.uuid4().hex, "content": content})
+            for _ in range(count)
+        ]
+
+    if operation == "delete":
+        slugs = await seed(size, count)
+        return [("POST", f"/api/{slug}/delete", {"secret": SECRET}) for slug in slugs]
+
+    slugs = itertools.islice(itertools.cycle(await seed(size, POOL_SIZE)), count)
+
+    if operation == "read":
+        return [("GET", f"/{slug}", None) for slug in slugs]
+
+    if operation == "admin":
+        return [("GET", f"/{slug}/admin", None) for slug in slugs]
+
+    return [
+        ("POST", f"/api/{slug}/update", {"secret": SECRET, "content": content})
+        for slug in slugs
+    ]
+
+
+async def measure(client, requests, concurrency):
+    pending = iter(requests)
+    latencies = []
+    errors = 0
+
+    async def worker():
+        nonlocal errors
+
+        for method, url, data in pending:
+            start = time.perf_counter()
+            response = await client.request(method, url, json=data)
+            latencies.append(time.perf_counter() - start)
+
+            if response.status_code >= 400:
+                errors += 1
+
+    start = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    elapsed = time.perf_counter() - start
+
+    quantiles = statistics.quantiles(latencies, n=100, method="inclusive")
+    return {
+        "requests": len(latencies),
+        "errors": errors,
+        "rps": len(latencies) / elapsed,
+        "p50_ms": quantiles[49] * 1000,
+        "p99_ms": quantiles[98] * 1000,
+    }
+
+
+def configure(overrides):
+    for override in overrides:
+        name, _, value = override.partition("=")
+        field = type(config).__fields__[name]
+
+        value, error = field.validate(value, {}, loc=name)
+        if error:
+            raise SystemExit(f"invalid value for {name}: {value!r}")
+
+        setattr(config, name, value)
+
+    # Cached objects built from the settings above.
+    for name in ["page_cache", "crypt_executor", "sanitize_executor", "storage"]:
+        config.__dict__.pop(name, None)
+
+
+def git_revision():
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"],
+            capture_output=True,
+            check=True,
+            text=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+async def run(args):
+    # Every publish and update would log its sanitization otherwise.
+    logging.getLogger("easypub").setLevel(logging.WARNING)
+
+    configure(args.set)
+    redis, _ = fakes.install(config)
+    await config.storage.create()
+
+    if args.bcrypt_rounds:
+        get_crypt_context().update(bcrypt__rounds=args.bcrypt_rounds)
+
+    seed = Seeder(redis)
+    results = []
+
+    print(
+        f"{'operation':<10} {'size':>8} {'conc':>6} {'rps':>10} "
+        f"{'p50 ms':>10} {'p99 ms':>10} {'errors':>8}"
+    )
+
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(
+        transport=transport, base_url=f"http://{config.host}", timeout=None
+    ) as client:
+        # Compile the templates and warm up the pools before measuring.
+        (slug,) = await seed(args.sizes[0], 1)
+        await client.get(f"/{slug}")
+
+        for operation, size, concurrency in itertools.product(
+            args.operations, args.sizes, args.concurrency
+        ):
+            requests = await requests_for(operation, size, args.requests, seed)
+            result = {
+                "operation": operation,
+                "size": size,
+                "concurrency": concurrency,
+                **await measure(client, requests, concurrency),
+            }
+            results.append(result)
+
+            print(
+                f"{operation:<10} {size:>8} {concurrency:>6} {result['rps']:>10.1f} "
+                f"{result['p50_ms']:>10.2f} {result['p99_ms']:>10.2f} "
+                f"{result['errors']:>8}"
+            )
+
+    config.crypt_executor.shutdown()
+    config.sanitize_executor.shutdown()
+
+    report = {
+        "created": datetime.datetime.now(datetime.timezone.utc).isoformat(),
+        "revision": git_revision(),
+        "python": platform.python_version(),
+        "settings": {
+            "requests": args.requests,
+            "bcrypt_rounds": args.bcrypt_rounds,
+            "config": args.set,
+        },
+        "results": results,
+    }
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+
+
+def change(before, after):
+    return (after - before) / before * 100 if before else 0.0
+
+
+def compare(args):
+    """
+    Print the change in throughput and p99 latency of every measurement found
+    in both reports. Returns 1 when throughput dropped by more than the
+    given threshold for any of them.
+    """
+    with open(args.before) as f:
+        before = json.load(f)
+    with open(args.after) as f:
+        after = json.load(f)
+
+    def key(result):
+        return result["operation"], result["size"], result["concurrency"]
+
+    baseline = {key(result): result for result in before["results"]}
+    regressions = 0
+
+    print(
+        f"{'operation':<10} {'size':>8} {'conc':>6} {'rps':>10} {'change':>8} "
+        f"{'p99 ms':>10} {'change':>8}"
+    )
+
+    for result in after["results"]:
+        if key(result) not in baseline:
+            continue
+
+        previous = baseline[key(result)]
+        rps_change = change(previous["rps"], result["rps"])
+        p99_change = change(previous["p99_ms"], result["p99_ms"])
+
+        if args.threshold is not None and -rps_change > args.threshold:
+            regressions += 1
+
+        print(
+            f"{result['operation']:<10} {result['size']:>8} "
+            f"{result['concurrency']:>6} {result['rps']:>10.1f} {rps_change:>+7.1f}% "
+            f"{result['p99_ms']:>10.2f} {p99_change:>+7.1f}%"
+        )
+
+    return 1 if regressions else 0
+
+
+def sizes(value):
+    return [int(size) for size in value.split(",")]
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    run_parser = subparsers.add_parser("run", help="run the benchmarks")
+    run_parser.add_argument(
+        "--operations",
+        type=lambda value: value.split(","),
+        default=OPERATIONS,
+        help="comma separated, defaults to all of them",
+    )
+    run_parser.add_argument("--sizes", type=sizes, default=[1024, 16384, 262144])
+    run_parser.add_argument("--concurrency", type=sizes, default=[1, 16, 64])
+    run_parser.add_argument("--requests", type=int, default=100)
+    run_parser.add_argument(
+        "--bcrypt-rounds", type=int, help="lower than the default for quicker runs"
+    )
+    run_parser.add_argument(
+        "--set",
+        action="append",
+        default=[],
+        metavar="NAME=VALUE",
+        help="override a config setting, like inline_content_size=4096",
+    )
+    run_parser.add_argument("--output", help="write the report to this json file")
+
+    compare_parser = subparsers.add_parser("compare", help="compare two reports")
+    compare_parser.add_argument("before")
+    compare_parser.add_argument("after")
+    compare_parser.add_argument(
+        "--threshold",
+        type=float,
+        help="fail when throughput drops by more than this many percent",
+    )
+
+    args = parser.parse_args()
+
+    if args.command == "run":
+        asyncio.run(run(args))
+    else:
+        sys.exit(compare(args))
@@ -2,6 +2,7 @@ from unittest.mock import DEFAULT, AsyncMock, patch
 
 import pytest
 
+from benchmarks import fakes
 from easypub import config as appconfig
 
 
@@ -9,10 +10,13 @@ from easypub import config as appconfig
 def config():
     class Proxy:
         backup = {}
+        added = set()
 
         def __setattr__(self, name, value):
             if name in appconfig.__dict__ and name not in self.backup:
                 self.backup[name] = appconfig.__dict__[name]
+            elif name not in appconfig.__dict__:
+                self.added.add(name)
 
             appconfig.__dict__[name] = value
 
@@ -23,6 +27,10 @@ def config():
             for name, value in self.backup.items():
                 appconfig.__dict__[name] = value
 
+            # Cached clients which were not built yet are built afresh.
+            for name in self.added:
+                appconfig.__dict__.pop(name, None)
+
     proxy = Proxy()
     yield proxy
     proxy.unwind()
@@ -34,10 +42,13 @@ def redis(config):
         config.redis,
         new_callable=AsyncMock,
         delete=DEFAULT,
+        evalsha=DEFAULT,
         exists=DEFAULT,
+        hdel=DEFAULT,
         hgetall=DEFAULT,
         hset=DEFAULT,
         ping=DEFAULT,
+        publish=DEFAULT,
     ):
         yield config.redis
 
@@ -54,3 +65,14 @@ def s3(config):
         remove_object=DEFAULT,
     ):
         yield config.s3
+
+
+@pytest.fixture
+def backends(config):
+    """
+    In-memory stand-ins for redis and S3, for tests which need them to keep
+    what is written to them.
+    """
+    config.redis = fakes.FakeRedis()
+    config.s3 = fakes.FakeS3()
+    return config.redis, config.s3
@@ -8,12 +8,18 @@ from slowapi.errors import RateLimitExceeded
 
 from starlette.applications import Starlette
 from starlette.middleware import Middleware
-from starlette.middleware.gzip import GZipMiddleware
 from starlette.middleware.trustedhost import TrustedHostMiddleware
 from starlette.responses import JSONResponse
 
 from easypub import config
-from easypub.middleware import TimeoutMiddleware
+from easypub.executors import Saturated
+from easypub.middleware import (
+    CompressionMiddleware,
+    MetricsMiddleware,
+    ServerTimingMiddleware,
+    TimeoutMiddleware,
+)
+from easypub.pages import invalidation_listener
 from easypub.routes import routes
 
 
@@ -27,23 +33,54 @@ async def validation_error_handler(request, exc):
     return JSONResponse(errors, status_code=HTTPStatus.UNPROCESSABLE_ENTITY)
 
 
+async def saturated_handler(request, exc):
+    return JSONResponse(
+        {"detail": HTTPStatus.SERVICE_UNAVAILABLE.phrase},
+        status_code=HTTPStatus.SERVICE_UNAVAILABLE,
+        headers={"Retry-After": "1"},
+    )
+
+
 exception_handlers = {
     ValidationError: validation_error_handler,
     RateLimitExceeded: _rate_limit_exceeded_handler,
+    Saturated: saturated_handler,
 }
 
 app = Starlette(
     debug=config.debug,
     middleware=[
+        Middleware(MetricsMiddleware),
+        Middleware(ServerTimingMiddleware),
         Middleware(TrustedHostMiddleware, allowed_hosts=[config.host]),
-        Middleware(TimeoutMiddleware, timeout=config.request_timeout),
-        Middleware(GZipMiddleware),
+        Middleware(
+            TimeoutMiddleware,
+            timeout=config.request_timeout,
+            route_timeouts=config.route_timeouts,
+        ),
+        # Static files are served precompressed by collectstatic.
+        Middleware(
+            CompressionMiddleware,
+            codings=config.compression_codings,
+            levels=config.compression_levels,
+            minimum_size=config.compression_minimum_size,
+            content_types=config.compression_types,
+            exclude_routes={"static"},
+        ),
     ],
     routes=routes,
     exception_handlers=exception_handlers,
+    on_startup=[config.warm_templates, config.open, invalidation_listener.start],
+    on_shutdown=[
+        invalidation_listener.stop,
+        config.close,
+        config.crypt_executor.shutdown,
+        config.sanitize_executor.shutdown,
+    ],
 )
 
 app.state.limiter = config.limiter
 app.state.cache_control = config.cache_control
+app.state.server_timing = config.server_timing
 
 logging.config.dictConfig(config.logging)
@@ -0,0 +1,37 @@
+import asyncio
+
+import redis.asyncio
+
+from easypub import deadlines, metrics
+
+
+class Redis(redis.asyncio.Redis):
+    """
+    Redis client which records the duration of every command it executes and
+    gives up on commands once the deadline of the current request has passed.
+    """
+
+    async def execute_command(self, *args, **options):
+        await self.initialize()
+        pool = self.connection_pool
+        command_name = args[0]
+        conn = self.connection or await pool.get_connection(command_name, **options)
+
+        try:
+            with metrics.timed("redis", str(command_name).lower()):
+                return await deadlines.wait(
+                    conn.retry.call_with_retry(
+                        lambda: self._send_command_parse_response(
+                            conn, command_name, *args, **options
+                        ),
+                        lambda error: self._disconnect_raise(conn, error),
+                    )
+                )
+        except (asyncio.CancelledError, asyncio.TimeoutError):
+            # The reply could still arrive later and would then be read as the
+            # reply to the next command sent over this connection.
+            await conn.disconnect()
+            raise
+        finally:
+            if not self.connection:
+                await pool.release(conn)
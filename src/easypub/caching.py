@@ -1,3 +1,8 @@
+import time
+from collections import OrderedDict
+from email.utils import formatdate, parsedate_to_datetime
+from typing import Any, Hashable, Mapping, Optional
+
 UNITS_TO_SECONDS = {
     "s": 1,
     "m": 60,
@@ -39,3 +44,103 @@ def build_cache_control(**options) -> str:
             if value
         ]
     )
+
+
+def build_validators(
+    etag: Optional[str] = None, modified: Optional[float] = None
+) -> dict[str, str]:
+    headers = {}
+
+    # The same page is sent with different content encodings, so the tag can
+    # only ever be weak.
+    if etag:
+        headers["ETag"] = f'W/"{etag}"'
+
+    if modified:
+        headers["Last-Modified"] = formatdate(modified, usegmt=True)
+
+    return headers
+
+
+def is_not_modified(
+    request_headers: Mapping[str, str], validators: Mapping[str, str]
+) -> bool:
+    if_none_match = request_headers.get("if-none-match")
+
+    # If-None-Match takes precedence over If-Modified-Since when both are sent.
+    if if_none_match is not None:
+        if "ETag" not in validators:
+            return False
+
+        if if_none_match.strip() == "*":
+            return True
+
+        etag = validators["ETag"].removeprefix("W/")
+        return any(
+            tag.strip().removeprefix("W/") == etag for tag in if_none_match.split(",")
+        )
+
+    if_modified_since = request_headers.get("if-modified-since")
+
+    if if_modified_since is not None and "Last-Modified" in validators:
+        try:
+            since = parsedate_to_datetime(if_modified_since)
+            return parsedate_to_datetime(validators["Last-Modified"]) <= since
+        except (TypeError, ValueError):
+            return False
+
+    return False
+
+
+class LRUCache:
+    def __init__(self, maxsize: int, ttl: int):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self._data: OrderedDict[Hashable, tuple[float, Any]] = OrderedDict()
+
+    def get(self, key: Hashable) -> Any:
+        try:
+            expires, value = self._data[key]
+        except KeyError:
+            self.misses += 1
+            return None
+
+        if expires <= time.monotonic():
+            del self._data[key]
+            self.misses += 1
+            return None
+
+        self._data.move_to_end(key)
+        self.hits += 1
+
+        return value
+
+    def set(self, key: Hashable, value: Any) -> None:
+        if self.maxsize <= 0:
+            return
+
+        self._data[key] = (time.monotonic() + self.ttl, value)
+        self._data.move_to_end(key)
+
+        while len(self._data) > self.maxsize:
+            self._data.popitem(last=False)
+
+    def delete(self, key: Hashable) -> None:
+        self._data.pop(key, None)
+
+    def clear(self) -> None:
+        self._data.clear()
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+    @property
+    def stats(self) -> dict[str, int]:
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "size": len(self),
+            "maxsize": self.maxsize,
+        }
@@ -0,0 +1,39 @@
+import asyncio
+from typing import Any, Awaitable, Callable, Hashable
+
+from easypub import metrics
+
+
+class SingleFlight:
+    """
+    Share one call of an async function between all concurrent callers using
+    the same key, instead of calling it once for each of them.
+
+    A caller which is cancelled, like a request which timed out, stops waiting
+    for the call without cancelling it for the others.
+    """
+
+    def __init__(self, operation: str):
+        self.operation = operation
+        self.calls: dict[Hashable, asyncio.Future] = {}
+
+    async def __call__(
+        self, key: Hashable, func: Callable[..., Awaitable], *args: Any
+    ) -> Any:
+        call = self.calls.get(key)
+
+        if call is None:
+            call = self.calls[key] = asyncio.ensure_future(func(*args))
+            call.add_done_callback(lambda _: self.done(key, call))
+        else:
+            metrics.coalesced_waiters.labels(self.operation, "local").inc()
+
+        return await asyncio.shield(call)
+
+    def done(self, key: Hashable, call: asyncio.Future) -> None:
+        if self.calls.get(key) is call:
+            del self.calls[key]
+
+        # Retrieve the error of a call whose callers all gave up on it, so that
+        # it is not reported as never retrieved.
+        call.cancelled() or call.exception()
@@ -1,32 +1,114 @@
+import hashlib
 import json
+import logging
 from pathlib import Path
+from typing import Union
 
-from fastapi_static_digest import StaticDigest
-from jinja2.filters import do_mark_safe
-from miniopy_async import Minio
-from pydantic import AnyHttpUrl, BaseSettings, RedisDsn
-from redis.asyncio import Redis
-from slowapi import Limiter
-
-from starlette.templating import Jinja2Templates
+from pydantic import AnyHttpUrl, BaseSettings, FileUrl, RedisDsn
 
+from easypub.caching import LRUCache, duration_to_seconds
+from easypub.executors import BoundedExecutor
 from easypub.utils import cached_property, get_client_ip
 
+logger = logging.getLogger(__name__)
+
 
 class Config(BaseSettings):
+    """
+    Settings read from the environment and the clients built from them. The
+    clients import their dependencies when they are first used, so that
+    commands which do not need them start faster.
+    """
+
     cache_url: RedisDsn
+    coalesce_reads: str = "local"
+    compression_codings: list[str] = ["br", "zstd", "gzip"]
+    compression_levels: dict[str, int] = {}
+    compression_minimum_size: int = 500
+    compression_types: list[str] = [
+        "application/javascript",
+        "application/json",
+        "image/svg+xml",
+        "text/css",
+        "text/html",
+        "text/javascript",
+        "text/plain",
+    ]
+    crypt_pool: str = "thread"
+    crypt_pool_max_pending: int = 16
+    crypt_pool_size: int = 2
     debug: bool = False
     host: str
-    request_timeout: int = 5
-    storage_url: AnyHttpUrl
+    inline_content_size: int = 0
+    max_content_length: int = 1_000_000
+    rate_limit_sync_interval: float = 1
+    read_cache_size: int = 0
+    read_cache_ttl: str = "5m"
+    redis_connect_timeout: float = 2
+    redis_keepalive: bool = True
+    redis_max_connections: int = 50
+    redis_timeout: float = 5
+    request_timeout: float = 5
+    route_timeouts: dict[str, float] = {}
+    s3_connect_timeout: float = 2
+    s3_keepalive_timeout: float = 15
+    s3_max_connections: int = 100
+    s3_read_timeout: float = 10
+    sanitize_pool_max_pending: int = 8
+    sanitize_pool_size: int = 2
+    sanitize_threshold: int = 65_536
+    server_timing: bool = False
+    speculative_reads: bool = False
+    stream_threshold: int = 0
+    storage_dictionary: str = ""
+    storage_url: Union[AnyHttpUrl, FileUrl]
+    write_behind: bool = False
 
     @cached_property
     def base_dir(self):
         return Path(__file__).resolve().parent
 
+    @cached_property
+    def template_cache_dir(self):
+        return self.base_dir / "_bytecode"
+
+    @cached_property
+    def build_files(self):
+        # Everything pages are rendered from besides their content: the
+        # templates, and the manifest of the digested static files they link.
+        files = sorted((self.base_dir / "templates").rglob("*.html"))
+        manifest = self.base_dir / "static" / "_digest" / "cache_manifest.json"
+
+        return files + [manifest] if manifest.is_file() else files
+
+    @cached_property
+    def build_version(self):
+        digest = hashlib.sha256()
+
+        for path in self.build_files:
+            digest.update(path.relative_to(self.base_dir).as_posix().encode())
+            digest.update(path.read_bytes())
+
+        return digest.hexdigest()[:16]
+
+    @cached_property
+    def build_modified(self):
+        return int(max((path.stat().st_mtime for path in self.build_files), default=0))
+
     @cached_property
     def templates(self):
+        from jinja2.filters import do_mark_safe
+
+        from starlette.templating import Jinja2Templates
+
+        from easypub.templating import BytecodeCache, Template
+
         jinja = Jinja2Templates(directory=self.base_dir / "templates")
+        jinja.env.template_class = Template
+
+        # Compiled by collectstatic, so that workers do not compile templates.
+        if self.template_cache_dir.is_dir():
+            jinja.env.bytecode_cache = BytecodeCache(str(self.template_cache_dir))
 
         # Add the jsonify filter to the environment. This filter will json encode
         # and mark the resulting text as safe. This can be used to template
@@ -35,26 +117,84 @@ class Config(BaseSettings):
 
         return jinja
 
+    def warm_templates(self):
+        # Load every template before the first request needs it.
+        for name in self.templates.env.list_templates(extensions=["html"]):
+            self.templates.get_template(name)
+
     @cached_property
     def static(self):
+        from fastapi_static_digest import StaticDigest
+
         static = StaticDigest(source_dir=self.base_dir / "static")
         static.register_static_url_for(self.templates)
         return static
 
     @cached_property
     def redis(self):
-        return Redis.from_url(self.cache_url)
+        from redis.asyncio import BlockingConnectionPool
+
+        from easypub.cache import Redis
+
+        # Commands wait for a connection once all of them are in use, instead
+        # of failing right away.
+        pool = BlockingConnectionPool.from_url(
+            self.cache_url,
+            max_connections=self.redis_max_connections,
+            timeout=self.redis_timeout,
+            socket_connect_timeout=self.redis_connect_timeout,
+            socket_keepalive=self.redis_keepalive,
+            socket_timeout=self.redis_timeout,
+        )
+
+        return Redis(connection_pool=pool)
+
+    @cached_property
+    def page_cache(self):
+        return LRUCache(
+            maxsize=self.read_cache_size,
+            ttl=duration_to_seconds(self.read_cache_ttl),
+        )
+
+    @cached_property
+    def crypt_executor(self):
+        return BoundedExecutor(
+            kind=self.crypt_pool,
+            workers=self.crypt_pool_size,
+            max_pending=self.crypt_pool_max_pending,
+        )
+
+    @cached_property
+    def sanitize_executor(self):
+        return BoundedExecutor(
+            kind="process",
+            workers=self.sanitize_pool_size,
+            max_pending=self.sanitize_pool_max_pending,
+        )
 
     @cached_property
     def limiter(self):
+        from easypub.limiting import Limiter
+
+        # Without a sync interval every rate limited request checks redis.
+        if self.rate_limit_sync_interval <= 0:
+            return Limiter(
+                key_func=get_client_ip,
+                enabled=not self.debug,
+                storage_uri=self.cache_url,
+            )
+
         return Limiter(
             key_func=get_client_ip,
             enabled=not self.debug,
-            storage_uri=self.cache_url,
+            storage_uri=f"local+{self.cache_url}",
+            storage_options={"sync_interval": self.rate_limit_sync_interval},
         )
 
     @cached_property
     def s3(self):
+        from easypub.s3 import Minio
+
         if self.storage_url.port:
             endpoint = f"{self.storage_url.host}:{self.storage_url.port}"
         else:
@@ -65,8 +205,55 @@ class Config(BaseSettings):
             access_key=self.storage_url.user,
             secret_key=self.storage_url.password,
             secure=self.storage_url.scheme == "https",
+            max_connections=self.s3_max_connections,
+            keepalive_timeout=self.s3_keepalive_timeout,
+            connect_timeout=self.s3_connect_timeout,
+            read_timeout=self.s3_read_timeout,
         )
 
+    @cached_property
+    def storage(self):
+        from easypub.storage import FileSystemStorage, S3Storage
+
+        if self.storage_url.scheme == "file":
+            return FileSystemStorage(Path(self.storage_url.path))
+
+        return S3Storage()
+
+    async def open(self):
+        from redis.exceptions import RedisError
+
+        # Create both connection pools up front, so the first requests of a
+        # worker do not pay for connecting.
+        await self.storage.open()
+        await self.redis.initialize()
+
+        # A worker starts without redis, which the health check reports.
+        try:
+            await self.redis.ping()
+        except RedisError:
+            logger.warning("redis is not available", exc_info=True)
+
+    async def close(self):
+        await self.storage.close()
+        await self.redis.close(close_connection_pool=True)
+
+    @property
+    def pool_stats(self):
+        pool = self.redis.connection_pool
+        # The pool queues idle connections, and a placeholder for every
+        # connection it has not opened yet.
+        idle = sum(connection is not None for connection in pool.pool._queue)
+
+        return {
+            "redis": {
+                "limit": pool.max_connections,
+                "in_use": len(pool._connections) - idle,
+                "idle": idle,
+            },
+            **self.storage.pool_stats,
+        }
+
     @property
     def content_bucket(self):
         return self.storage_url.path.strip("/")
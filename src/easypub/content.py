@@ -0,0 +1,233 @@
+import asyncio
+import itertools
+from typing import AsyncIterator, Optional
+
+from easypub import config, metrics
+from easypub.coalescing import SingleFlight
+from easypub.encoding import is_gzip
+
+# Metadata field holding the encoded content of publications small enough to be
+# kept in redis instead of S3.
+INLINE_FIELD = "content"
+
+# Metadata field holding the id of the upload stream entry with the content of
+# publications whose upload is still queued.
+PENDING_FIELD = "pending"
+
+UPLOAD_STREAM = "uploads"
+
+# Queue the upload of content and point the metadata at it in one step, so that
+# the metadata always points at content which exists. The metadata is created
+# only if the slug is not taken yet when reserving.
+ENQUEUE_SCRIPT = """
+if ARGV[1] == "reserve" and redis.call("exists", KEYS[1]) == 1 then
+    return false
+end
+
+local id = redis.call("xadd", KEYS[2], "*", "slug", ARGV[2], "content", ARGV[3])
+
+redis.call("hdel", KEYS[1], "content")
+redis.call("hset", KEYS[1], "pending", id, unpack(ARGV, 4))
+
+return id
+"""
+
+# Move content into or out of the metadata hash, unless the publication was
+# updated since the content was read.
+INLINE_SCRIPT = """
+if (redis.call("hget", KEYS[1], "etag") or "") ~= ARGV[1] then
+    return 0
+end
+
+if ARGV[2] == "" then
+    redis.call("hdel", KEYS[1], "content")
+else
+    redis.call("hset", KEYS[1], "content", ARGV[2])
+end
+
+return 1
+"""
+
+# Create the metadata hash only if the slug is not taken yet, in one round trip.
+RESERVE_SCRIPT = """
+if redis.call("exists", KEYS[1]) == 1 then
+    return 0
+end
+
+redis.call("hset", KEYS[1], unpack(ARGV))
+
+return 1
+"""
+
+# How long a worker fetching content for the others may hold the fetch, and how
+# long the fetched content is kept for them, in milliseconds.
+SHARED_FETCH_TIMEOUT = 5000
+SHARED_CONTENT_TTL = 5000
+
+metadata_flight = SingleFlight("metadata")
+object_flight = SingleFlight("content")
+
+
+def metadata_key(slug: str) -> str:
+    if not slug:
+        raise ValueError("slug must be a non-empty string")
+
+    return f"metadata:{slug}"
+
+
+def is_inline(metadata: dict[bytes, bytes]) -> bool:
+    return INLINE_FIELD.encode() in metadata
+
+
+def is_pending(metadata: dict[bytes, bytes]) -> bool:
+    return PENDING_FIELD.encode() in metadata
+
+
+def is_stored(metadata: dict[bytes, bytes]) -> bool:
+    """
+    Return whether the content of a publication is in the storage.
+    """
+    return not is_inline(metadata) and not is_pending(metadata)
+
+
+def should_inline(encoded_content: bytes) -> bool:
+    return 0 < len(encoded_content) <= config.inline_content_size
+
+
+async def reserve_metadata(slug: str, mapping: dict[str, str]) -> bool:
+    script = config.redis.register_script(RESERVE_SCRIPT)
+    args = list(itertools.chain.from_iterable(mapping.items()))
+    return bool(await script(keys=[metadata_key(slug)], args=args))
+
+
+async def enqueue_upload(
+    slug: str, encoded_content: bytes, mapping: dict[str, str], reserve: bool = False
+) -> Optional[bytes]:
+    """
+    Queue the upload of content for the worker and write mapping to the metadata
+    of slug along with the id of the queued entry, which is returned. Returns
+    None without queueing anything when reserving a slug which is taken.
+    """
+    script = config.redis.register_script(ENQUEUE_SCRIPT)
+    args = [
+        "reserve" if reserve else "",
+        slug,
+        encoded_content,
+        *itertools.chain.from_iterable(mapping.items()),
+    ]
+    return await script(keys=[metadata_key(slug), UPLOAD_STREAM], args=args)
+
+
+async def get_metadata(slug: str) -> dict[bytes, bytes]:
+    if config.coalesce_reads == "off":
+        return await config.redis.hgetall(metadata_key(slug))
+
+    return await metadata_flight(slug, config.redis.hgetall, metadata_key(slug))
+
+
+async def get_content(slug: str, metadata: dict[bytes, bytes]) -> bytes:
+    if is_inline(metadata):
+        return metadata[INLINE_FIELD.encode()]
+
+    if is_pending(metadata):
+        entry_id = metadata[PENDING_FIELD.encode()]
+        entries = await config.redis.xrange(UPLOAD_STREAM, entry_id, entry_id)
+
+        if entries:
+            return entries[0][1][b"content"]
+
+        # Uploaded since the metadata was read.
+
+    return await fetch_object(slug, metadata.get(b"etag", b"").decode())
+
+
+async def fetch_object(slug: str, etag: Optional[str] = None) -> bytes:
+    """
+    Get an object for a read, sharing the fetch with concurrent reads of the
+    same version of the slug in this worker, and in every worker if the etag
+    is known and reads are coalesced through redis.
+    """
+    if config.coalesce_reads == "off":
+        return await get_object(slug)
+
+    # A read which knows the etag never joins a fetch started for another
+    # version, which may have fetched the object before it was replaced.
+    key = (slug, etag or None)
+
+    if config.coalesce_reads == "redis" and etag:
+        return await object_flight(key, get_shared_object, slug, etag)
+
+    return await object_flight(key, get_object, slug)
+
+
+async def get_shared_object(slug: str, etag: str) -> bytes:
+    key = f"coalesce:{slug}:{etag}"
+    lock = f"{key}:lock"
+
+    if await config.redis.set(lock, 1, nx=True, px=SHARED_FETCH_TIMEOUT):
+        try:
+            encoded_content = await get_object(slug)
+            await config.redis.set(key, encoded_content, px=SHARED_CONTENT_TTL)
+            return encoded_content
+        finally:
+            await config.redis.delete(lock)
+
+    # Another worker is fetching the object, wait for it to share the content
+    # unless it gives up, in which case it is fetched after all.
+    delay = 0.005
+    while True:
+        encoded_content = await config.redis.get(key)
+        if encoded_content is not None:
+            metrics.coalesced_waiters.labels("content", "redis").inc()
+            return encoded_content
+
+        if not await config.redis.exists(lock):
+            return await get_object(slug)
+
+        await asyncio.sleep(delay)
+        delay = min(delay * 2, 0.1)
+
+
+async def get_object(slug: str) -> bytes:
+    return await config.storage.get(slug)
+
+
+def stream_object(slug: str) -> AsyncIterator[bytes]:
+    return config.storage.stream(slug)
+
+
+async def put_object(slug: str, encoded_content: bytes) -> None:
+    # Presigned urls hand gzip content straight to browsers, which cannot
+    # decode content compressed with a dictionary.
+    content_encoding = "gzip" if is_gzip(encoded_content) else None
+    await config.storage.put(slug, encoded_content, content_encoding)
+
+
+async def remove_object(slug: str) -> None:
+    await config.storage.delete(slug)
+
+
+async def move_inline(slug: str, etag: bytes, encoded_content: bytes) -> bool:
+    script = config.redis.register_script(INLINE_SCRIPT)
+    moved = await script(keys=[metadata_key(slug)], args=[etag, encoded_content])
+
+    if moved:
+        await remove_object(slug)
+
+    return bool(moved)
+
+
+async def move_to_object(slug: str, etag: bytes, encoded_content: bytes) -> bool:
+    await put_object(slug, encoded_content)
+
+    script = config.redis.register_script(INLINE_SCRIPT)
+    moved = await script(keys=[metadata_key(slug)], args=[etag, b""])
+
+    # The publication was updated while its content was uploaded. If it is still
+    # inline the upload is simply stale. If the update moved it to S3 as well,
+    # whichever upload finished last wins, so migrations are best run while
+    # publications are not being updated.
+    if not moved and is_inline(await config.redis.hgetall(metadata_key(slug))):
+        await remove_object(slug)
+
+    return bool(moved)
@@ -0,0 +1,17 @@
+from functools import cache
+
+
+@cache
+def get_crypt_context():
+    # Imported on first use, as only publishes, updates and deletes need it.
+    from passlib.context import CryptContext
+
+    return CryptContext(schemes=["bcrypt"], deprecated="auto")
+
+
+def hash_secret(secret: str) -> str:
+    return get_crypt_context().hash(secret)
+
+
+def verify_secret(secret: str, secret_hash: str) -> bool:
+    return get_crypt_context().verify(secret, secret_hash)
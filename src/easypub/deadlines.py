@@ -0,0 +1,37 @@
+import asyncio
+from contextvars import ContextVar
+from typing import Awaitable, Optional, TypeVar
+
+T = TypeVar("T")
+
+# Event loop time by which the current request has to be answered.
+deadline: ContextVar[Optional[float]] = ContextVar("deadline", default=None)
+
+
+def remaining() -> Optional[float]:
+    """
+    Return the seconds left until the deadline of the current request, or None
+    outside of a request.
+    """
+    current = deadline.get()
+    if current is None:
+        return None
+
+    return current - asyncio.get_running_loop().time()
+
+
+async def wait(awaitable: Awaitable[T]) -> T:
+    """
+    Await awaitable, but raise asyncio.TimeoutError once the deadline of the
+    current request has passed.
+    """
+    timeout = remaining()
+    if timeout is None:
+        return await awaitable
+
+    if timeout <= 0:
+        if asyncio.iscoroutine(awaitable):
+            awaitable.close()
+        raise asyncio.TimeoutError
+
+    return await asyncio.wait_for(awaitable, timeout)
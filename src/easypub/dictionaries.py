@@ -0,0 +1,190 @@
+"""
+Store content compressed with zstd and a dictionary trained on existing
+publications, which share most of their markup.
+
+Dictionaries are kept in redis by the id zstd assigned them when they were
+trained, and never change. Publications record the codec and the id of the
+dictionary their content was compressed with. Content is decoded by what it
+is rather than by its metadata though, since zstd frames carry the id of their
+dictionary, so content written before or with another dictionary stays
+readable, even while an update has replaced the content but not the metadata.
+"""
+
+import gzip
+from typing import AsyncIterable, AsyncIterator
+
+from easypub import config, encoding, metrics
+from easypub.content import get_content
+from easypub.storage import ObjectNotFound
+
+DICTIONARY_CODEC = "zstd+dict"
+
+ZSTD_MAGIC = b"\x28\xb5\x2f\xfd"
+
+# Content is compressed once and read many times, trade some time for size.
+LEVEL = 9
+
+# The default dictionary size of the zstd cli.
+DEFAULT_SIZE = 112_640
+
+_compressors: dict = {}
+_decompressors: dict = {}
+
+
+def dictionary_key(dictionary_id: str) -> str:
+    return f"dictionary:{dictionary_id}"
+
+
+def is_spliceable(metadata: dict[bytes, bytes]) -> bool:
+    return metadata.get(b"codec") == encoding.SPLICEABLE_CODEC.encode()
+
+
+def uses_dictionary(metadata: dict[bytes, bytes]) -> bool:
+    return metadata.get(b"codec") == DICTIONARY_CODEC.encode()
+
+
+async def _load(dictionary_id: str):
+    import zstandard
+
+    data = await config.redis.get(dictionary_key(dictionary_id))
+    if data is None:
+        raise LookupError(f"dictionary {dictionary_id} does not exist")
+
+    return zstandard.ZstdCompressionDict(data)
+
+
+async def get_compressor(dictionary_id: str):
+    if dictionary_id not in _compressors:
+        import zstandard
+
+        dictionary = await _load(dictionary_id)
+        _compressors[dictionary_id] = zstandard.ZstdCompressor(
+            level=LEVEL, dict_data=dictionary
+        )
+
+    return _compressors[dictionary_id]
+
+
+async def get_decompressor(dictionary_id: str):
+    if dictionary_id not in _decompressors:
+        import zstandard
+
+        dictionary = await _load(dictionary_id)
+        _decompressors[dictionary_id] = zstandard.ZstdDecompressor(dict_data=dictionary)
+
+    return _decompressors[dictionary_id]
+
+
+async def encode_content(content: bytes) -> tuple[bytes, dict[str, str]]:
+    """
+    Compress content for storage with the dictionary set by STORAGE_DICTIONARY,
+    or as a spliceable gzip member without one, and return it along with the
+    metadata fields which describe how it was compressed.
+    """
+    dictionary_id = config.storage_dictionary
+
+    if not dictionary_id:
+        with metrics.timed("gzip", "compress"):
+            return encoding.compress(content), {"codec": encoding.SPLICEABLE_CODEC}
+
+    compressor = await get_compressor(dictionary_id)
+
+    with metrics.timed("zstd", "compress"):
+        encoded_content = compressor.compress(content)
+
+    return encoded_content, {"codec": DICTIONARY_CODEC, "dictionary": dictionary_id}
+
+
+async def _decompressor_for(encoded_content: bytes):
+    import zstandard
+
+    frame = zstandard.get_frame_parameters(encoded_content)
+    return await get_decompressor(str(frame.dict_id))
+
+
+async def decode_content(encoded_content: bytes) -> bytes:
+    if encoded_content[:4] != ZSTD_MAGIC:
+        return gzip.decompress(encoded_content)
+
+    decompressor = await _decompressor_for(encoded_content)
+
+    with metrics.timed("zstd", "decompress"):
+        return decompressor.decompress(encoded_content)
+
+
+async def decode_stream(encoded_content: AsyncIterable[bytes]) -> AsyncIterator[bytes]:
+    chunks = encoded_content.__aiter__()
+    head = b""
+
+    # Enough of the first frame to tell the codec and dictionary apart.
+    async for chunk in chunks:
+        head += chunk
+        if len(head) >= 18:
+            break
+
+    async def replay():
+        yield head
+        async for chunk in chunks:
+            yield chunk
+
+    if head[:4] != ZSTD_MAGIC:
+        async for data in encoding.decompress_stream(replay()):
+            yield data
+        return
+
+    stream = (await _decompressor_for(head)).decompressobj()
+
+    async for chunk in replay():
+        if data := stream.decompress(chunk):
+            yield data
+
+
+async def collect_samples(count: int, max_size: int = 65_536) -> list[bytes]:
+    """
+    Decode the content of up to count publications to train a dictionary on,
+    keeping the first max_size bytes of each.
+    """
+    samples: list[bytes] = []
+    cursor = None
+
+    while cursor != 0 and len(samples) < count:
+        cursor, keys = await config.redis.scan(
+            cursor or 0, match="metadata:*", count=1000
+        )
+
+        for key in keys[: count - len(samples)]:
+            metadata = await config.redis.hgetall(key)
+            if not metadata:
+                continue
+
+            slug = key.decode().removeprefix("metadata:")
+            try:
+                encoded_content = await get_content(slug, metadata)
+            except ObjectNotFound:
+                continue
+
+            content = await decode_content(encoded_content)
+            samples.append(content[:max_size])
+
+    return samples
+
+
+def train(samples: list[bytes], size: int = DEFAULT_SIZE) -> bytes:
+    import zstandard
+
+    return zstandard.train_dictionary(size, samples, level=LEVEL).as_bytes()
+
+
+async def store_dictionary(data: bytes) -> str:
+    """
+    Save a trained dictionary and return its id.
+    """
+    import zstandard
+
+    dictionary_id = str(zstandard.ZstdCompressionDict(data).dict_id())
+
+    if not await config.redis.set(dictionary_key(dictionary_id), data, nx=True):
+        if await config.redis.get(dictionary_key(dictionary_id)) != data:
+            raise ValueError(f"another dictionary with id {dictionary_id} exists")
+
+    return dictionary_id
@@ -0,0 +1,269 @@
+import struct
+import zlib
+from functools import cache
+from typing import AsyncIterable, AsyncIterator, Optional, Sequence
+
+GZIP_HEADER = b"\x1f\x8b\x08\x00\x00\x00\x00\x00\x00\xff"
+
+# Magic number, deflate method and no optional header fields.
+MEMBER_PREFIX = b"\x1f\x8b\x08\x00"
+
+# An empty, final, fixed huffman deflate block.
+FINAL_BLOCK = b"\x03\x00"
+
+SPLICEABLE_CODEC = "gzip+flush"
+
+# Levels which compress responses well without costing much time per request.
+DEFAULT_LEVELS = {"br": 4, "zstd": 3, "gzip": 6}
+
+
+def negotiate(accept_encoding: str, available: Sequence[str]) -> Optional[str]:
+    """
+    Return the first of the available content codings, in order of preference,
+    which an Accept-Encoding header allows, or None if it allows none of them.
+    """
+    allowed = {}
+
+    for entry in accept_encoding.lower().split(","):
+        coding, _, params = entry.partition(";")
+        quality = 1.0
+
+        for param in params.split(";"):
+            name, _, value = param.strip().partition("=")
+            if name == "q":
+                try:
+                    quality = float(value)
+                except ValueError:
+                    quality = 0.0
+
+        if coding.strip():
+            allowed[coding.strip()] = quality
+
+    for coding in available:
+        if allowed.get(coding, allowed.get("*", 0.0)) > 0:
+            return coding
+
+    return None
+
+
+class GzipCompressor:
+    def __init__(self, level: Optional[int] = None):
+        level = DEFAULT_LEVELS["gzip"] if level is None else level
+        self.compressor = zlib.compressobj(level, zlib.DEFLATED, 31)
+
+    def compress(self, data: bytes) -> bytes:
+        return self.compressor.compress(data)
+
+    def flush(self) -> bytes:
+        return self.compressor.flush(zlib.Z_SYNC_FLUSH)
+
+    def finish(self) -> bytes:
+        return self.compressor.flush(zlib.Z_FINISH)
+
+
+class BrotliCompressor:
+    def __init__(self, level: Optional[int] = None):
+        import brotli
+
+        level = DEFAULT_LEVELS["br"] if level is None else level
+        self.compressor = brotli.Compressor(quality=level)
+
+    def compress(self, data: bytes) -> bytes:
+        return self.compressor.process(data)
+
+    def flush(self) -> bytes:
+        return self.compressor.flush()
+
+    def finish(self) -> bytes:
+        return self.compressor.finish()
+
+
+class ZstdCompressor:
+    def __init__(self, level: Optional[int] = None):
+        import zstandard
+
+        level = DEFAULT_LEVELS["zstd"] if level is None else level
+        self.flush_block = zstandard.COMPRESSOBJ_FLUSH_BLOCK
+        self.compressor = zstandard.ZstdCompressor(level=level).compressobj()
+
+    def compress(self, data: bytes) -> bytes:
+        return self.compressor.compress(data)
+
+    def flush(self) -> bytes:
+        return self.compressor.flush(self.flush_block)
+
+    def finish(self) -> bytes:
+        return self.compressor.flush()
+
+
+# Incremental compressors by content coding. Each compresses chunks of a body,
+# can flush what it has so far so that a stream can be sent as it is produced,
+# and finishes the body.
+COMPRESSORS = {
+    "br": BrotliCompressor,
+    "zstd": ZstdCompressor,
+    "gzip": GzipCompressor,
+}
+
+
+def compress_as(coding: str, data: bytes, level: Optional[int] = None) -> bytes:
+    compressor = COMPRESSORS[coding](level)
+    return compressor.compress(data) + compressor.finish()
+
+
+def is_gzip(data: bytes) -> bool:
+    return data[:2] == GZIP_HEADER[:2]
+
+
+def compress(data: bytes, level: int = 9) -> bytes:
+    """
+    Gzip compress data into a single member whose deflate stream is flushed to a
+    byte boundary before being terminated by an empty final block.
+
+    The result is plain gzip to any reader, but the body of the member can be
+    spliced between other deflate streams by splice without recompressing it.
+    """
+    compressor = zlib.compressobj(level, zlib.DEFLATED, 31)
+    return (
+        compressor.compress(data)
+        + compressor.flush(zlib.Z_SYNC_FLUSH)
+        + compressor.flush(zlib.Z_FINISH)
+    )
+
+
+def can_splice(member: bytes) -> bool:
+    """
+    Return whether member is a gzip member written by compress.
+    """
+    return member[:4] == MEMBER_PREFIX and member[-10:-8] == FINAL_BLOCK
+
+
+def splice(head: bytes, member: bytes, foot: bytes, level: int = 6) -> bytes:
+    """
+    Build a single gzip member containing head, the content of member and foot.
+
+    Only head and foot are compressed, the deflate stream of member is copied
+    as-is and its checksum is combined with theirs.
+    """
+    if not can_splice(member):
+        raise ValueError("member was not produced by compress")
+
+    return (
+        _splice_head(head, level)
+        + member[10:-10]
+        + _splice_foot(head, member[-8:], foot, level)
+    )
+
+
+async def splice_stream(
+    head: bytes, member: AsyncIterable[bytes], foot: bytes, level: int = 6
+) -> AsyncIterator[bytes]:
+    """
+    Like splice, but copies the deflate stream of member chunk by chunk. Only
+    the last ten bytes, the final block and trailer, are held back.
+    """
+    yield _splice_head(head, level)
+
+    prefix = b""
+    tail = b""
+
+    async for chunk in member:
+        if len(prefix) < 10:
+            missing = 10 - len(prefix)
+            prefix, chunk = prefix + chunk[:missing], chunk[missing:]
+
+        data = tail + chunk
+        tail = data[-10:]
+
+        if data[:-10]:
+            yield data[:-10]
+
+    if prefix[:4] != MEMBER_PREFIX or tail[:2] != FINAL_BLOCK:
+        raise ValueError("member was not produced by compress")
+
+    yield _splice_foot(head, tail[2:], foot, level)
+
+
+def _splice_head(head: bytes, level: int) -> bytes:
+    compressor = zlib.compressobj(level, zlib.DEFLATED, -zlib.MAX_WBITS)
+    return GZIP_HEADER + compressor.compress(head) + compressor.flush(zlib.Z_SYNC_FLUSH)
+
+
+def _splice_foot(head: bytes, trailer: bytes, foot: bytes, level: int) -> bytes:
+    crc, size = struct.unpack("<II", trailer)
+
+    compressor = zlib.compressobj(level, zlib.DEFLATED, -zlib.MAX_WBITS)
+    foot_stream = compressor.compress(foot) + compressor.flush(zlib.Z_FINISH)
+
+    crc = crc32_combine(zlib.crc32(head), crc, size)
+    crc = crc32_combine(crc, zlib.crc32(foot), len(foot))
+    size = (len(head) + size + len(foot)) & 0xFFFFFFFF
+
+    return foot_stream + struct.pack("<II", crc, size)
+
+
+async def decompress_stream(
+    member: AsyncIterable[bytes], chunk_size: int = 65536
+) -> AsyncIterator[bytes]:
+    """
+    Decompress a gzip stream into chunks of at most chunk_size bytes, however
+    well the input compresses.
+    """
+    decompressor = zlib.decompressobj(16 + zlib.MAX_WBITS)
+
+    async for chunk in member:
+        while chunk:
+            if data := decompressor.decompress(chunk, chunk_size):
+                yield data
+            chunk = decompressor.unconsumed_tail
+
+    if data := decompressor.flush():
+        yield data
+
+
+def _gf2_multiply(matrix: tuple[int, ...], vector: int) -> int:
+    result = 0
+    index = 0
+
+    while vector:
+        if vector & 1:
+            result ^= matrix[index]
+        vector >>= 1
+        index += 1
+
+    return result
+
+
+def _gf2_square(matrix: tuple[int, ...]) -> tuple[int, ...]:
+    return tuple(_gf2_multiply(matrix, row) for row in matrix)
+
+
+@cache
+def _zeros_operator(power: int) -> tuple[int, ...]:
+    """
+    Return the operator which appends 2**power zero bytes to a crc32.
+    """
+    if power == 0:
+        # The operator for a single zero bit, squared three times.
+        matrix = (0xEDB88320,) + tuple(1 << n for n in range(31))
+        for _ in range(3):
+            matrix = _gf2_square(matrix)
+        return matrix
+
+    return _gf2_square(_zeros_operator(power - 1))
+
+
+def crc32_combine(crc1: int, crc2: int, length2: int) -> int:
+    """
+    Return the crc32 of two concatenated byte strings given the crc32 of each
+    and the length of the second, like zlib's crc32_combine.
+    """
+    power = 0
+
+    while length2:
+        if length2 & 1:
+            crc1 = _gf2_multiply(_zeros_operator(power), crc1)
+        length2 >>= 1
+        power += 1
+
+    return crc1 ^ crc2
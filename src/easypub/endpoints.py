@@ -1,39 +1,113 @@
-import gzip
-import io
+import asyncio
+import hashlib
+import os
 import secrets
+import time
 from http import HTTPStatus
 
-from passlib.context import CryptContext
 from pydantic import BaseModel, SecretStr
 from slugify import slugify
 
 from starlette.endpoints import HTTPEndpoint
 from starlette.exceptions import HTTPException
-from starlette.responses import JSONResponse
-
-from easypub import config
+from starlette.responses import HTMLResponse, JSONResponse, Response
+
+from easypub import config, encoding, metrics
+from easypub.caching import build_validators, is_not_modified
+from easypub.content import (
+    INLINE_FIELD,
+    PENDING_FIELD,
+    enqueue_upload,
+    fetch_object,
+    get_content,
+    get_metadata,
+    is_inline,
+    is_stored,
+    metadata_key,
+    put_object,
+    remove_object,
+    reserve_metadata,
+    should_inline,
+    stream_object,
+)
+from easypub.crypto import hash_secret, verify_secret
 from easypub.decorators import cache_control
-from easypub.fields import SafeHTML, Title
-
-crypt_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
+from easypub.dictionaries import (
+    decode_content,
+    encode_content,
+    is_spliceable,
+    uses_dictionary,
+)
+from easypub.fields import HTML, Title, sanitize
+from easypub.pages import (
+    accepts_gzip,
+    cache_page,
+    generations,
+    invalidate_page,
+    page_response,
+    render_compressed,
+    render_page,
+    stream_page,
+)
+from easypub.staticfiles import SendfileResponse
+from easypub.stats import counters
 
 limiter = config.limiter
 
 
-def generate_post_creds() -> tuple[str, str]:
+async def generate_post_creds() -> tuple[str, str]:
     secret = secrets.token_urlsafe()
-    return secret, crypt_context.hash(secret)
 
+    # Timed around the pool, so that waiting for a free worker is included.
+    with metrics.timed("bcrypt", "hash"):
+        return secret, await config.crypt_executor.run(hash_secret, secret)
+
+
+async def verify_crypt_hash(secret: str, secret_hash: str) -> bool:
+    with metrics.timed("bcrypt", "verify"):
+        return await config.crypt_executor.run(verify_secret, secret, secret_hash)
+
+
+def discard_speculation(task: asyncio.Task) -> None:
+    counters["speculative_reads_wasted"] += 1
+    task.cancel()
+
+    # Retrieve the error of a fetch which already failed, like a missing object,
+    # so that it is not reported as never retrieved.
+    task.add_done_callback(lambda t: t.cancelled() or t.exception())
+
+
+def content_metadata(encoded_content: bytes) -> dict[str, str]:
+    return {
+        "codec": encoding.SPLICEABLE_CODEC,
+        "etag": hashlib.sha256(encoded_content).hexdigest(),
+        "modified": str(int(time.time())),
+        "size": str(len(encoded_content)),
+    }
+
+
+def metadata_validators(
+    result: dict[bytes, bytes], rotation: int = 0
+) -> dict[str, str]:
+    etag = result.get(b"etag", b"").decode()
+    modified = int(result.get(b"modified", 0))
 
-def verify_crypt_hash(secret: str, secret_hash: str) -> bool:
-    return crypt_context.verify(secret, secret_hash)
+    # Pages change with the templates and static files of a deploy as well.
+    etag = etag and f"{etag}-{config.build_version}"
+    modified = modified and max(modified, config.build_modified)
 
+    # Pages which embed expiring data roll their validators over every rotation
+    # seconds, so a revalidated page is never older than that.
+    if rotation:
+        epoch = int(time.time()) // rotation * rotation
+        etag = etag and f"{etag}-{epoch}"
+        modified = modified and max(modified, epoch)
 
-def metadata_key(slug: str) -> str:
-    if not slug:
-        raise ValueError("slug must be a non-empty string")
+    return build_validators(etag=etag, modified=modified)
 
-    return f"metadata:{slug}"
+
+def not_modified(validators: dict[str, str]) -> Response:
+    return Response(status_code=HTTPStatus.NOT_MODIFIED, headers=validators)
 
 
 class HomeEndpoint(HTTPEndpoint):
@@ -48,22 +122,80 @@ class ReadEndpoint(HTTPEndpoint):
     async def get(self, request):
         slug = request.path_params["slug"]
 
-        result = await config.redis.hgetall(metadata_key(slug))
-        if not result:
-            raise HTTPException(HTTPStatus.NOT_FOUND)
+        cached = config.page_cache.get(slug)
+        if cached is not None:
+            page, validators = cached
 
-        async with await config.s3.get_object(config.content_bucket, slug) as response:
-            content = await response.text()
+            if is_not_modified(request.headers, validators):
+                return not_modified(validators)
 
-        return config.templates.TemplateResponse(
-            "read.html",
-            {
-                "content": content,
-                "request": request,
-                "slug": slug,
-                "title": result[b"title"].decode(),
-            },
-        )
+            return page_response(request, page, validators, fill=True)
+
+        generation = generations.current
+
+        # Most requested slugs exist, so the content can optionally be fetched
+        # while the metadata is looked up and dropped when it turns out unused.
+        speculation = None
+        if config.speculative_reads:
+            counters["speculative_reads"] += 1
+            speculation = asyncio.create_task(fetch_object(slug))
+
+        try:
+            result = await get_metadata(slug)
+            if not result:
+                raise HTTPException(HTTPStatus.NOT_FOUND)
+        except BaseException:
+            if speculation is not None:
+                discard_speculation(speculation)
+            raise
+
+        validators = metadata_validators(result)
+        if is_not_modified(request.headers, validators):
+            if speculation is not None:
+                discard_speculation(speculation)
+            return not_modified(validators)
+
+        title = result[b"title"].decode()
+
+        # Only content written by encoding.compress can be spliced into the page,
+        # anything else is decoded and rendered as a regular template.
+        spliceable = is_spliceable(result)
+
+        # Large objects are streamed into the page instead of being loaded.
+        size = int(result.get(b"size", 0))
+        if 0 < config.stream_threshold < size and is_stored(result):
+            if speculation is not None:
+                discard_speculation(speculation)
+
+            return await stream_page(
+                request, slug, title, stream_object(slug), spliceable, validators
+            )
+
+        if speculation is None:
+            content = await get_content(slug, result)
+        elif not is_stored(result):
+            discard_speculation(speculation)
+            content = await get_content(slug, result)
+        else:
+            content = await speculation
+
+            # Fetched before the metadata was read, it may be the object the
+            # publication had before an update.
+            etag = result.get(b"etag", b"").decode()
+            if etag and hashlib.sha256(content).hexdigest() != etag:
+                content = await get_content(slug, result)
+
+        # Checked against the content as well, which an update replaces before
+        # the metadata saying how it was compressed.
+        if spliceable and encoding.can_splice(content):
+            page = {"gzip": render_page(request, slug, title, content)}
+        else:
+            content = await decode_content(content)
+            page = {"gzip": render_compressed(request, slug, title, content)}
+
+        cache_page(slug, page, validators, generation)
+
+        return page_response(request, page, validators)
 
 
 class AdminEndpoint(HTTPEndpoint):
@@ -72,15 +204,25 @@ class AdminEndpoint(HTTPEndpoint):
     async def get(self, request):
         slug = request.path_params["slug"]
 
-        result = await config.redis.hgetall(metadata_key(slug))
+        result = await get_metadata(slug)
         if not result:
             raise HTTPException(HTTPStatus.NOT_FOUND)
 
-        content_url = await config.s3.get_presigned_url(
-            "GET",
-            config.content_bucket,
-            slug,
-        )
+        # The presigned content url is valid for a week, rotate the validators
+        # daily so revalidated pages never hold an expired url.
+        validators = metadata_validators(result, rotation=86400)
+        if is_not_modified(request.headers, validators):
+            return not_modified(validators)
+
+        content_url = None
+
+        # Browsers cannot decode dictionary compressed content on their own.
+        if is_stored(result) and not uses_dictionary(result):
+            content_url = await config.storage.presign(slug)
+
+        # Served by the app when it cannot be fetched from the storage directly.
+        if content_url is None:
+            content_url = request.url_for("content", slug=slug)
 
         return config.templates.TemplateResponse(
             "admin.html",
@@ -90,42 +232,57 @@ class AdminEndpoint(HTTPEndpoint):
                 "slug": slug,
                 "title": result[b"title"].decode(),
             },
+            headers=validators,
         )
 
 
 class PublishEndpoint(HTTPEndpoint):
     class Form(BaseModel):
         title: Title
-        content: SafeHTML
+        content: HTML
 
     @limiter.limit("60/hour")
     @cache_control(no_store=True)
     async def post(self, request):
         form = self.Form.parse_obj(await request.json())
         slug = slugify(form.title)
-
-        if await config.redis.exists(metadata_key(slug)):
+        content = await sanitize(form.content)
+
+        secret, secret_hash = await generate_post_creds()
+        encoded_content, codec = await encode_content(content.encode())
+        inline = should_inline(encoded_content)
+
+        mapping = {
+            "secret_hash": secret_hash,
+            "title": form.title,
+            **content_metadata(encoded_content),
+            **codec,
+        }
+        if inline:
+            mapping[INLINE_FIELD] = encoded_content
+
+        # Queued content is uploaded by the worker after the response is sent.
+        queued = not inline and config.write_behind
+
+        if queued:
+            reserved = await enqueue_upload(slug, encoded_content, mapping, True)
+        else:
+            reserved = await reserve_metadata(slug, mapping)
+
+        if not reserved:
             return JSONResponse(
                 {"title": ["is already being used"]},
                 status_code=HTTPStatus.UNPROCESSABLE_ENTITY,
             )
 
-        secret, secret_hash = generate_post_creds()
-
-        await config.redis.hset(
-            metadata_key(slug),
-            mapping={"secret_hash": secret_hash, "title": form.title},
-        )
-
-        encoded_content = gzip.compress(form.content.encode())
-        await config.s3.put_object(
-            config.content_bucket,
-            slug,
-            io.BytesIO(encoded_content),
-            len(encoded_content),
-            content_type="text/html",
-            metadata={"content-encoding": "gzip"},
-        )
+        try:
+            if not inline and not queued:
+                await put_object(slug, encoded_content)
+        except BaseException:
+            # Release the slug when the upload fails or the request times out,
+            # otherwise it would stay reserved without any content.
+            await config.redis.delete(metadata_key(slug))
+            raise
 
         return JSONResponse(
             dict(
@@ -138,7 +295,7 @@ class PublishEndpoint(HTTPEndpoint):
 class UpdateEndpoint(HTTPEndpoint):
     class Form(BaseModel):
         secret: SecretStr
-        content: SafeHTML
+        content: HTML
 
     @limiter.limit("60/hour")
     @cache_control(no_store=True)
@@ -150,7 +307,7 @@ class UpdateEndpoint(HTTPEndpoint):
         if not result:
             raise HTTPException(HTTPStatus.NOT_FOUND)
 
-        if not verify_crypt_hash(
+        if not await verify_crypt_hash(
             form.secret.get_secret_value(), result[b"secret_hash"].decode()
         ):
             return JSONResponse(
@@ -158,15 +315,40 @@ class UpdateEndpoint(HTTPEndpoint):
                 status_code=HTTPStatus.UNPROCESSABLE_ENTITY,
             )
 
-        encoded_content = gzip.compress(form.content.encode())
-        await config.s3.put_object(
-            config.content_bucket,
-            slug,
-            io.BytesIO(encoded_content),
-            len(encoded_content),
-            content_type="text/html",
-            metadata={"content-encoding": "gzip"},
-        )
+        content = await sanitize(form.content)
+        encoded_content, codec = await encode_content(content.encode())
+
+        mapping = {**content_metadata(encoded_content), **codec}
+
+        # Metadata always points at content which exists, so the new location
+        # is written before the previous one is cleared.
+        if should_inline(encoded_content):
+            mapping[INLINE_FIELD] = encoded_content
+            await config.redis.hset(metadata_key(slug), mapping=mapping)
+
+            if not is_inline(result):
+                await remove_object(slug)
+        elif config.write_behind:
+            entry_id = await enqueue_upload(slug, encoded_content, mapping)
+            mapping[PENDING_FIELD] = entry_id
+        else:
+            await put_object(slug, encoded_content)
+
+            if is_inline(result):
+                await config.redis.hdel(metadata_key(slug), INLINE_FIELD)
+
+            await config.redis.hset(metadata_key(slug), mapping=mapping)
+
+        # Fields of the previous content which do not apply to the new one.
+        stale = [
+            field
+            for field in [PENDING_FIELD, "dictionary"]
+            if field.encode() in result and field not in mapping
+        ]
+        if stale:
+            await config.redis.hdel(metadata_key(slug), *stale)
+
+        await invalidate_page(slug)
 
         return JSONResponse(dict(url=request.url_for("read", slug=slug)))
 
@@ -185,7 +367,7 @@ class DeleteEndpoint(HTTPEndpoint):
         if not result:
             raise HTTPException(HTTPStatus.NOT_FOUND)
 
-        if not verify_crypt_hash(
+        if not await verify_crypt_hash(
             form.secret.get_secret_value(), result[b"secret_hash"].decode()
         ):
             return JSONResponse(
@@ -194,11 +376,47 @@ class DeleteEndpoint(HTTPEndpoint):
             )
 
         await config.redis.delete(metadata_key(slug))
-        await config.s3.remove_object(config.content_bucket, slug)
+
+        if not is_inline(result):
+            await remove_object(slug)
+
+        await invalidate_page(slug)
 
         return JSONResponse({}, status_code=200)
 
 
+class ContentEndpoint(HTTPEndpoint):
+    @limiter.limit("10/minute")
+    @cache_control(no_store=True)
+    async def get(self, request):
+        slug = request.path_params["slug"]
+
+        result = await get_metadata(slug)
+        if not result:
+            raise HTTPException(HTTPStatus.NOT_FOUND)
+
+        headers = {"Content-Encoding": "gzip", "Vary": "Accept-Encoding"}
+
+        # Files of the local storage are handed to the server as they are.
+        path = config.storage.local_path(slug) if is_stored(result) else None
+        if path and accepts_gzip(request) and not uses_dictionary(result):
+            try:
+                stat_result = os.stat(path)
+            except FileNotFoundError:
+                raise HTTPException(HTTPStatus.NOT_FOUND)
+
+            return SendfileResponse(
+                path, stat_result=stat_result, media_type="text/html", headers=headers
+            )
+
+        content = await get_content(slug, result)
+
+        if not encoding.is_gzip(content) or not accepts_gzip(request):
+            return HTMLResponse(await decode_content(content))
+
+        return Response(content, media_type="text/html", headers=headers)
+
+
 class HealthEndpoint(HTTPEndpoint):
     @limiter.limit("20/minute")
     @cache_control(no_store=True)
@@ -211,8 +429,29 @@ class HealthEndpoint(HTTPEndpoint):
             pass
 
         try:
-            data["s3"] = await config.s3.bucket_exists(config.content_bucket)
+            data["s3"] = await config.storage.available()
         except Exception:
             pass
 
         return JSONResponse(data)
+
+
+class StatsEndpoint(HTTPEndpoint):
+    @limiter.limit("20/minute")
+    @cache_control(no_store=True)
+    async def get(self, request):
+        return JSONResponse(
+            {
+                "counters": dict(counters),
+                "page_cache": config.page_cache.stats,
+                "pools": config.pool_stats,
+            }
+        )
+
+
+class MetricsEndpoint(HTTPEndpoint):
+    @limiter.limit("60/minute")
+    @cache_control(no_store=True)
+    async def get(self, request):
+        body, media_type = metrics.collect()
+        return Response(body, headers={"Content-Type": media_type})
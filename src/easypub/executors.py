@@ -0,0 +1,73 @@
+import asyncio
+import functools
+import multiprocessing
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor
+from typing import Any, Callable, Optional
+
+EXECUTOR_CLASSES = {"thread": ThreadPoolExecutor, "process": ProcessPoolExecutor}
+
+
+class Saturated(Exception):
+    pass
+
+
+class BoundedExecutor:
+    """
+    Run blocking functions off the event loop in a pool of threads or processes.
+
+    At most max_pending calls may be running or queued at once, further calls
+    raise Saturated instead of queueing behind work the client will likely time
+    out on. A pool with zero workers runs each call inline.
+    """
+
+    def __init__(self, kind: str, workers: int, max_pending: int):
+        if kind not in EXECUTOR_CLASSES:
+            raise ValueError(
+                f'invalid executor "{kind}", must be in {", ".join(EXECUTOR_CLASSES)}'
+            )
+
+        self.kind = kind
+        self.workers = workers
+        self.max_pending = max_pending
+        self.pending = 0
+        self._executor: Optional[Executor] = None
+
+    @property
+    def executor(self) -> Executor:
+        if self._executor is None:
+            if self.kind == "process":
+                # Forking the threaded server could copy locks held by other
+                # threads into the workers, so they start from a clean process.
+                self._executor = ProcessPoolExecutor(
+                    max_workers=self.workers,
+                    mp_context=multiprocessing.get_context("forkserver"),
+                )
+            else:
+                self._executor = ThreadPoolExecutor(max_workers=self.workers)
+
+        return self._executor
+
+    async def run(self, func: Callable[..., Any], *args: Any, **kwargs: Any) -> Any:
+        if self.workers <= 0:
+            return func(*args, **kwargs)
+
+        if self.pending >= self.max_pending:
+            raise Saturated(f"{self.kind} pool has {self.pending} pending calls")
+
+        loop = asyncio.get_running_loop()
+        future = self.executor.submit(functools.partial(func, *args, **kwargs))
+        self.pending += 1
+
+        # Count the call until the pool is done with it, a cancelled caller
+        # does not stop a call which is running already.
+        future.add_done_callback(lambda _: loop.call_soon_threadsafe(self._release))
+
+        return await asyncio.wrap_future(future, loop=loop)
+
+    def _release(self) -> None:
+        self.pending -= 1
+
+    def shutdown(self) -> None:
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
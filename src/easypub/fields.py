@@ -1,4 +1,10 @@
-import bleach
+import logging
+import time
+
+import easypub
+from easypub import metrics
+
+logger = logging.getLogger(__name__)
 
 
 class Title(str):
@@ -25,8 +31,34 @@ class Title(str):
         return f"Title({super().__repr__()})"
 
 
+class HTML(str):
+    """
+    Unsanitized html which is no longer than the configured maximum content
+    length. Use sanitize to turn it into SafeHTML.
+    """
+
+    @classmethod
+    def __get_validators__(cls):
+        yield cls.validate
+
+    @classmethod
+    def validate(cls, v):
+        if not isinstance(v, str):
+            raise TypeError("must be a string")
+
+        if len(v) > easypub.config.max_content_length:
+            raise ValueError(
+                f"length must be less than {easypub.config.max_content_length}"
+            )
+
+        return cls(v)
+
+    def __repr__(self):
+        return f"HTML({super().__repr__()})"
+
+
 class SafeHTML(str):
-    ALLOWED_TAGS = bleach.ALLOWED_TAGS + ["h1", "h2", "h3", "p", "br", "u"]
+    EXTRA_TAGS = ["h1", "h2", "h3", "p", "br", "u"]
 
     @classmethod
     def __get_validators__(cls):
@@ -37,9 +69,36 @@ class SafeHTML(str):
         if not isinstance(v, str):
             raise TypeError("must be a string")
 
-        return cls(
-            bleach.clean(v, strip=True, strip_comments=True, tags=cls.ALLOWED_TAGS)
-        )
+        return cls(clean(v))
 
     def __repr__(self):
         return f"SafeHTML({super().__repr__()})"
+
+
+def clean(v: str) -> str:
+    # Imported on first use, as only publishes and updates need it.
+    import bleach
+
+    tags = bleach.ALLOWED_TAGS + SafeHTML.EXTRA_TAGS
+    return bleach.clean(v, strip=True, strip_comments=True, tags=tags)
+
+
+async def sanitize(v: HTML) -> SafeHTML:
+    """
+    Sanitize html on the event loop, or in the sanitize process pool when it
+    is larger than the configured threshold.
+    """
+    start = time.perf_counter()
+
+    if len(v) < easypub.config.sanitize_threshold:
+        mode = "inline"
+        result = clean(v)
+    else:
+        mode = "pool"
+        result = await easypub.config.sanitize_executor.run(clean, str(v))
+
+    elapsed = time.perf_counter() - start
+    metrics.observe("bleach", mode, elapsed)
+    logger.debug("sanitized %d characters %s in %.2fms", len(v), mode, elapsed * 1000)
+
+    return SafeHTML(result)
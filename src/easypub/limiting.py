@@ -0,0 +1,181 @@
+import logging
+import threading
+import time
+from dataclasses import dataclass
+from typing import Optional
+
+import redis
+import slowapi
+from limits.storage import Storage
+
+from easypub import metrics
+
+logger = logging.getLogger(__name__)
+
+
+class Limiter(slowapi.Limiter):
+    """
+    Limiter which records the time spent checking the rate limits of a request.
+    """
+
+    def _check_request_limit(self, *args, **kwargs):
+        with metrics.timed("limiter", "check"):
+            return super()._check_request_limit(*args, **kwargs)
+
+
+@dataclass
+class Window:
+    expiry: int
+    expires_at: float
+    # Hits counted by every worker as of the last sync, and hits counted by
+    # this one since.
+    synced: int = 0
+    pending: int = 0
+    # When the count of every worker was last taken over.
+    refreshed_at: float = 0
+
+    @property
+    def count(self) -> int:
+        return self.synced + self.pending
+
+
+class LocalRedisStorage(Storage):
+    """
+    Rate limit storage which counts hits in process and adds them to the redis
+    counters shared by every worker in one batch every sync_interval seconds.
+
+    Checking a limit never waits for redis, at the cost of admitting up to the
+    hits of every worker during one interval above a limit. Windows without
+    hits of this worker since the last sync only take over the counts of the
+    other workers every refresh_interval seconds, ten sync intervals by default.
+    """
+
+    STORAGE_SCHEME = ["local+redis", "local+rediss"]
+
+    # Add to a counter, start its window if it is new, and return its count and
+    # the seconds left in its window.
+    SYNC_SCRIPT = """
+    local count = redis.call("incrby", KEYS[1], ARGV[2])
+
+    if count == tonumber(ARGV[2]) then
+        redis.call("expire", KEYS[1], ARGV[1])
+    end
+
+    return {count, redis.call("ttl", KEYS[1])}
+    """
+
+    def __init__(
+        self,
+        uri: str,
+        sync_interval: float = 1,
+        refresh_interval: Optional[float] = None,
+        **options,
+    ):
+        super().__init__(uri, **options)
+        self.redis = redis.Redis.from_url(uri.removeprefix("local+"), **options)
+        self.sync_script = self.redis.register_script(self.SYNC_SCRIPT)
+        self.sync_interval = sync_interval
+        self.refresh_interval = (
+            sync_interval * 10 if refresh_interval is None else refresh_interval
+        )
+        self.windows: dict[str, Window] = {}
+        self.thread = None
+
+    def window(self, key: str) -> Optional[Window]:
+        window = self.windows.get(key)
+
+        if window is not None and window.expires_at <= time.time():
+            del self.windows[key]
+            return None
+
+        return window
+
+    def incr(
+        self, key: str, expiry: int, elastic_expiry: bool = False, amount: int = 1
+    ) -> int:
+        with self.lock:
+            window = self.window(key)
+
+            if window is None:
+                window = self.windows[key] = Window(expiry, time.time() + expiry)
+            elif elastic_expiry:
+                window.expires_at = time.time() + expiry
+
+            window.pending += amount
+
+            if self.thread is None:
+                self.thread = threading.Thread(target=self.run, daemon=True)
+                self.thread.start()
+
+            return window.count
+
+    def get(self, key: str) -> int:
+        with self.lock:
+            window = self.window(key)
+            return window.count if window else 0
+
+    def get_expiry(self, key: str) -> int:
+        with self.lock:
+            window = self.window(key)
+            return int(window.expires_at if window else time.time())
+
+    def check(self) -> bool:
+        try:
+            return self.redis.ping()
+        except redis.RedisError:
+            return False
+
+    def reset(self) -> int:
+        with self.lock:
+            self.windows.clear()
+
+        keys = list(self.redis.scan_iter("LIMITER*"))
+        return self.redis.delete(*keys) if keys else 0
+
+    def clear(self, key: str) -> None:
+        with self.lock:
+            self.windows.pop(key, None)
+
+        self.redis.delete(key)
+
+    def run(self) -> None:
+        while True:
+            time.sleep(self.sync_interval)
+
+            try:
+                self.sync()
+            except Exception:
+                logger.exception("rate limit sync failed, retrying")
+
+    def sync(self) -> None:
+        """
+        Add the pending hits of every active window to redis and take over the
+        counts of all workers, in one round trip. Idle windows are only synced
+        once their counts are older than the refresh interval.
+        """
+        stale = time.time() - self.refresh_interval
+
+        with self.lock:
+            batch = [
+                (key, window, window.pending)
+                for key in list(self.windows)
+                if (window := self.window(key)) is not None
+                and (window.pending or window.refreshed_at <= stale)
+            ]
+
+        if not batch:
+            return
+
+        pipeline = self.redis.pipeline(transaction=False)
+        for key, window, pending in batch:
+            self.sync_script(keys=[key], args=[window.expiry, pending], client=pipeline)
+        results = pipeline.execute()
+
+        with self.lock:
+            for (key, window, pending), (count, ttl) in zip(batch, results):
+                window.pending -= pending
+                window.synced = count
+                window.refreshed_at = time.time()
+
+                if ttl > 0:
+                    window.expires_at = time.time() + ttl
@@ -1,13 +1,56 @@
+import shutil
+from pathlib import Path
+
 import asyncclick as click
-import uvicorn
-from fastapi_static_digest import StaticDigestCompiler
 
 from easypub import config
+from easypub.content import (
+    INLINE_FIELD,
+    get_object,
+    is_inline,
+    is_stored,
+    move_inline,
+    move_to_object,
+)
+
+
+def _compile_templates() -> None:
+    from easypub.templating import BytecodeCache
+
+    directory = config.template_cache_dir
+    shutil.rmtree(directory, ignore_errors=True)
+    directory.mkdir()
+
+    config.templates.env.bytecode_cache = BytecodeCache(str(directory))
+    config.warm_templates()
+
+
+async def _migrate_content(target: str, max_size: int) -> tuple[int, int]:
+    moved = skipped = 0
 
+    async for key in config.redis.scan_iter(match="metadata:*", count=1000):
+        slug = key.decode().removeprefix("metadata:")
+        metadata = await config.redis.hgetall(key)
+        etag = metadata.get(b"etag", b"")
 
-async def _make_bucket():
-    if not await config.s3.bucket_exists(config.content_bucket):
-        await config.s3.make_bucket(config.content_bucket)
+        if target == "redis" and metadata and is_stored(metadata):
+            encoded_content = await get_object(slug)
+
+            if len(encoded_content) <= max_size and await move_inline(
+                slug, etag, encoded_content
+            ):
+                moved += 1
+                continue
+        elif target == "s3" and is_inline(metadata):
+            encoded_content = metadata[INLINE_FIELD.encode()]
+
+            if await move_to_object(slug, etag, encoded_content):
+                moved += 1
+                continue
+
+        skipped += 1
+
+    return moved, skipped
 
 
 @click.group()
@@ -17,7 +60,9 @@ def cli():
 
 @cli.command()
 async def runserver():
-    await _make_bucket()
+    await config.storage.create()
+
+    import uvicorn
 
     uvicorn.run(
         "easypub.asgi:app",
@@ -29,9 +74,170 @@ async def runserver():
 
 @cli.command()
 def collectstatic():
-    StaticDigestCompiler(config.base_dir / "static").compile()
+    from fastapi_static_digest import StaticDigestCompiler
+
+    from easypub.staticfiles import compress_directory
+
+    compiler = StaticDigestCompiler(config.base_dir / "static")
+    compiler.compile()
+    compress_directory(compiler.output_directory)
+    _compile_templates()
 
 
 @cli.command()
 async def makebucket():
-    await _make_bucket()
+    """Create the bucket or directory content is stored in."""
+    await config.storage.create()
+
+
+@cli.command()
+@click.option(
+    "--to",
+    "target",
+    type=click.Choice(["redis", "s3"]),
+    required=True,
+    help="Where the content of publications should be stored.",
+)
+@click.option(
+    "--max-size",
+    type=int,
+    default=None,
+    help="Largest encoded content to move into redis, defaults to INLINE_CONTENT_SIZE.",
+)
+async def migrate_content(target, max_size):
+    """Move the content of existing publications between S3 and redis."""
+    if max_size is None:
+        max_size = config.inline_content_size
+
+    moved, skipped = await _migrate_content(target, max_size)
+    click.echo(f"moved {moved} publications to {target}, skipped {skipped}")
+
+
+@cli.command()
+@click.option("--module", default="easypub.asgi", help="Module to start.")
+@click.option("--limit", default=15, help="Number of packages to list.")
+def startup_profile(module, limit):
+    """Report the import and initialization time of a fresh worker."""
+    from easypub.profiling import profile
+
+    imports, initialization = profile(module)
+
+    click.echo(f"{'package':<32} {'import ms':>10}")
+    for package, ms in sorted(imports.items(), key=lambda item: -item[1])[:limit]:
+        click.echo(f"{package:<32} {ms:>10.1f}")
+    click.echo(f"{'total':<32} {sum(imports.values()):>10.1f}")
+
+    click.echo()
+    click.echo(f"{'initialization':<32} {'ms':>10}")
+    for step, ms in initialization:
+        click.echo(f"{step:<32} {ms:>10.1f}")
+
+
+@cli.command()
+@click.argument("archive", type=click.Path(dir_okay=False, path_type=Path))
+@click.option("--concurrency", default=16, help="Number of S3 downloads at once.")
+@click.option("--batch-size", default=1000, help="Publications per checkpoint.")
+async def export(archive, concurrency, batch_size):
+    """Write every publication to a gzip compressed archive."""
+    from easypub.transfer import export_archive
+
+    try:
+        progress = await export_archive(archive, concurrency, batch_size)
+    except FileExistsError as error:
+        raise click.ClickException(str(error))
+
+    click.echo(
+        f"exported {progress.transferred} publications to {archive}, "
+        f"skipped {progress.skipped}"
+    )
+
+
+@cli.command(name="import")
+@click.argument("archive", type=click.Path(exists=True, dir_okay=False, path_type=Path))
+@click.option("--concurrency", default=16, help="Number of S3 uploads at once.")
+@click.option("--batch-size", default=1000, help="Publications per checkpoint.")
+async def import_(archive, concurrency, batch_size):
+    """Create the publications of an archive whose slugs are not taken."""
+    from easypub.transfer import import_archive
+
+    progress = await import_archive(archive, concurrency, batch_size)
+    click.echo(
+        f"imported {progress.transferred} publications from {archive}, "
+        f"skipped {progress.skipped}"
+    )
+
+
+@cli.command()
+@click.option("--repair", is_flag=True, help="Remove orphans instead of listing them.")
+@click.option(
+    "--grace",
+    default=3600,
+    help="Seconds after a change before content or metadata can be an orphan.",
+)
+@click.option("--concurrency", default=16, help="Number of orphans checked at once.")
+async def reconcile(repair, grace, concurrency):
+    """Find metadata without content and content without metadata."""
+    from easypub.reconcile import DESCRIPTIONS, reconcile_orphans
+
+    counts = dict.fromkeys(DESCRIPTIONS, 0)
+
+    async for orphan, repaired in reconcile_orphans(repair, grace, concurrency):
+        counts[orphan.kind] += 1
+        action = "removed" if repaired else "found"
+        click.echo(f"{action} {DESCRIPTIONS[orphan.kind]}: {orphan.slug}")
+
+    summary = ", ".join(f"{counts[kind]} {text}" for kind, text in DESCRIPTIONS.items())
+    click.echo(f"{'removed' if repair else 'found'} {summary}")
+
+
+@cli.command()
+@click.option("--samples", default=1000, help="Number of publications to train on.")
+@click.option("--size", default=112_640, help="Size of the dictionary in bytes.")
+async def train_dictionary(samples, size):
+    """Train a zstd dictionary on publications to store content with."""
+    import zstandard
+
+    from easypub.dictionaries import collect_samples, store_dictionary, train
+
+    collected = await collect_samples(samples)
+
+    try:
+        dictionary_id = await store_dictionary(train(collected, size))
+    except (zstandard.ZstdError, ValueError) as error:
+        raise click.ClickException(f"cannot train a dictionary: {error}")
+
+    click.echo(f"trained dictionary {dictionary_id} on {len(collected)} publications")
+    click.echo(f"set STORAGE_DICTIONARY={dictionary_id} to compress content with it")
+
+
+@cli.command()
+@click.option("--concurrency", default=16, help="Number of uploads at once.")
+@click.option(
+    "--attempts", default=5, help="Attempts of an upload before it is put off."
+)
+@click.option(
+    "--claim-idle",
+    default=60.0,
+    help="Seconds after which an unfinished upload is taken over.",
+)
+async def worker(concurrency, attempts, claim_idle):
+    """Upload content queued by publishes and updates in write-behind mode."""
+    import logging.config
+    import os
+    import socket
+
+    from easypub.uploads import run_worker
+
+    logging.config.dictConfig(config.logging)
+    consumer = f"{socket.gethostname()}-{os.getpid()}"
+
+    await config.open()
+    try:
+        async for entry_id, uploaded in run_worker(
+            consumer, concurrency, attempts, claim_idle=claim_idle
+        ):
+            if uploaded is not None:
+                status = "uploaded" if uploaded else "skipped superseded"
+                click.echo(f"{status} {entry_id.decode()}")
+    finally:
+        await config.close()
@@ -0,0 +1,115 @@
+import os
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Iterator, Optional
+
+from prometheus_client import (
+    CONTENT_TYPE_LATEST,
+    REGISTRY,
+    CollectorRegistry,
+    Counter,
+    Histogram,
+    generate_latest,
+)
+from prometheus_client.multiprocess import MultiProcessCollector
+
+# Backend calls and cpu bound work are much faster than whole requests.
+OPERATION_BUCKETS = (
+    0.0005,
+    0.001,
+    0.0025,
+    0.005,
+    0.01,
+    0.025,
+    0.05,
+    0.1,
+    0.25,
+    0.5,
+    1.0,
+    2.5,
+    5.0,
+)
+
+request_duration = Histogram(
+    "easypub_request_duration_seconds",
+    "Time spent handling requests, by route name.",
+    ["route", "method"],
+)
+
+responses = Counter(
+    "easypub_responses",
+    "Responses sent, by route name and status code.",
+    ["route", "method", "status"],
+)
+
+operation_duration = Histogram(
+    "easypub_operation_duration_seconds",
+    "Time spent in redis and S3 calls, rate limiting, hashing, sanitization, "
+    "templates and compression.",
+    ["component", "operation"],
+    buckets=OPERATION_BUCKETS,
+)
+
+coalesced_waiters = Counter(
+    "easypub_coalesced_waiters",
+    "Reads which waited for the same fetch of another read instead of their own.",
+    ["operation", "scope"],
+)
+
+# The number of operations and total seconds spent in them per component during
+# the current request, when server timing is enabled.
+phases: ContextVar[Optional[dict[str, list]]] = ContextVar("phases", default=None)
+
+
+def observe(component: str, operation: str, seconds: float) -> None:
+    operation_duration.labels(component, operation).observe(seconds)
+
+    current = phases.get()
+    if current is not None:
+        phase = current.setdefault(component, [0, 0.0])
+        phase[0] += 1
+        phase[1] += seconds
+
+
+@contextmanager
+def timed(component: str, operation: str) -> Iterator[None]:
+    start = time.perf_counter()
+
+    try:
+        yield
+    finally:
+        observe(component, operation, time.perf_counter() - start)
+
+
+def server_timing(current: dict[str, list], total: float) -> str:
+    """
+    Format the phases of a request and its total duration as a Server-Timing
+    header value.
+    """
+    entries = []
+
+    for component, (count, seconds) in current.items():
+        entry = f"{component};dur={seconds * 1000:.2f}"
+        if count > 1:
+            entry += f';desc="{count} calls"'
+        entries.append(entry)
+
+    entries.append(f"total;dur={total * 1000:.2f}")
+
+    return ", ".join(entries)
+
+
+def collect() -> tuple[bytes, str]:
+    """
+    Return the metrics of this process, or of every worker when the
+    PROMETHEUS_MULTIPROC_DIR environment variable is set, in the prometheus
+    text format along with its content type.
+    """
+    if "PROMETHEUS_MULTIPROC_DIR" not in os.environ:
+        return generate_latest(REGISTRY), CONTENT_TYPE_LATEST
+
+    registry = CollectorRegistry()
+    MultiProcessCollector(registry)
+
+    return generate_latest(registry), CONTENT_TYPE_LATEST
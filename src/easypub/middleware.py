@@ -1,27 +1,68 @@
 import asyncio
+import logging
+import time
 
-from starlette.datastructures import MutableHeaders
+from starlette.datastructures import Headers, MutableHeaders
 from starlette.responses import Response
+from starlette.routing import Match, Mount
 
+from easypub import deadlines, encoding, metrics
 from easypub.caching import build_cache_control
 
+logger = logging.getLogger(__name__)
+
 
 class TimeoutMiddleware:
-    def __init__(self, app, timeout):
+    """
+    Answer with a 408 when a request takes longer than the timeout of its route,
+    or the default timeout. The deadline is shared with redis and S3 calls
+    through easypub.deadlines, so they give up once it has passed.
+    """
+
+    def __init__(self, app, timeout, route_timeouts=None):
         self.app = app
         self.timeout = timeout
+        self.route_timeouts = route_timeouts or {}
+
+    def route_timeout(self, scope):
+        if not self.route_timeouts:
+            return self.timeout
+
+        name = match_route_name(scope["app"].routes, scope)
+        return self.route_timeouts.get(name, self.timeout)
 
     async def __call__(self, scope, receive, send):
         if scope["type"] == "lifespan":
             return await self.app(scope, receive, send)
 
+        timeout = self.route_timeout(scope)
+        started = False
+
+        async def track(message):
+            nonlocal started
+
+            if message["type"] == "http.response.start":
+                started = True
+
+            await send(message)
+
+        token = deadlines.deadline.set(asyncio.get_running_loop().time() + timeout)
+
         try:
             return await asyncio.wait_for(
-                self.app(scope, receive, send), timeout=self.timeout
+                self.app(scope, receive, track), timeout=timeout
             )
         except asyncio.TimeoutError:
+            # The status of a streaming response has already been sent, returning
+            # without finishing the body lets the server abort the connection.
+            if started:
+                logger.warning("timed out while streaming %s", scope["path"])
+                return
+
             response = Response(status_code=408)
             return await response(scope, receive, send)
+        finally:
+            deadlines.deadline.reset(token)
 
 
 class CacheControlMiddleware:
@@ -55,3 +96,240 @@ class CacheControlMiddleware:
             await send(message)
 
         await self.app(scope, receive, modify)
+
+
+def match_route_name(routes, scope):
+    """
+    Return the name of the route which will handle the request, before the
+    router dispatches it.
+    """
+    for route in routes:
+        match, child_scope = route.matches(scope)
+
+        if match == Match.NONE:
+            continue
+
+        if isinstance(route, Mount) and route.routes:
+            return match_route_name(route.routes, {**scope, **child_scope})
+
+        return route.name
+
+    return None
+
+
+def route_names(routes):
+    for route in routes:
+        if isinstance(route, Mount) and route.routes:
+            yield from route_names(route.routes)
+        elif isinstance(route, Mount):
+            yield id(route.app), route.name
+        else:
+            yield id(route.endpoint), route.name
+
+
+class MetricsMiddleware:
+    """
+    Record the duration and status code of every request by the name of the
+    route which handled it.
+    """
+
+    def __init__(self, app):
+        self.app = app
+        self.names = None
+
+    def route_name(self, scope):
+        # The router leaves the endpoint it dispatched to in the scope. Endpoints
+        # are looked up by identity, as some of them, like routers, are unhashable.
+        if self.names is None:
+            self.names = dict(route_names(scope["app"].routes))
+
+        return self.names.get(id(scope.get("endpoint"))) or "unmatched"
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+
+        start = time.perf_counter()
+        status = 500
+
+        async def record(message):
+            nonlocal status
+
+            if message["type"] == "http.response.start":
+                status = message["status"]
+
+            await send(message)
+
+        try:
+            await self.app(scope, receive, record)
+        finally:
+            route = self.route_name(scope)
+            metrics.request_duration.labels(route, scope["method"]).observe(
+                time.perf_counter() - start
+            )
+            metrics.responses.labels(route, scope["method"], status).inc()
+
+
+class ServerTimingMiddleware:
+    """
+    Add a Server-Timing header with the time spent in each component, like
+    redis, S3 or templates, and in total until the response was started.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        try:
+            if not scope["app"].state.server_timing:
+                return await self.app(scope, receive, send)
+        except (AttributeError, KeyError):
+            return await self.app(scope, receive, send)
+
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+
+        start = time.perf_counter()
+        current = {}
+
+        async def add_header(message):
+            if message["type"] == "http.response.start":
+                headers = MutableHeaders(scope=message)
+                headers.append(
+                    "Server-Timing",
+                    metrics.server_timing(current, time.perf_counter() - start),
+                )
+
+            await send(message)
+
+        token = metrics.phases.set(current)
+
+        try:
+            await self.app(scope, receive, add_header)
+        finally:
+            metrics.phases.reset(token)
+
+
+class CompressionMiddleware:
+    """
+    Compress responses with the first of codings the client accepts, when their
+    content type is one of content_types and their body is at least
+    minimum_size bytes. Responses which are encoded already and the responses
+    of exclude_routes are sent as they are.
+
+    Streaming responses are compressed chunk by chunk and every chunk is flushed,
+    so that the client receives each of them as soon as it is produced.
+    """
+
+    def __init__(
+        self,
+        app,
+        codings=("br", "zstd", "gzip"),
+        levels=None,
+        minimum_size=500,
+        content_types=("text/html",),
+        exclude_routes=(),
+    ):
+        for coding in codings:
+            if coding not in encoding.COMPRESSORS:
+                raise ValueError(f"unsupported content coding {coding!r}")
+
+        self.app = app
+        self.codings = list(codings)
+        self.levels = levels or {}
+        self.minimum_size = minimum_size
+        self.content_types = set(content_types)
+        self.exclude_routes = set(exclude_routes)
+
+    def excluded(self, scope):
+        if not self.exclude_routes:
+            return False
+
+        return match_route_name(scope["app"].routes, scope) in self.exclude_routes
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or self.excluded(scope):
+            return await self.app(scope, receive, send)
+
+        accept_encoding = Headers(scope=scope).get("accept-encoding", "")
+        coding = encoding.negotiate(accept_encoding, self.codings)
+
+        if coding is None:
+            return await self.app(scope, receive, send)
+
+        responder = CompressionResponder(self, coding, send)
+        await self.app(scope, receive, responder.send)
+
+
+class CompressionResponder:
+    def __init__(self, middleware, coding, send):
+        self.middleware = middleware
+        self.coding = coding
+        self.downstream = send
+        self.start = None
+        self.compressor = None
+        self.passthrough = False
+        self.elapsed = 0.0
+
+    def compressible(self, message):
+        headers = Headers(raw=message["headers"])
+        content_type = headers.get("content-type", "").partition(";")[0].strip()
+
+        return (
+            "content-encoding" not in headers
+            and content_type in self.middleware.content_types
+        )
+
+    def compress(self, body, more_body):
+        start = time.perf_counter()
+
+        data = self.compressor.compress(body)
+        data += self.compressor.flush() if more_body else self.compressor.finish()
+
+        self.elapsed += time.perf_counter() - start
+        if not more_body:
+            metrics.observe(self.coding, "response", self.elapsed)
+
+        return data
+
+    async def send(self, message):
+        message_type = message["type"]
+
+        if message_type == "http.response.start":
+            # Held back until the first body shows whether it is worth compressing.
+            self.start = message
+            self.passthrough = not self.compressible(message)
+            return
+
+        if message_type != "http.response.body" or self.passthrough:
+            if self.start is not None:
+                await self.downstream(self.start)
+                self.start = None
+            return await self.downstream(message)
+
+        body = message.get("body", b"")
+        more_body = message.get("more_body", False)
+
+        if self.compressor is None:
+            if not more_body and len(body) < self.middleware.minimum_size:
+                self.passthrough = True
+                return await self.send(message)
+
+            level = self.middleware.levels.get(self.coding)
+            self.compressor = encoding.COMPRESSORS[self.coding](level)
+
+            headers = MutableHeaders(raw=self.start["headers"])
+            headers["Content-Encoding"] = self.coding
+            headers.add_vary_header("Accept-Encoding")
+            del headers["Content-Length"]
+
+            body = self.compress(body, more_body)
+            if not more_body:
+                headers["Content-Length"] = str(len(body))
+
+            await self.downstream(self.start)
+            self.start = None
+
+            return await self.downstream({**message, "body": body})
+
+        await self.downstream({**message, "body": self.compress(body, more_body)})
@@ -0,0 +1,293 @@
+import asyncio
+import gzip
+import logging
+from collections import OrderedDict
+from typing import AsyncIterable, AsyncIterator, Optional
+
+from starlette.requests import Request
+from starlette.responses import HTMLResponse, Response, StreamingResponse
+
+from easypub import config, encoding, metrics
+from easypub.dictionaries import decode_stream
+
+logger = logging.getLogger(__name__)
+
+INVALIDATION_CHANNEL = "invalidate:pages"
+
+# Seconds the invalidation listener waits for a message at a time.
+LISTEN_INTERVAL = 1
+
+CONTENT_MARKER = "<!--easypub:content-->"
+
+
+def accepts_gzip(request: Request) -> bool:
+    return "gzip" in request.headers.get("accept-encoding", "")
+
+
+def page_coding(request: Request) -> Optional[str]:
+    # Pages are built from gzip members, so gzip can always be sent as it is.
+    codings = list(dict.fromkeys([*config.compression_codings, "gzip"]))
+    return encoding.negotiate(request.headers.get("accept-encoding", ""), codings)
+
+
+def render_parts(request: Request, slug: str, title: str) -> tuple[bytes, bytes]:
+    # Render the page around a marker and return the halves on either side of it.
+    html = config.templates.get_template("read.html").render(
+        content=CONTENT_MARKER, request=request, slug=slug, title=title
+    )
+    head, _, foot = html.partition(CONTENT_MARKER)
+
+    return head.encode(), foot.encode()
+
+
+def render_page(request: Request, slug: str, title: str, content: bytes) -> bytes:
+    # Splice the stored gzip member between the compressed halves of the page, so
+    # the content itself is never recompressed.
+    head, foot = render_parts(request, slug, title)
+
+    with metrics.timed("gzip", "splice"):
+        return encoding.splice(head, content, foot)
+
+
+def render_compressed(request: Request, slug: str, title: str, content: bytes) -> bytes:
+    # Content which cannot be spliced is rendered into the page as it is, and
+    # the page compressed once so it can be cached like any other.
+    html = config.templates.get_template("read.html").render(
+        content=content.decode(), request=request, slug=slug, title=title
+    )
+    level = config.compression_levels.get("gzip")
+
+    with metrics.timed("gzip", "page"):
+        return encoding.compress_as("gzip", html.encode(), level)
+
+
+async def _prepend(first: bytes, chunks: AsyncIterator[bytes]) -> AsyncIterator[bytes]:
+    yield first
+
+    async for chunk in chunks:
+        yield chunk
+
+
+async def stream_page(
+    request: Request,
+    slug: str,
+    title: str,
+    content: AsyncIterable[bytes],
+    spliceable: bool,
+    headers: dict[str, str],
+) -> Response:
+    head, foot = render_parts(request, slug, title)
+
+    if spliceable and accepts_gzip(request):
+        # An update replaces the content before its metadata, so content said
+        # to be spliceable may still turn out to be compressed with zstd.
+        chunks = content.__aiter__()
+        first = b""
+
+        async for chunk in chunks:
+            first += chunk
+            if len(first) >= len(encoding.MEMBER_PREFIX):
+                break
+
+        content = _prepend(first, chunks)
+
+        if first.startswith(encoding.MEMBER_PREFIX):
+            return StreamingResponse(
+                encoding.splice_stream(head, content, foot),
+                media_type="text/html",
+                headers={
+                    **headers,
+                    "Content-Encoding": "gzip",
+                    "Vary": "Accept-Encoding",
+                },
+            )
+
+    async def body():
+        yield head
+
+        async for chunk in decode_stream(content):
+            yield chunk
+
+        yield foot
+
+    return StreamingResponse(body(), media_type="text/html", headers=headers)
+
+
+def recompress(page: dict[str, bytes], coding: str) -> bytes:
+    level = config.compression_levels.get(coding)
+
+    with metrics.timed(coding, "page"):
+        return encoding.compress_as(coding, gzip.decompress(page["gzip"]), level)
+
+
+# Recompressions running in the background, by page and content coding.
+_fills: dict[tuple[int, str], asyncio.Task] = {}
+
+
+def fill_page(page: dict[str, bytes], coding: str) -> Optional[asyncio.Task]:
+    """
+    Recompress a cached page into another coding in a thread, adding it to the
+    page once it is done. Returns None if it is being recompressed already.
+    """
+    key = (id(page), coding)
+    if key in _fills:
+        return None
+
+    async def fill():
+        try:
+            page[coding] = await asyncio.to_thread(recompress, page, coding)
+        except Exception:
+            logger.exception("recompressing page to %s failed", coding)
+        finally:
+            del _fills[key]
+
+    _fills[key] = task = asyncio.create_task(fill())
+    return task
+
+
+def page_response(
+    request: Request,
+    page: dict[str, bytes],
+    headers: dict[str, str],
+    fill: bool = False,
+) -> Response:
+    """
+    Send a page, given as a dict of its bodies by content coding holding at
+    least its gzip body, in the coding the client prefers.
+
+    Recompressing a page costs more than sending its gzip body, so clients which
+    accept gzip only get another coding once the page has a body in it. With
+    fill, that body is added in the background for the next requests, which is
+    meant for pages read from the cache.
+    """
+    coding = page_coding(request)
+
+    if coding is None:
+        return HTMLResponse(gzip.decompress(page["gzip"]), headers=headers)
+
+    if coding not in page:
+        accept_encoding = request.headers.get("accept-encoding", "")
+
+        if encoding.negotiate(accept_encoding, ["gzip"]):
+            if fill:
+                fill_page(page, coding)
+
+            coding = "gzip"
+        else:
+            page[coding] = recompress(page, coding)
+
+    return Response(
+        page[coding],
+        media_type="text/html",
+        headers={**headers, "Content-Encoding": coding, "Vary": "Accept-Encoding"},
+    )
+
+
+class Generations:
+    """
+    Number the invalidations of pages, so that a read can tell whether the page
+    it rendered was invalidated since it started, and must not be cached.
+
+    Only the last size invalidated slugs are remembered. Reads which started
+    before a forgotten invalidation, or before the whole cache was cleared,
+    treat every page as invalidated.
+    """
+
+    def __init__(self, size: int = 10_000):
+        self.size = size
+        self.current = 0
+        self.slugs: OrderedDict[str, int] = OrderedDict()
+        self.floor = 0
+
+    def invalidate(self, slug: Optional[str] = None) -> None:
+        self.current += 1
+
+        if slug is None:
+            self.slugs.clear()
+            self.floor = self.current
+            return
+
+        self.slugs[slug] = self.current
+        self.slugs.move_to_end(slug)
+
+        if len(self.slugs) > self.size:
+            _, generation = self.slugs.popitem(last=False)
+            self.floor = max(self.floor, generation)
+
+    def changed_since(self, slug: str, generation: int) -> bool:
+        return max(self.slugs.get(slug, 0), self.floor) > generation
+
+
+generations = Generations()
+
+
+def cache_page(
+    slug: str, page: dict[str, bytes], validators: dict[str, str], generation: int
+) -> None:
+    """
+    Cache a page rendered by a read which started at generation, unless it was
+    invalidated meanwhile and may have been rendered from what it replaced.
+    """
+    if not generations.changed_since(slug, generation):
+        config.page_cache.set(slug, (page, validators))
+
+
+async def invalidate_page(slug: str) -> None:
+    # Drop the local copy right away so this worker never serves a stale page,
+    # then fan the slug out to every other worker through redis.
+    generations.invalidate(slug)
+    config.page_cache.delete(slug)
+    await config.redis.publish(INVALIDATION_CHANNEL, slug)
+
+
+async def listen_for_invalidations() -> None:
+    while True:
+        try:
+            async with config.redis.pubsub(ignore_subscribe_messages=True) as pubsub:
+                await pubsub.subscribe(INVALIDATION_CHANNEL)
+
+                # Anything cached while we were disconnected may have missed its
+                # invalidation message.
+                generations.invalidate()
+                config.page_cache.clear()
+
+                # Poll rather than wait for a message, which would run into the
+                # socket timeout of the pool whenever no page is invalidated.
+                while True:
+                    message = await pubsub.get_message(
+                        ignore_subscribe_messages=True, timeout=LISTEN_INTERVAL
+                    )
+                    if message is not None and message["type"] == "message":
+                        slug = message["data"].decode()
+                        generations.invalidate(slug)
+                        config.page_cache.delete(slug)
+        except asyncio.CancelledError:
+            raise
+        except Exception:
+            logger.exception("page invalidation listener failed, reconnecting")
+            await asyncio.sleep(1)
+
+
+class PageInvalidationListener:
+    def __init__(self):
+        self.task = None
+
+    async def start(self) -> None:
+        if config.read_cache_size > 0:
+            self.task = asyncio.create_task(listen_for_invalidations())
+
+    async def stop(self) -> None:
+        if self.task is None:
+            return
+
+        self.task.cancel()
+
+        try:
+            await self.task
+        except asyncio.CancelledError:
+            pass
+
+        self.task = None
+
+
+invalidation_listener = PageInvalidationListener()
@@ -0,0 +1,85 @@
+"""
+Measure where the time to start a worker goes.
+
+    $ python -X importtime -m easypub.profiling easypub.asgi
+
+Prints the time spent building each client of the config, importing the app
+and warming its templates as json. The import time of every module is written
+to stderr by the interpreter and can be parsed with parse_importtime.
+"""
+
+import importlib
+import json
+import re
+import subprocess
+import sys
+import time
+from collections import Counter
+
+IMPORT_TIME = re.compile(r"^import time:\s+(\d+) \|\s+(\d+) \| (\s*)(\S+)$")
+
+CLIENTS = [
+    "templates",
+    "static",
+    "limiter",
+    "redis",
+    "storage",
+    "page_cache",
+    "crypt_executor",
+    "sanitize_executor",
+]
+
+
+def parse_importtime(output: str) -> dict[str, float]:
+    """
+    Return the milliseconds spent importing each top level package, not
+    counting the packages it imported, from the output of -X importtime.
+    """
+    packages: Counter[str] = Counter()
+
+    for line in output.splitlines():
+        match = IMPORT_TIME.match(line)
+        if match:
+            own, _, _, module = match.groups()
+            packages[module.split(".")[0]] += int(own) / 1000
+
+    return dict(packages)
+
+
+def initialize(module: str) -> list[tuple[str, float]]:
+    """
+    Build every client of the config, import module and warm the templates,
+    returning the milliseconds each step took, including the imports it caused.
+    """
+    from easypub import config
+
+    steps = [(name, lambda name=name: getattr(config, name)) for name in CLIENTS]
+    steps.append((f"import {module}", lambda: importlib.import_module(module)))
+    steps.append(("warm_templates", config.warm_templates))
+
+    timings = []
+    for name, step in steps:
+        start = time.perf_counter()
+        step()
+        timings.append((name, (time.perf_counter() - start) * 1000))
+
+    return timings
+
+
+def profile(module: str) -> tuple[dict[str, float], list[tuple[str, float]]]:
+    """
+    Start a fresh interpreter which imports and initializes module, and return
+    the import time per package and the time of each initialization step.
+    """
+    process = subprocess.run(
+        [sys.executable, "-X", "importtime", "-m", __name__, module],
+        capture_output=True,
+        check=True,
+        text=True,
+    )
+
+    return parse_importtime(process.stderr), json.loads(process.stdout)
+
+
+if __name__ == "__main__":
+    json.dump(initialize(sys.argv[1]), sys.stdout)
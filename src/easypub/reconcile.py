@@ -0,0 +1,244 @@
+"""
+Find and repair publications whose metadata and content went out of sync.
+
+Publishing reserves the metadata before uploading the content and deleting
+removes the metadata before the content, so a worker stopped in between leaves
+metadata without content, or content without metadata. Moving content into
+redis can also leave the previous copy behind in S3.
+
+The metadata keys are scanned into sorted runs on disk and merged with the
+storage listing, which is returned in key order, so neither side is held in
+memory.
+
+Orphans are checked again right before they are repaired, but a publish which
+starts between that check and the repair can still lose its content. Objects
+are only removed when they were not changed within the grace period, so this
+takes a publish which reused the slug of an orphan at that very moment, and
+whose upload finished within the few milliseconds after the check.
+"""
+
+import heapq
+import tempfile
+import time
+from dataclasses import dataclass
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import AsyncIterator, Iterator, Optional
+
+from easypub import config
+from easypub.content import INLINE_FIELD, is_stored, metadata_key, remove_object
+from easypub.pages import invalidate_page
+from easypub.storage import ObjectNotFound
+from easypub.transfer import bounded
+
+# Kinds of orphans.
+METADATA = "metadata"
+CONTENT = "content"
+
+DESCRIPTIONS = {
+    METADATA: "metadata without content",
+    CONTENT: "content without metadata",
+}
+
+# Delete metadata only if it still has the etag it was found with and its
+# content was not moved into it or queued for upload since.
+DISCARD_SCRIPT = """
+if (redis.call("hget", KEYS[1], "etag") or "") ~= ARGV[1] then
+    return 0
+end
+
+if redis.call("hexists", KEYS[1], "content") == 1 then
+    return 0
+end
+
+if redis.call("hexists", KEYS[1], "pending") == 1 then
+    return 0
+end
+
+return redis.call("del", KEYS[1])
+"""
+
+
+@dataclass(frozen=True)
+class Orphan:
+    kind: str
+    slug: str
+
+
+def _write_run(path: Path, entries: list[tuple[str, bool]]) -> Path:
+    with open(path, "w") as f:
+        for slug, inline in sorted(entries):
+            f.write(f"{int(inline)}{slug}\n")
+
+    return path
+
+
+def _read_run(path: Path) -> Iterator[tuple[str, bool]]:
+    with open(path) as f:
+        for line in f:
+            yield line[1:-1], line[0] == "1"
+
+
+def _unique(entries: Iterator[tuple[str, bool]]) -> Iterator[tuple[str, bool]]:
+    # SCAN returns a key more than once when the keyspace is resized meanwhile.
+    previous = None
+
+    for entry in entries:
+        if entry[0] != previous:
+            previous = entry[0]
+            yield entry
+
+
+async def _scan_runs(directory: Path, run_size: int) -> list[Path]:
+    """
+    Write the slug of every metadata key and whether its content is inline to
+    sorted files of at most run_size slugs each.
+    """
+    runs: list[Path] = []
+    entries: list[tuple[str, bool]] = []
+    cursor = None
+
+    while cursor != 0:
+        cursor, keys = await config.redis.scan(
+            cursor or 0, match="metadata:*", count=1000
+        )
+
+        pipeline = config.redis.pipeline(transaction=False)
+        for key in keys:
+            pipeline.hexists(key, INLINE_FIELD)
+        inline = await pipeline.execute() if keys else []
+
+        for key, has_content in zip(keys, inline):
+            entries.append((key.decode().removeprefix("metadata:"), bool(has_content)))
+
+        if len(entries) >= run_size or (cursor == 0 and entries):
+            runs.append(_write_run(directory / str(len(runs)), entries))
+            entries = []
+
+    return runs
+
+
+async def find_orphans(grace: float, run_size: int = 100_000) -> AsyncIterator[Orphan]:
+    """
+    Yield every slug with metadata but no content, and every object without
+    metadata or which is a leftover copy of inline content. Objects changed
+    within the last grace seconds are left out, they may belong to a request
+    in progress.
+    """
+    cutoff = datetime.fromtimestamp(time.time() - grace, timezone.utc)
+
+    with tempfile.TemporaryDirectory() as directory:
+        runs = await _scan_runs(Path(directory), run_size)
+        entries = _unique(heapq.merge(*map(_read_run, runs)))
+        current = next(entries, None)
+
+        async for obj in config.storage.iter_objects():
+            slug = obj.name
+
+            while current is not None and current[0] < slug:
+                if not current[1]:
+                    yield Orphan(METADATA, current[0])
+                current = next(entries, None)
+
+            if current is not None and current[0] == slug:
+                orphaned = current[1]
+                current = next(entries, None)
+            else:
+                orphaned = True
+
+            if orphaned and (obj.modified is None or obj.modified < cutoff):
+                yield Orphan(CONTENT, slug)
+
+        while current is not None:
+            if not current[1]:
+                yield Orphan(METADATA, current[0])
+            current = next(entries, None)
+
+
+async def _confirm_metadata(slug: str, grace: float) -> Optional[bytes]:
+    """
+    Return the etag of the metadata of slug if it still has no content and
+    was last changed more than grace seconds ago.
+    """
+    metadata = await config.redis.hgetall(metadata_key(slug))
+
+    if not metadata or not is_stored(metadata):
+        return None
+
+    if int(metadata.get(b"modified", 0)) > time.time() - grace:
+        return None
+
+    if await config.storage.exists(slug):
+        return None
+
+    return metadata.get(b"etag", b"")
+
+
+async def _confirm_content(slug: str) -> bool:
+    """
+    Return whether the object of slug still has no metadata pointing at it.
+    """
+    key = metadata_key(slug)
+
+    pipeline = config.redis.pipeline(transaction=False)
+    pipeline.exists(key)
+    pipeline.hexists(key, INLINE_FIELD)
+    exists, inline = await pipeline.execute()
+
+    return not exists or bool(inline)
+
+
+async def _confirm_settled(slug: str, grace: float) -> bool:
+    """
+    Return whether the object of slug still exists and was last changed more
+    than grace seconds ago.
+    """
+    try:
+        obj = await config.storage.stat(slug)
+    except ObjectNotFound:
+        return False
+
+    cutoff = datetime.fromtimestamp(time.time() - grace, timezone.utc)
+    return obj.modified is None or obj.modified < cutoff
+
+
+async def reconcile_orphans(
+    repair: bool = False, grace: float = 3600, concurrency: int = 16
+) -> AsyncIterator[tuple[Orphan, bool]]:
+    """
+    Check every orphan found again, checking up to concurrency of them at once,
+    and yield it along with whether it was repaired. Metadata without content
+    is deleted and content without metadata is removed when repair is set.
+    """
+
+    async def handle(orphan: Orphan) -> tuple[Orphan, Optional[bool]]:
+        if orphan.kind == METADATA:
+            etag = await _confirm_metadata(orphan.slug, grace)
+            if etag is None:
+                return orphan, None
+            if not repair:
+                return orphan, False
+
+            script = config.redis.register_script(DISCARD_SCRIPT)
+            if not await script(keys=[metadata_key(orphan.slug)], args=[etag]):
+                return orphan, None
+
+            await invalidate_page(orphan.slug)
+            return orphan, True
+
+        if not await _confirm_content(orphan.slug):
+            return orphan, None
+        if not repair:
+            return orphan, False
+
+        # Uploaded again since it was listed.
+        if not await _confirm_settled(orphan.slug, grace):
+            return orphan, None
+
+        await remove_object(orphan.slug)
+        return orphan, True
+
+    async for orphan, repaired in bounded(handle, find_orphans(grace), concurrency):
+        # Fixed by a request in progress since it was found.
+        if repaired is not None:
+            yield orphan, repaired
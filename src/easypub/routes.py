@@ -1,24 +1,27 @@
 from starlette.middleware import Middleware
 from starlette.routing import Mount, Route
-from starlette.staticfiles import StaticFiles
 
 from easypub import config
 from easypub.endpoints import (
     AdminEndpoint,
+    ContentEndpoint,
     DeleteEndpoint,
     HealthEndpoint,
     HomeEndpoint,
+    MetricsEndpoint,
     PublishEndpoint,
     ReadEndpoint,
+    StatsEndpoint,
     UpdateEndpoint,
 )
 from easypub.middleware import CacheControlMiddleware
+from easypub.staticfiles import PrecompressedStaticFiles
 
 routes = [
     Route("/", endpoint=HomeEndpoint, name="home"),
     Mount(
         "/static",
-        app=StaticFiles(directory=config.static.directory),
+        app=PrecompressedStaticFiles(directory=config.static.directory),
         middleware=[Middleware(CacheControlMiddleware, immutable=True)],
         name="static",
     ),
@@ -26,7 +29,10 @@ routes = [
         "/api",
         routes=[
             Route("/health", endpoint=HealthEndpoint, name="health"),
+            Route("/stats", endpoint=StatsEndpoint, name="stats"),
+            Route("/metrics", endpoint=MetricsEndpoint, name="metrics"),
             Route("/publish", endpoint=PublishEndpoint, name="publish"),
+            Route("/{slug:str}/content", endpoint=ContentEndpoint, name="content"),
             Route("/{slug:str}/update", endpoint=UpdateEndpoint, name="update"),
             Route("/{slug:str}/delete", endpoint=DeleteEndpoint, name="delete"),
         ],
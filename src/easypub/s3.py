@@ -0,0 +1,290 @@
+import asyncio
+import contextlib
+from typing import AsyncIterator, Optional
+from urllib.parse import urlunsplit
+
+import aiohttp
+import miniopy_async
+from miniopy_async.datatypes import Object, parse_list_objects
+from miniopy_async.error import InvalidResponseError, S3Error, ServerError
+from miniopy_async.signer import sign_v4_s3
+
+from easypub import deadlines, metrics
+
+
+class Minio(miniopy_async.Minio):
+    """
+    Minio client which returns object bodies exactly as they are stored.
+
+    The stock client lets aiohttp inflate any object stored with a
+    content-encoding, which would force every read to recompress the body.
+
+    Requests share one pooled, keep-alive session between open and close, and
+    fall back to a session per request outside of that. The duration of every
+    request is recorded in the operation metrics, and requests made while
+    handling a request have to finish before its deadline.
+    """
+
+    def __init__(
+        self,
+        *args,
+        max_connections: int = 100,
+        keepalive_timeout: float = 15,
+        connect_timeout: Optional[float] = None,
+        read_timeout: Optional[float] = None,
+        **kwargs,
+    ):
+        super().__init__(*args, **kwargs)
+        self.max_connections = max_connections
+        self.keepalive_timeout = keepalive_timeout
+        self.timeout = aiohttp.ClientTimeout(
+            sock_connect=connect_timeout, sock_read=read_timeout
+        )
+        self.session: Optional[aiohttp.ClientSession] = None
+
+    def _create_session(self, **connector_options) -> aiohttp.ClientSession:
+        return aiohttp.ClientSession(
+            connector=aiohttp.TCPConnector(**connector_options),
+            timeout=self.timeout,
+            auto_decompress=False,
+        )
+
+    async def open(self) -> None:
+        if self.session is None:
+            self.session = self._create_session(
+                limit=self.max_connections, keepalive_timeout=self.keepalive_timeout
+            )
+
+    async def close(self) -> None:
+        if self.session is not None:
+            await self.session.close()
+            self.session = None
+
+    @contextlib.asynccontextmanager
+    async def _session(self) -> AsyncIterator[aiohttp.ClientSession]:
+        if self.session is not None:
+            yield self.session
+            return
+
+        async with self._create_session(force_close=True) as session:
+            yield session
+
+    @property
+    def pool_stats(self) -> dict[str, int]:
+        connector = self.session.connector if self.session else None
+        return {
+            "limit": self.max_connections,
+            "in_use": len(connector._acquired) if connector else 0,
+            "idle": sum(map(len, connector._conns.values())) if connector else 0,
+        }
+
+    async def _request(
+        self,
+        session,
+        method,
+        region,
+        bucket_name=None,
+        object_name=None,
+        body=None,
+        headers=None,
+        query_params=None,
+    ):
+        credentials = self._provider.retrieve() if self._provider else None
+        url = self._base_url.build(
+            method,
+            region,
+            bucket_name=bucket_name,
+            object_name=object_name,
+            query_params=query_params,
+        )
+        request_headers, date = await self._build_headers(
+            url.netloc, dict(headers or {}), body, credentials
+        )
+        if credentials:
+            request_headers = sign_v4_s3(
+                method,
+                url,
+                region,
+                request_headers,
+                credentials,
+                request_headers.get("x-amz-content-sha256"),
+                date,
+            )
+
+        # The whole request, including reading the body, has to finish before the
+        # deadline of the current request.
+        timeout = deadlines.remaining()
+        if timeout is not None and timeout <= 0:
+            raise asyncio.TimeoutError
+
+        return await session.request(
+            method,
+            urlunsplit(url),
+            data=body,
+            headers=request_headers,
+            timeout=self.timeout if timeout is None else self._timeout(timeout),
+        )
+
+    def _timeout(self, total: float) -> aiohttp.ClientTimeout:
+        return aiohttp.ClientTimeout(
+            total=total,
+            sock_connect=self.timeout.sock_connect,
+            sock_read=self.timeout.sock_read,
+        )
+
+    async def _url_open(
+        self,
+        method,
+        region,
+        bucket_name=None,
+        object_name=None,
+        body=None,
+        headers=None,
+        query_params=None,
+    ):
+        with metrics.timed("s3", method.lower()):
+            async with self._session() as session:
+                response = await self._request(
+                    session,
+                    method,
+                    region,
+                    bucket_name=bucket_name,
+                    object_name=object_name,
+                    body=body,
+                    headers=headers,
+                    query_params=query_params,
+                )
+                await response.read()
+
+        if response.status in [200, 204, 206]:
+            return response
+
+        raise await self._response_error(method, bucket_name, object_name, response)
+
+    async def _response_error(
+        self, method, bucket_name, object_name, response
+    ) -> Exception:
+        """
+        Translate an error response into the exception the stock client raises
+        for it, without repeating the request.
+        """
+        response_data = await response.text()
+        content_types = response.headers.get("content-type", "").split(";")
+
+        if method != "HEAD" and (
+            not response_data or "application/xml" not in content_types
+        ):
+            return InvalidResponseError(
+                response.status,
+                response.headers.get("content-type"),
+                response_data or None,
+            )
+
+        if response_data:
+            error = S3Error.fromxml(response, response_data)
+        else:
+            code, message = self._error_code(method, bucket_name, object_name, response)
+            if not code:
+                return ServerError(
+                    f"server failed with HTTP status code {response.status}",
+                    response.status,
+                )
+
+            error = S3Error(
+                code,
+                message,
+                response.url.path,
+                response.headers.get("x-amz-request-id"),
+                response.headers.get("x-amz-id-2"),
+                response,
+                bucket_name=bucket_name,
+                object_name=object_name,
+            )
+
+        if error.code in ["NoSuchBucket", "RetryHead"]:
+            self._region_map.pop(bucket_name, None)
+
+        return error
+
+    def _error_code(
+        self, method, bucket_name, object_name, response
+    ) -> tuple[Optional[str], Optional[str]]:
+        # Error responses to HEAD requests have no body to read the code from.
+        if response.status in [301, 307, 400]:
+            return self._handle_redirect_response(method, bucket_name, response, True)
+
+        if response.status == 403:
+            return "AccessDenied", "Access denied"
+
+        if response.status == 404:
+            if object_name:
+                return "NoSuchKey", "Object does not exist"
+            if bucket_name:
+                return "NoSuchBucket", "Bucket does not exist"
+            return "ResourceNotFound", "Request resource not found"
+
+        if response.status in [405, 501]:
+            return (
+                "MethodNotAllowed",
+                "The specified method is not allowed against this resource",
+            )
+
+        if response.status == 409:
+            if bucket_name:
+                return "NoSuchBucket", "Bucket does not exist"
+            return "ResourceConflict", "Request resource conflicts"
+
+        return None, None
+
+    async def iter_objects(
+        self, bucket_name: str, page_size: int = 1000
+    ) -> AsyncIterator[Object]:
+        """
+        Yield every object of a bucket in key order, listing page_size objects
+        at a time. The stock list_objects only returns the first page.
+        """
+        token = None
+
+        while True:
+            query = {"list-type": "2", "max-keys": str(page_size), "prefix": ""}
+            if token:
+                query["continuation-token"] = token
+
+            response = await self._execute("GET", bucket_name, query_params=query)
+            objects, truncated, token, _ = await parse_list_objects(response)
+
+            for obj in objects:
+                yield obj
+
+            if not truncated:
+                return
+
+    async def stream_object(
+        self, bucket_name: str, object_name: str, chunk_size: int = 65536
+    ) -> AsyncIterator[bytes]:
+        """
+        Yield the stored body of an object in chunks of at most chunk_size bytes,
+        without ever holding all of it in memory.
+        """
+        region = await self._get_region(bucket_name, None)
+
+        async with self._session() as session:
+            # Only the time to the response headers, the body is read as the
+            # consumer asks for it.
+            with metrics.timed("s3", "get"):
+                response = await self._request(
+                    session,
+                    "GET",
+                    region,
+                    bucket_name=bucket_name,
+                    object_name=object_name,
+                )
+
+            async with response:
+                if response.status != 200:
+                    raise await self._response_error(
+                        "GET", bucket_name, object_name, response
+                    )
+
+                async for chunk in response.content.iter_chunked(chunk_size):
+                    yield chunk
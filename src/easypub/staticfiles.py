@@ -0,0 +1,142 @@
+import gzip
+import json
+import mimetypes
+import os
+from pathlib import Path
+
+from starlette.datastructures import Headers
+from starlette.responses import FileResponse
+from starlette.staticfiles import NotModifiedResponse, StaticFiles
+
+from easypub.encoding import negotiate
+
+# Content codings of the copies written next to every static file, in order of
+# preference, and the suffix of their files.
+PRECOMPRESSED = {"br": ".br", "gzip": ".gz"}
+
+
+def compress_file(path: Path) -> list[Path]:
+    """
+    Write brotli and gzip copies of path, compressed at the highest level, and
+    return those which turned out smaller than the file itself.
+    """
+    import brotli
+
+    data = path.read_bytes()
+    copies = {
+        "br": brotli.compress(data, quality=11),
+        "gzip": gzip.compress(data, compresslevel=9, mtime=0),
+    }
+
+    written = []
+    for coding, compressed in copies.items():
+        target = path.with_name(path.name + PRECOMPRESSED[coding])
+
+        if len(compressed) < len(data):
+            target.write_bytes(compressed)
+            written.append(target)
+        else:
+            target.unlink(missing_ok=True)
+
+    return written
+
+
+def compress_directory(directory: Path) -> list[Path]:
+    """
+    Compress every file listed in the manifest of a StaticDigestCompiler output
+    directory.
+    """
+    with open(directory / "cache_manifest.json") as f:
+        manifest = json.load(f)
+
+    return [
+        copy
+        for digested in manifest.values()
+        for copy in compress_file(directory / digested)
+    ]
+
+
+class SendfileResponse(FileResponse):
+    """
+    FileResponse which hands the file over to the server, to be sent with
+    sendfile, when the server supports the ASGI zero copy send extension.
+    """
+
+    async def __call__(self, scope, receive, send):
+        zerocopy = "http.response.zerocopy" in scope.get("extensions", {})
+
+        if not zerocopy or self.send_header_only or self.stat_result is None:
+            return await super().__call__(scope, receive, send)
+
+        await send(
+            {
+                "type": "http.response.start",
+                "status": self.status_code,
+                "headers": self.raw_headers,
+            }
+        )
+
+        with open(self.path, "rb") as file:
+            await send(
+                {
+                    "type": "http.response.zerocopy",
+                    "file": file,
+                    "count": self.stat_result.st_size,
+                    "more_body": False,
+                }
+            )
+
+        if self.background is not None:
+            await self.background()
+
+
+class PrecompressedStaticFiles(StaticFiles):
+    """
+    StaticFiles which serves the brotli or gzip copy of a file written by
+    collectstatic when the client accepts it, so that static files are never
+    compressed per request.
+    """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        # Digested files never change, neither does the set of their copies.
+        self.copies: dict[str, dict[str, tuple[str, os.stat_result]]] = {}
+
+    def find_copies(self, full_path: str) -> dict[str, tuple[str, os.stat_result]]:
+        if full_path not in self.copies:
+            copies = {}
+
+            for coding, suffix in PRECOMPRESSED.items():
+                try:
+                    copies[coding] = full_path + suffix, os.stat(full_path + suffix)
+                except FileNotFoundError:
+                    pass
+
+            self.copies[full_path] = copies
+
+        return self.copies[full_path]
+
+    def file_response(self, full_path, stat_result, scope, status_code=200):
+        request_headers = Headers(scope=scope)
+        copies = self.find_copies(str(full_path))
+        coding = negotiate(request_headers.get("accept-encoding", ""), list(copies))
+
+        headers = {"Vary": "Accept-Encoding"}
+        path = full_path
+        if coding is not None:
+            path, stat_result = copies[coding]
+            headers["Content-Encoding"] = coding
+
+        response = SendfileResponse(
+            path,
+            status_code=status_code,
+            headers=headers,
+            media_type=mimetypes.guess_type(str(full_path))[0] or "text/plain",
+            method=scope["method"],
+            stat_result=stat_result,
+        )
+
+        if self.is_not_modified(response.headers, request_headers):
+            return NotModifiedResponse(response.headers)
+
+        return response
@@ -0,0 +1,4 @@
+from collections import Counter
+
+# Per worker event counters, served by the stats endpoint.
+counters: Counter[str] = Counter()
@@ -0,0 +1,342 @@
+"""
+Storage backends for the content of publications.
+
+Content is kept in the bucket of an S3 compatible object store, or in a local
+directory for single node deployments, which skips the HTTP round trip to the
+object store entirely. The backend is chosen by the scheme of STORAGE_URL.
+"""
+
+import asyncio
+import contextlib
+import heapq
+import io
+import mmap
+import os
+import secrets
+import tempfile
+from dataclasses import dataclass
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import AsyncIterator, Iterator, Optional
+
+from easypub import config, metrics
+
+
+class ObjectNotFound(LookupError):
+    pass
+
+
+@dataclass(frozen=True)
+class StoredObject:
+    name: str
+    size: int
+    modified: Optional[datetime]
+
+
+class Storage:
+    """
+    Interface of the storage backends. Objects are named by the slug of their
+    publication, and reading a missing object raises ObjectNotFound.
+    """
+
+    async def open(self) -> None:
+        pass
+
+    async def close(self) -> None:
+        pass
+
+    @property
+    def pool_stats(self) -> dict[str, dict[str, int]]:
+        return {}
+
+    async def available(self) -> bool:
+        raise NotImplementedError
+
+    async def create(self) -> None:
+        raise NotImplementedError
+
+    async def put(
+        self, name: str, data: bytes, content_encoding: Optional[str] = None
+    ) -> None:
+        raise NotImplementedError
+
+    async def get(self, name: str) -> bytes:
+        raise NotImplementedError
+
+    def stream(self, name: str, chunk_size: int = 65536) -> AsyncIterator[bytes]:
+        raise NotImplementedError
+
+    async def delete(self, name: str) -> None:
+        raise NotImplementedError
+
+    async def exists(self, name: str) -> bool:
+        raise NotImplementedError
+
+    async def stat(self, name: str) -> StoredObject:
+        raise NotImplementedError
+
+    def iter_objects(self) -> AsyncIterator[StoredObject]:
+        """
+        Yield every object in the order of the code points of their names.
+        """
+        raise NotImplementedError
+
+    async def presign(self, name: str) -> Optional[str]:
+        """
+        Return a url clients can fetch the object from directly, or None if
+        the object can only be served by the app.
+        """
+        raise NotImplementedError
+
+    def local_path(self, name: str) -> Optional[str]:
+        """
+        Return the path of the file holding the object, if it is stored on the
+        local filesystem and can be sent without reading it.
+        """
+        return None
+
+
+@contextlib.contextmanager
+def _not_found(name: str) -> Iterator[None]:
+    from miniopy_async.error import S3Error
+
+    try:
+        yield
+    except S3Error as error:
+        if error.code != "NoSuchKey":
+            raise
+        raise ObjectNotFound(name) from error
+
+
+class S3Storage(Storage):
+    """
+    Objects in the bucket of STORAGE_URL, accessed through the S3 client of the
+    config.
+    """
+
+    @property
+    def client(self):
+        return config.s3
+
+    @property
+    def bucket(self) -> str:
+        return config.content_bucket
+
+    async def open(self) -> None:
+        await self.client.open()
+
+    async def close(self) -> None:
+        await self.client.close()
+
+    @property
+    def pool_stats(self) -> dict[str, dict[str, int]]:
+        return {"s3": self.client.pool_stats}
+
+    async def available(self) -> bool:
+        return await self.client.bucket_exists(self.bucket)
+
+    async def create(self) -> None:
+        if not await self.client.bucket_exists(self.bucket):
+            await self.client.make_bucket(self.bucket)
+
+    async def put(
+        self, name: str, data: bytes, content_encoding: Optional[str] = None
+    ) -> None:
+        metadata = {"content-encoding": content_encoding} if content_encoding else {}
+
+        await self.client.put_object(
+            self.bucket,
+            name,
+            io.BytesIO(data),
+            len(data),
+            content_type="text/html",
+            metadata=metadata,
+        )
+
+    async def get(self, name: str) -> bytes:
+        with _not_found(name):
+            async with await self.client.get_object(self.bucket, name) as response:
+                return await response.read()
+
+    async def stream(self, name: str, chunk_size: int = 65536) -> AsyncIterator[bytes]:
+        with _not_found(name):
+            async for chunk in self.client.stream_object(self.bucket, name, chunk_size):
+                yield chunk
+
+    async def delete(self, name: str) -> None:
+        await self.client.remove_object(self.bucket, name)
+
+    async def exists(self, name: str) -> bool:
+        try:
+            with _not_found(name):
+                await self.client.stat_object(self.bucket, name)
+        except ObjectNotFound:
+            return False
+
+        return True
+
+    async def stat(self, name: str) -> StoredObject:
+        with _not_found(name):
+            obj = await self.client.stat_object(self.bucket, name)
+
+        return StoredObject(name, obj.size, obj.last_modified)
+
+    async def iter_objects(self) -> AsyncIterator[StoredObject]:
+        # S3 lists keys in the order of their utf-8 bytes, which is the order of
+        # their code points as well.
+        async for obj in self.client.iter_objects(self.bucket):
+            yield StoredObject(obj.object_name, obj.size, obj.last_modified)
+
+    async def presign(self, name: str) -> Optional[str]:
+        return await self.client.get_presigned_url("GET", self.bucket, name)
+
+
+def _write_run(path: Path, names: list[str]) -> Path:
+    with open(path, "w", encoding="utf-8", errors="surrogateescape") as f:
+        for name in sorted(names):
+            f.write(f"{name}\n")
+
+    return path
+
+
+def _read_run(path: Path) -> Iterator[str]:
+    with open(path, encoding="utf-8", errors="surrogateescape") as f:
+        for line in f:
+            yield line[:-1]
+
+
+class FileSystemStorage(Storage):
+    """
+    Objects as files of a local directory, written to a temporary file first
+    and renamed into place so that readers never see a partial object.
+    """
+
+    def __init__(self, directory: Path):
+        self.directory = Path(directory)
+
+    def _path(self, name: str) -> Path:
+        # Temporary files start with a dot, and listings hold a name per line.
+        if not name or name.startswith(".") or any(c in name for c in "/\0\n"):
+            raise ValueError(f"invalid object name {name!r}")
+
+        return self.directory / name
+
+    async def available(self) -> bool:
+        return self.directory.is_dir()
+
+    async def create(self) -> None:
+        self.directory.mkdir(parents=True, exist_ok=True)
+
+    def _write(self, path: Path, data: bytes) -> None:
+        temporary = path.with_name(f".{path.name}.{secrets.token_hex(4)}")
+
+        try:
+            with open(temporary, "wb") as f:
+                f.write(data)
+                f.flush()
+                os.fsync(f.fileno())
+
+            os.replace(temporary, path)
+        finally:
+            temporary.unlink(missing_ok=True)
+
+    async def put(
+        self, name: str, data: bytes, content_encoding: Optional[str] = None
+    ) -> None:
+        # Stored content is recognized by its header, there is nowhere to keep
+        # the content encoding.
+        path = self._path(name)
+
+        with metrics.timed("fs", "put"):
+            await asyncio.to_thread(self._write, path, data)
+
+    async def get(self, name: str) -> bytes:
+        path = self._path(name)
+
+        # Files in the page cache are read in microseconds, much less than it
+        # takes to hand the read to a thread.
+        with metrics.timed("fs", "get"):
+            try:
+                with open(path, "rb") as f:
+                    return f.read()
+            except FileNotFoundError as error:
+                raise ObjectNotFound(name) from error
+
+    async def stream(self, name: str, chunk_size: int = 65536) -> AsyncIterator[bytes]:
+        path = self._path(name)
+
+        try:
+            f = open(path, "rb")
+        except FileNotFoundError as error:
+            raise ObjectNotFound(name) from error
+
+        with f:
+            size = os.fstat(f.fileno()).st_size
+            if not size:
+                return
+
+            # Mapped pages are read ahead by the kernel as the chunks are sent,
+            # without a read call for each of them.
+            with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+                for start in range(0, size, chunk_size):
+                    end = start + chunk_size
+                    yield mapped[start:end]
+
+    async def delete(self, name: str) -> None:
+        with metrics.timed("fs", "delete"):
+            self._path(name).unlink(missing_ok=True)
+
+    async def exists(self, name: str) -> bool:
+        return self._path(name).is_file()
+
+    def _stat(self, name: str) -> StoredObject:
+        stat_result = self._path(name).stat()
+        modified = datetime.fromtimestamp(stat_result.st_mtime, timezone.utc)
+
+        return StoredObject(name, stat_result.st_size, modified)
+
+    async def stat(self, name: str) -> StoredObject:
+        try:
+            return self._stat(name)
+        except FileNotFoundError as error:
+            raise ObjectNotFound(name) from error
+
+    def _write_runs(self, directory: Path, run_size: int) -> list[Path]:
+        runs: list[Path] = []
+        names: list[str] = []
+
+        with os.scandir(self.directory) as entries:
+            for entry in entries:
+                if entry.name.startswith(".") or not entry.is_file():
+                    continue
+
+                names.append(entry.name)
+
+                if len(names) >= run_size:
+                    runs.append(_write_run(directory / str(len(runs)), names))
+                    names = []
+
+        if names:
+            runs.append(_write_run(directory / str(len(runs)), names))
+
+        return runs
+
+    async def iter_objects(
+        self, run_size: int = 100_000
+    ) -> AsyncIterator[StoredObject]:
+        # The names are sorted in runs of at most run_size on disk and merged,
+        # so that a large directory is never listed into memory at once.
+        with tempfile.TemporaryDirectory() as directory:
+            runs = await asyncio.to_thread(self._write_runs, Path(directory), run_size)
+
+            for name in heapq.merge(*map(_read_run, runs)):
+                try:
+                    yield self._stat(name)
+                except FileNotFoundError:
+                    continue
+
+    async def presign(self, name: str) -> Optional[str]:
+        return None
+
+    def local_path(self, name: str) -> Optional[str]:
+        return str(self._path(name))
@@ -0,0 +1,25 @@
+import jinja2
+from jinja2 import FileSystemBytecodeCache
+
+from easypub import metrics
+
+
+class Template(jinja2.Template):
+    """
+    Template which records the time spent rendering it.
+    """
+
+    def render(self, *args, **kwargs):
+        with metrics.timed("template", self.name or "string"):
+            return super().render(*args, **kwargs)
+
+
+class BytecodeCache(FileSystemBytecodeCache):
+    """
+    Bytecode cache keyed by template name only, so that it can be compiled in
+    another directory than it is used from, like a build directory. Entries of
+    outdated sources are still ignored thanks to their checksum.
+    """
+
+    def get_cache_key(self, name, filename=None):
+        return super().get_cache_key(name)
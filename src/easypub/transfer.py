@@ -0,0 +1,288 @@
+"""
+Export every publication to an archive and import it back, for backups and
+moving publications between deployments.
+
+The archive is gzip compressed json lines, one publication per line, holding its
+slug, its metadata and its base64 encoded content. Content compressed with a
+zstd dictionary is written as gzip instead, so that archives can be imported
+without the dictionaries of the deployment they came from. Each batch is
+appended as a separate gzip member, so that the archive never has to be held in
+memory and an interrupted export can carry on where its last batch ended.
+"""
+
+import asyncio
+import base64
+import gzip
+import itertools
+import json
+import logging
+import os
+from dataclasses import asdict, dataclass
+from pathlib import Path
+from typing import (
+    AsyncIterable,
+    AsyncIterator,
+    Awaitable,
+    Callable,
+    Iterable,
+    Optional,
+    TypeVar,
+    Union,
+)
+
+from easypub import config, encoding
+from easypub.content import (
+    INLINE_FIELD,
+    PENDING_FIELD,
+    get_content,
+    metadata_key,
+    put_object,
+    reserve_metadata,
+    should_inline,
+)
+from easypub.dictionaries import decode_content, uses_dictionary
+from easypub.endpoints import content_metadata
+from easypub.storage import ObjectNotFound
+
+logger = logging.getLogger(__name__)
+
+T = TypeVar("T")
+R = TypeVar("R")
+
+
+@dataclass
+class Checkpoint:
+    """
+    Progress of an export or import, saved next to its archive after every
+    batch and removed once it completes.
+    """
+
+    path: Path
+    # The SCAN cursor of an export, or the number of lines read by an import.
+    position: int = 0
+    # Bytes of the archive written by an export up to the last batch.
+    size: int = 0
+    transferred: int = 0
+    skipped: int = 0
+
+    @classmethod
+    def for_archive(cls, archive: Path, suffix: str) -> "Checkpoint":
+        path = archive.with_name(f"{archive.name}.{suffix}")
+
+        if not path.exists():
+            return cls(path)
+
+        with open(path) as f:
+            return cls(path, **json.load(f))
+
+    @property
+    def exists(self) -> bool:
+        return self.path.exists()
+
+    def save(self) -> None:
+        state = asdict(self)
+        del state["path"]
+
+        # Replace the previous checkpoint in one step, an interruption while
+        # writing must not lose it.
+        temporary = self.path.with_name(f"{self.path.name}.tmp")
+        with open(temporary, "w") as f:
+            json.dump(state, f)
+        os.replace(temporary, self.path)
+
+    def remove(self) -> None:
+        self.path.unlink(missing_ok=True)
+
+
+async def _aiter(items: Iterable[T]) -> AsyncIterator[T]:
+    for item in items:
+        yield item
+
+
+async def bounded(
+    func: Callable[[T], Awaitable[R]],
+    items: Union[Iterable[T], AsyncIterable[T]],
+    concurrency: int,
+) -> AsyncIterator[R]:
+    """
+    Yield the result of func for every item in completion order, running at
+    most concurrency calls at once and taking items only as calls finish.
+    """
+    if not isinstance(items, AsyncIterable):
+        items = _aiter(items)
+
+    pending: set[asyncio.Future] = set()
+
+    try:
+        async for item in items:
+            if len(pending) >= concurrency:
+                done, pending = await asyncio.wait(
+                    pending, return_when=asyncio.FIRST_COMPLETED
+                )
+                for task in done:
+                    yield task.result()
+
+            pending.add(asyncio.ensure_future(func(item)))
+
+        while pending:
+            done, pending = await asyncio.wait(
+                pending, return_when=asyncio.FIRST_COMPLETED
+            )
+            for task in done:
+                yield task.result()
+    finally:
+        for task in pending:
+            task.cancel()
+
+
+async def _export_record(item: tuple[bytes, dict[bytes, bytes]]) -> Optional[dict]:
+    key, metadata = item
+    slug = key.decode().removeprefix("metadata:")
+
+    # Deleted since the keys were scanned.
+    if not metadata:
+        return None
+
+    try:
+        encoded_content = await get_content(slug, metadata)
+    except ObjectNotFound:
+        logger.warning("skipping %s, its content is missing", slug)
+        return None
+
+    # Where the content is kept is decided again on import.
+    fields = {INLINE_FIELD.encode(), PENDING_FIELD.encode()}
+
+    if uses_dictionary(metadata):
+        try:
+            content = await decode_content(encoded_content)
+        except LookupError:
+            logger.warning("skipping %s, its dictionary is missing", slug)
+            return None
+
+        # The etag and size describe the stored content, the publication was
+        # not modified though.
+        encoded_content = encoding.compress(content)
+        rebuilt = content_metadata(encoded_content)
+        del rebuilt["modified"]
+
+        metadata = {
+            **metadata,
+            **{field.encode(): value.encode() for field, value in rebuilt.items()},
+        }
+        fields.add(b"dictionary")
+
+    return {
+        "slug": slug,
+        "metadata": {
+            field.decode(): value.decode()
+            for field, value in metadata.items()
+            if field not in fields
+        },
+        "content": base64.b64encode(encoded_content).decode(),
+    }
+
+
+async def export_archive(
+    archive: Path, concurrency: int = 16, batch_size: int = 1000
+) -> Checkpoint:
+    """
+    Write every publication to archive, fetching up to concurrency objects from
+    S3 at once, and resume the export of a previous call that was interrupted.
+    """
+    checkpoint = Checkpoint.for_archive(archive, "export")
+
+    if checkpoint.exists:
+        # Drop whatever the interrupted export wrote after its last batch.
+        with open(archive, "ab") as f:
+            f.truncate(checkpoint.size)
+    elif archive.exists():
+        raise FileExistsError(f"{archive} already exists")
+    else:
+        archive.touch()
+        checkpoint.save()
+
+    while True:
+        cursor, keys = await config.redis.scan(
+            checkpoint.position, match="metadata:*", count=batch_size
+        )
+
+        if keys:
+            pipeline = config.redis.pipeline(transaction=False)
+            for key in keys:
+                pipeline.hgetall(key)
+            items = zip(keys, await pipeline.execute())
+
+            with gzip.open(archive, "at", encoding="utf-8") as f:
+                async for record in bounded(_export_record, items, concurrency):
+                    if record is None:
+                        checkpoint.skipped += 1
+                    else:
+                        f.write(json.dumps(record) + "\n")
+                        checkpoint.transferred += 1
+
+        if cursor == 0:
+            break
+
+        checkpoint.position = cursor
+        checkpoint.size = archive.stat().st_size
+        checkpoint.save()
+
+    checkpoint.remove()
+    return checkpoint
+
+
+async def _import_record(line: str) -> bool:
+    record = json.loads(line)
+    slug = record["slug"]
+    encoded_content = base64.b64decode(record["content"])
+    mapping = record["metadata"]
+
+    inline = should_inline(encoded_content)
+    if inline:
+        mapping[INLINE_FIELD] = encoded_content
+
+    if not await reserve_metadata(slug, mapping):
+        return False
+
+    if not inline:
+        try:
+            await put_object(slug, encoded_content)
+        except BaseException:
+            await config.redis.delete(metadata_key(slug))
+            raise
+
+    return True
+
+
+async def import_archive(
+    archive: Path, concurrency: int = 16, batch_size: int = 1000
+) -> Checkpoint:
+    """
+    Create every publication of archive whose slug is not taken yet, uploading
+    up to concurrency objects to S3 at once, and resume the import of a
+    previous call that was interrupted.
+    """
+    checkpoint = Checkpoint.for_archive(archive, "import")
+
+    with gzip.open(archive, "rt", encoding="utf-8") as f:
+        lines = itertools.islice(f, checkpoint.position, None)
+
+        while True:
+            batch = itertools.islice(lines, batch_size)
+            count = 0
+
+            async for imported in bounded(_import_record, batch, concurrency):
+                count += 1
+                if imported:
+                    checkpoint.transferred += 1
+                else:
+                    checkpoint.skipped += 1
+
+            if not count:
+                break
+
+            checkpoint.position += count
+            checkpoint.save()
+
+    checkpoint.remove()
+    return checkpoint
@@ -0,0 +1,173 @@
+"""
+Upload content queued by publishes and updates in write-behind mode.
+
+With WRITE_BEHIND set, content which is not kept inline is added to a redis
+stream instead of being uploaded while the request waits. The metadata points
+at the stream entry until the upload finishes, and reads are served from it
+meanwhile. The worker reads the stream through a consumer group, so entries a
+worker took but did not upload, because it stopped or the storage kept
+failing, are claimed again once they have been idle for a while.
+
+A worker runs the uploads of one publication in the order they were queued.
+Workers do not coordinate with each other, an older upload could finish after
+a newer one taken by another worker, so only a single worker should be run.
+"""
+
+import asyncio
+import logging
+import random
+from itertools import groupby
+from typing import AsyncIterator, Optional
+
+from easypub import config
+from easypub.content import PENDING_FIELD, UPLOAD_STREAM, metadata_key, put_object
+
+logger = logging.getLogger(__name__)
+
+GROUP = "uploaders"
+
+# Longest wait between two attempts of an upload, in seconds.
+MAX_BACKOFF = 30
+
+# Point the metadata at the uploaded content, unless the publication was
+# updated or deleted since the entry was queued.
+FINISH_SCRIPT = """
+if redis.call("hget", KEYS[1], "pending") ~= ARGV[1] then
+    return 0
+end
+
+return redis.call("hdel", KEYS[1], "pending")
+"""
+
+
+async def create_group() -> None:
+    from redis.exceptions import ResponseError
+
+    try:
+        await config.redis.xgroup_create(UPLOAD_STREAM, GROUP, id="0", mkstream=True)
+    except ResponseError as error:
+        if "BUSYGROUP" not in str(error):
+            raise
+
+
+async def upload(entry_id: bytes, fields: dict[bytes, bytes]) -> bool:
+    """
+    Upload the content of an entry and return whether it was still current.
+    """
+    slug = fields[b"slug"].decode()
+    key = metadata_key(slug)
+
+    if await config.redis.hget(key, PENDING_FIELD) != entry_id:
+        return False
+
+    await put_object(slug, fields[b"content"])
+
+    script = config.redis.register_script(FINISH_SCRIPT)
+    return bool(await script(keys=[key], args=[entry_id]))
+
+
+async def process(
+    entry_id: bytes, fields: Optional[dict[bytes, bytes]], attempts: int, backoff: float
+) -> Optional[bool]:
+    """
+    Upload an entry, trying up to attempts times with exponential backoff, and
+    remove it from the stream. Returns whether the content was uploaded, or None
+    if every attempt failed and the entry was left to be claimed again.
+    """
+    delay = backoff
+
+    for attempt in range(1, attempts + 1):
+        try:
+            # Entries removed while they were waiting to be acknowledged.
+            uploaded = fields is not None and await upload(entry_id, fields)
+        except Exception:
+            if attempt == attempts:
+                logger.exception("upload of %s failed, giving up for now", entry_id)
+                return None
+
+            logger.warning("upload of %s failed, retrying", entry_id, exc_info=True)
+            await asyncio.sleep(delay * random.uniform(0.5, 1.5))
+            delay = min(delay * 2, MAX_BACKOFF)
+        else:
+            await config.redis.xack(UPLOAD_STREAM, GROUP, entry_id)
+            await config.redis.xdel(UPLOAD_STREAM, entry_id)
+            return uploaded
+
+    return None
+
+
+async def consume(
+    consumer: str,
+    count: int = 16,
+    attempts: int = 5,
+    backoff: float = 0.5,
+    claim_idle: float = 60,
+    block: Optional[float] = None,
+) -> list[tuple[bytes, Optional[bool]]]:
+    """
+    Process up to count entries at once, preferring entries which were idle for
+    claim_idle seconds over new ones, waiting up to block seconds for new ones
+    when there are none. Returns every entry id along with whether it was
+    uploaded, skipped because it was superseded, or failed (None).
+    """
+    _, claimed, *_ = await config.redis.xautoclaim(
+        UPLOAD_STREAM, GROUP, consumer, int(claim_idle * 1000), count=count
+    )
+
+    # Redis before 7 claims entries which were deleted meanwhile as nil.
+    entries = [entry for entry in claimed if entry[0] is not None]
+
+    if not entries:
+        response = await config.redis.xreadgroup(
+            GROUP,
+            consumer,
+            {UPLOAD_STREAM: ">"},
+            count=count,
+            block=None if block is None else int(block * 1000),
+        )
+        entries = response[0][1] if response else []
+
+    async def process_all(group) -> list[tuple[bytes, Optional[bool]]]:
+        # Uploads of the same publication run in the order they were queued,
+        # so that an older upload never finishes after a newer one.
+        return [
+            (entry_id, await process(entry_id, fields, attempts, backoff))
+            for entry_id, fields in group
+        ]
+
+    def slug(entry):
+        return entry[1][b"slug"] if entry[1] else b""
+
+    groups = groupby(sorted(entries, key=slug), key=slug)
+    results = await asyncio.gather(*(process_all(list(group)) for _, group in groups))
+
+    return [result for group in results for result in group]
+
+
+async def run_worker(
+    consumer: str,
+    count: int = 16,
+    attempts: int = 5,
+    backoff: float = 0.5,
+    claim_idle: float = 60,
+) -> AsyncIterator[tuple[bytes, Optional[bool]]]:
+    """
+    Process entries until cancelled, yielding the results of consume.
+    """
+    await create_group()
+
+    # Reads which block for longer than the socket timeout of the pool fail.
+    block = min(5, config.redis_timeout / 2)
+
+    while True:
+        try:
+            results = await consume(
+                consumer, count, attempts, backoff, claim_idle, block=block
+            )
+        except Exception:
+            logger.exception("reading queued uploads failed, retrying")
+            await asyncio.sleep(MAX_BACKOFF)
+            continue
+
+        for result in results:
+            yield result
@@ -1,10 +1,13 @@
 class MockS3Response:
-    def __init__(self, text, status):
-        self._text = text
+    def __init__(self, body, status):
+        self._body = body
         self.status = status
 
+    async def read(self):
+        return self._body
+
     async def text(self):
-        return self._text
+        return self._body.decode()
 
     async def __aexit__(self, exc_type, exc, tb):
         pass
@@ -1,6 +1,14 @@
+from unittest.mock import patch
+
 import pytest
 
-from easypub.caching import build_cache_control, duration_to_seconds
+from easypub.caching import (
+    LRUCache,
+    build_cache_control,
+    build_validators,
+    duration_to_seconds,
+    is_not_modified,
+)
 
 
 @pytest.mark.parametrize(
@@ -32,3 +40,88 @@ def test_duration_to_seconds(value, expected):
 )
 def test_build_cache_control(options, expected):
     assert build_cache_control(**options) == expected
+
+
+def test_build_validators():
+    assert build_validators(etag="abc", modified=1668000000) == {
+        "ETag": 'W/"abc"',
+        "Last-Modified": "Wed, 09 Nov 2022 13:20:00 GMT",
+    }
+    assert build_validators() == {}
+
+
+@pytest.mark.parametrize(
+    "headers, expected",
+    [
+        ({}, False),
+        ({"if-none-match": "*"}, True),
+        ({"if-none-match": '"abc"'}, True),
+        ({"if-none-match": 'W/"abc"'}, True),
+        ({"if-none-match": '"xyz", W/"abc"'}, True),
+        ({"if-none-match": '"xyz"'}, False),
+        ({"if-modified-since": "Wed, 09 Nov 2022 13:20:00 GMT"}, True),
+        ({"if-modified-since": "Wed, 09 Nov 2022 13:19:59 GMT"}, False),
+        ({"if-modified-since": "garbage"}, False),
+        (
+            {
+                "if-none-match": '"xyz"',
+                "if-modified-since": "Wed, 09 Nov 2022 13:20:00 GMT",
+            },
+            False,
+        ),
+    ],
+)
+def test_is_not_modified(headers, expected):
+    validators = build_validators(etag="abc", modified=1668000000)
+    assert is_not_modified(headers, validators) is expected
+
+
+class TestLRUCache:
+    def test_hit_and_miss(self):
+        cache = LRUCache(maxsize=2, ttl=60)
+
+        assert cache.get("a") is None
+
+        cache.set("a", 1)
+
+        assert cache.get("a") == 1
+        assert cache.stats == {"hits": 1, "misses": 1, "size": 1, "maxsize": 2}
+
+    def test_evicts_least_recently_used(self):
+        cache = LRUCache(maxsize=2, ttl=60)
+
+        cache.set("a", 1)
+        cache.set("b", 2)
+        cache.get("a")
+        cache.set("c", 3)
+
+        assert cache.get("a") == 1
+        assert cache.get("b") is None
+        assert cache.get("c") == 3
+
+    def test_expires(self):
+        cache = LRUCache(maxsize=2, ttl=60)
+
+        with patch("easypub.caching.time.monotonic", return_value=0):
+            cache.set("a", 1)
+
+        with patch("easypub.caching.time.monotonic", return_value=60):
+            assert cache.get("a") is None
+
+        assert len(cache) == 0
+
+    def test_delete(self):
+        cache = LRUCache(maxsize=2, ttl=60)
+
+        cache.set("a", 1)
+        cache.delete("a")
+        cache.delete("missing")
+
+        assert cache.get("a") is None
+
+    def test_disabled(self):
+        cache = LRUCache(maxsize=0, ttl=60)
+
+        cache.set("a", 1)
+
+        assert cache.get("a") is None
@@ -0,0 +1,114 @@
+import asyncio
+from unittest.mock import AsyncMock, patch
+
+import pytest
+
+from easypub import content
+from easypub.coalescing import SingleFlight
+
+from . import mocks
+
+
+async def test_shares_call():
+    calls = []
+
+    async def fetch(value):
+        calls.append(value)
+        await asyncio.sleep(0.01)
+        return value
+
+    flight = SingleFlight("test")
+    results = await asyncio.gather(*(flight("key", fetch, i) for i in range(3)))
+
+    assert results == [0, 0, 0]
+    assert calls == [0]
+    assert flight.calls == {}
+
+    assert await flight("key", fetch, 3) == 3
+
+
+async def test_shares_error():
+    async def fail():
+        await asyncio.sleep(0.01)
+        raise KeyError
+
+    flight = SingleFlight("test")
+    results = await asyncio.gather(
+        flight("key", fail), flight("key", fail), return_exceptions=True
+    )
+
+    assert [type(result) for result in results] == [KeyError, KeyError]
+
+
+async def test_cancelled_caller():
+    async def fetch():
+        await asyncio.sleep(0.01)
+        return "value"
+
+    flight = SingleFlight("test")
+    first = asyncio.create_task(flight("key", fetch))
+    second = asyncio.create_task(flight("key", fetch))
+    await asyncio.sleep(0)
+
+    first.cancel()
+
+    assert await second == "value"
+    assert first.cancelled()
+
+
+class TestSharedObject:
+    @pytest.fixture
+    def redis(self, redis):
+        with patch.multiple(redis, get=AsyncMock(), set=AsyncMock()):
+            yield redis
+
+    async def test_fetches(self, redis, s3):
+        redis.set.return_value = True
+        s3.get_object.return_value = mocks.MockS3Response(b"content", 200)
+
+        assert await content.get_shared_object("slug", "etag") == b"content"
+
+        redis.set.assert_any_call("coalesce:slug:etag", b"content", px=5000)
+        redis.delete.assert_called_once_with("coalesce:slug:etag:lock")
+
+    async def test_waits(self, redis, s3):
+        redis.set.return_value = False
+        redis.get.side_effect = [None, b"content"]
+        redis.exists.return_value = True
+
+        assert await content.get_shared_object("slug", "etag") == b"content"
+
+        s3.get_object.assert_not_called()
+
+    async def test_fetches_when_abandoned(self, redis, s3):
+        redis.set.return_value = False
+        redis.get.return_value = None
+        redis.exists.return_value = False
+        s3.get_object.return_value = mocks.MockS3Response(b"content", 200)
+
+        assert await content.get_shared_object("slug", "etag") == b"content"
+
+
+async def test_versions_do_not_share_fetches(backends, config):
+    config.coalesce_reads = "local"
+    redis, s3 = backends
+    s3.objects["slug"] = b"old"
+    fetched = asyncio.Event()
+    get_object = s3.get_object
+
+    async def slow(*args):
+        response = await get_object(*args)
+        fetched.set()
+        await asyncio.sleep(0.01)
+        return response
+
+    with patch.object(s3, "get_object", slow):
+        # Fetched before the update, by a speculative read without an etag.
+        before = asyncio.create_task(content.fetch_object("slug"))
+        await fetched.wait()
+
+        s3.objects["slug"] = b"new"
+        after = await content.fetch_object("slug", "etag-of-new")
+
+    assert await before == b"old"
+    assert after == b"new"
@@ -0,0 +1,31 @@
+import asyncio
+
+import pytest
+
+from easypub import deadlines
+
+
+async def test_without_deadline():
+    assert deadlines.remaining() is None
+    assert await deadlines.wait(asyncio.sleep(0, "result")) == "result"
+
+
+async def test_within_deadline():
+    token = deadlines.deadline.set(asyncio.get_running_loop().time() + 1)
+
+    try:
+        assert 0 < deadlines.remaining() <= 1
+        assert await deadlines.wait(asyncio.sleep(0, "result")) == "result"
+    finally:
+        deadlines.deadline.reset(token)
+
+
+@pytest.mark.parametrize("timeout", [-1, 0.01])
+async def test_past_deadline(timeout):
+    token = deadlines.deadline.set(asyncio.get_running_loop().time() + timeout)
+
+    try:
+        with pytest.raises(asyncio.TimeoutError):
+            await deadlines.wait(asyncio.sleep(1))
+    finally:
+        deadlines.deadline.reset(token)
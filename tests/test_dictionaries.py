@@ -0,0 +1,118 @@
+import gzip
+
+import pytest
+
+from benchmarks import fakes
+from easypub import dictionaries, encoding
+from easypub.content import metadata_key
+
+SAMPLES = [
+    (
+        f'<h1 class="ql-align-center">Publication {i}</h1>'
+        f"<p>Paragraph {i} of a <strong>publication</strong> about {i * 7}.</p>"
+        f'<ul><li class="ql-indent-1">Item {i}</li><li>Item {i + 1}</li></ul>'
+    ).encode()
+    for i in range(200)
+]
+
+
+@pytest.fixture(scope="module")
+def dictionary():
+    return dictionaries.train(SAMPLES, size=4096)
+
+
+@pytest.fixture
+def redis(config, monkeypatch):
+    monkeypatch.setattr(dictionaries, "_compressors", {})
+    monkeypatch.setattr(dictionaries, "_decompressors", {})
+    config.redis = fakes.FakeRedis()
+    return config.redis
+
+
+async def collect(generator):
+    return [item async for item in generator]
+
+
+async def chunked(data, size):
+    for start in range(0, len(data), size):
+        end = start + size
+        yield data[start:end]
+
+
+async def test_round_trip(config, redis, dictionary):
+    config.storage_dictionary = await dictionaries.store_dictionary(dictionary)
+    content = b"<p>Paragraph 1000 of a <strong>publication</strong></p>"
+
+    encoded_content, codec = await dictionaries.encode_content(content)
+
+    assert codec == {
+        "codec": dictionaries.DICTIONARY_CODEC,
+        "dictionary": config.storage_dictionary,
+    }
+    assert len(encoded_content) < len(encoding.compress(content))
+    assert not encoding.is_gzip(encoded_content)
+
+    # Decoded by a worker which has not loaded the dictionary yet.
+    dictionaries._decompressors.clear()
+    assert await dictionaries.decode_content(encoded_content) == content
+
+
+async def test_without_dictionary(config, redis):
+    config.storage_dictionary = ""
+
+    encoded_content, codec = await dictionaries.encode_content(b"<p>test</p>")
+
+    assert codec == {"codec": encoding.SPLICEABLE_CODEC}
+    assert await dictionaries.decode_content(encoded_content) == b"<p>test</p>"
+
+
+async def test_decode_legacy_gzip(redis):
+    encoded_content = gzip.compress(b"<p>test</p>")
+
+    assert await dictionaries.decode_content(encoded_content) == b"<p>test</p>"
+
+
+@pytest.mark.parametrize("size", [1, 7, 4096])
+async def test_decode_stream(config, redis, dictionary, size):
+    config.storage_dictionary = await dictionaries.store_dictionary(dictionary)
+    content = b"".join(SAMPLES[:20])
+    encoded_content, _ = await dictionaries.encode_content(content)
+
+    chunks = await collect(dictionaries.decode_stream(chunked(encoded_content, size)))
+
+    assert b"".join(chunks) == content
+
+
+async def test_decode_stream_gzip(redis):
+    chunks = chunked(encoding.compress(b"<p>test</p>"), 3)
+
+    assert b"".join(await collect(dictionaries.decode_stream(chunks))) == b"<p>test</p>"
+
+
+async def test_missing_dictionary(config, redis, dictionary):
+    config.storage_dictionary = await dictionaries.store_dictionary(dictionary)
+    encoded_content, _ = await dictionaries.encode_content(b"<p>test</p>")
+    redis.data.clear()
+    dictionaries._decompressors.clear()
+
+    with pytest.raises(LookupError):
+        await dictionaries.decode_content(encoded_content)
+
+
+async def test_store_dictionary_is_idempotent(redis, dictionary):
+    first = await dictionaries.store_dictionary(dictionary)
+
+    assert await dictionaries.store_dictionary(dictionary) == first
+    assert redis.data == {dictionaries.dictionary_key(first): dictionary}
+
+
+async def test_collect_samples(config, redis):
+    config.s3 = fakes.FakeS3()
+    await redis.hset(metadata_key("inline"), mapping={"content": gzip.compress(b"a")})
+    await redis.hset(metadata_key("stored"), mapping={"title": "stored"})
+    await redis.hset(metadata_key("missing"), mapping={"title": "missing"})
+    config.s3.objects["stored"] = gzip.compress(b"b" * 10)
+
+    samples = await dictionaries.collect_samples(10, max_size=4)
+
+    assert sorted(samples) == [b"a", b"bbbb"]
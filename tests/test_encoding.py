@@ -0,0 +1,115 @@
+import gzip
+import os
+import zlib
+
+import brotli
+import pytest
+import zstandard
+
+from easypub.encoding import (
+    COMPRESSORS,
+    compress,
+    compress_as,
+    crc32_combine,
+    decompress_stream,
+    negotiate,
+    splice,
+    splice_stream,
+)
+
+
+async def chunked(data, size):
+    for start in range(0, len(data), size):
+        end = start + size
+        yield data[start:end]
+
+
+async def collect(stream):
+    return [chunk async for chunk in stream]
+
+
+@pytest.mark.parametrize("length", [0, 1, 7, 1024, 100_000])
+def test_crc32_combine(length):
+    a, b = os.urandom(13), os.urandom(length)
+    assert crc32_combine(zlib.crc32(a), zlib.crc32(b), len(b)) == zlib.crc32(a + b)
+
+
+@pytest.mark.parametrize("content", [b"", b"<p>hi</p>", b"<p>hi</p>" * 10_000])
+def test_compress(content):
+    assert gzip.decompress(compress(content)) == content
+
+
+@pytest.mark.parametrize("content", [b"", b"<p>hi</p>", b"<p>hi</p>" * 10_000])
+def test_splice(content):
+    spliced = splice(b"<html>", compress(content), b"</html>")
+
+    # The result must be a single gzip member, readers like chrome ignore any
+    # data after the first member.
+    decompressor = zlib.decompressobj(31)
+    assert decompressor.decompress(spliced) == b"<html>" + content + b"</html>"
+    assert decompressor.eof
+    assert not decompressor.unused_data
+
+
+@pytest.mark.parametrize(
+    "member", [b"", b"<p>hi</p>", gzip.compress(b"<p>hi</p>" * 50)]
+)
+def test_splice_rejects_foreign_members(member):
+    with pytest.raises(ValueError):
+        splice(b"<html>", member, b"</html>")
+
+
+@pytest.mark.parametrize("size", [1, 3, 10, 11, 4096])
+async def test_splice_stream(size):
+    content = os.urandom(2048).hex().encode()
+    member = compress(content)
+
+    chunks = await collect(splice_stream(b"<html>", chunked(member, size), b"</html>"))
+
+    assert b"".join(chunks) == splice(b"<html>", member, b"</html>")
+
+
+async def test_splice_stream_rejects_foreign_members():
+    with pytest.raises(ValueError):
+        await collect(splice_stream(b"<html>", chunked(b"<p>hi</p>", 2), b"</html>"))
+
+
+async def test_decompress_stream_bounded():
+    content = b"<p></p>" * 100_000
+    chunks = await collect(decompress_stream(chunked(compress(content), 4096), 1024))
+
+    assert b"".join(chunks) == content
+    assert max(map(len, chunks)) <= 1024
+
+
+@pytest.mark.parametrize(
+    "header, expected",
+    [
+        ("gzip, deflate, br", "br"),
+        ("gzip", "gzip"),
+        ("br;q=0, gzip;q=0.5", "gzip"),
+        ("BR", "br"),
+        ("*", "br"),
+        ("*;q=0, gzip", "gzip"),
+        ("identity", None),
+        ("", None),
+        ("br;q=oops, gzip", "gzip"),
+    ],
+)
+def test_negotiate(header, expected):
+    assert negotiate(header, ["br", "gzip"]) == expected
+
+
+DECOMPRESS = {
+    "br": brotli.decompress,
+    "zstd": lambda data: zstandard.ZstdDecompressor().decompressobj().decompress(data),
+    "gzip": gzip.decompress,
+}
+
+
+@pytest.mark.parametrize("coding", COMPRESSORS)
+def test_compress_as(coding):
+    data = b"<p>hello</p>" * 100
+
+    assert DECOMPRESS[coding](compress_as(coding, data)) == data
+    assert DECOMPRESS[coding](compress_as(coding, data, level=1)) == data
@@ -1,15 +1,23 @@
+import gzip
+import hashlib
 from copy import deepcopy
 from http import HTTPStatus
+from unittest.mock import AsyncMock
 
+import brotli
 import pytest
 
 from starlette.exceptions import HTTPException
-from starlette.requests import Request
 from starlette.routing import Router
 from starlette.testclient import TestClient
 
-from easypub.endpoints import crypt_context
+from easypub import dictionaries, encoding
+from easypub.caching import LRUCache
+from easypub.crypto import get_crypt_context
+from easypub.pages import invalidate_page
 from easypub.routes import routes
+from easypub.stats import counters
+from easypub.storage import FileSystemStorage
 
 from . import mocks
 
@@ -19,10 +27,32 @@ def app():
     return Router(routes=routes)
 
 
+@pytest.fixture
+def dictionary(monkeypatch):
+    """
+    Compress content with a zstd dictionary already loaded by the worker.
+    """
+    import zstandard
+
+    samples = [f"<p>Paragraph {i} of a publication.</p>".encode() for i in range(100)]
+    data = zstandard.train_dictionary(1024, samples)
+    dictionary_id = str(data.dict_id())
+
+    monkeypatch.setattr(
+        dictionaries,
+        "_decompressors",
+        {dictionary_id: zstandard.ZstdDecompressor(dict_data=data)},
+    )
+
+    return zstandard.ZstdCompressor(dict_data=data).compress
+
+
 @pytest.fixture
 def client(config, app):
     config.templates = deepcopy(config.templates)
     config.templates.env.globals["static_url_for"] = lambda name, path: path
+    config.build_version = "build"
+    config.build_modified = 0
     return TestClient(app)
 
 
@@ -39,20 +69,457 @@ class TestReadEndpoint:
 
     def test_read(self, client, redis, s3):
         redis.hgetall.return_value = {b"secret_hash": b"s", b"title": b"Test"}
-        s3.get_object.return_value = mocks.MockS3Response(text="c", status=200)
+        s3.get_object.return_value = mocks.MockS3Response(
+            body=gzip.compress(b"c"), status=200
+        )
+
+        response = client.get("/test")
+
+        assert response.status_code == HTTPStatus.OK
+        assert response.headers["content-encoding"] == "gzip"
+        assert '<div class="ql-editor">c</div>' in response.text
+        assert "<title>Test</title>" in response.text
+
+    def test_read_cached(self, client, config, redis, s3):
+        config.page_cache = LRUCache(maxsize=1, ttl=60)
+        redis.hgetall.return_value = {b"secret_hash": b"s", b"title": b"Test"}
+        s3.get_object.return_value = mocks.MockS3Response(
+            body=gzip.compress(b"c"), status=200
+        )
+
+        first = client.get("/test")
+        second = client.get("/test")
+
+        # Content without a codec is rendered once, and cached all the same.
+        assert second.content == first.content
+        s3.get_object.assert_awaited_once()
+
+    def test_read_spliced(self, client, redis, s3):
+        redis.hgetall.return_value = {
+            b"codec": b"gzip+flush",
+            b"secret_hash": b"s",
+            b"title": b"Test",
+        }
+        s3.get_object.return_value = mocks.MockS3Response(
+            body=encoding.compress(b"<p>spliced</p>"), status=200
+        )
+
+        response = client.get("/test", headers={"Accept-Encoding": "gzip"})
+
+        assert response.status_code == HTTPStatus.OK
+        assert response.headers["content-encoding"] == "gzip"
+        assert response.headers["vary"] == "Accept-Encoding"
+        assert '<div class="ql-editor"><p>spliced</p></div>' in response.text
+        assert "<title>Test</title>" in response.text
+
+    def test_read_brotli(self, client, config, redis, s3):
+        config.page_cache = LRUCache(maxsize=1, ttl=60)
+        redis.hgetall.return_value = {
+            b"codec": b"gzip+flush",
+            b"secret_hash": b"s",
+            b"title": b"Test",
+        }
+        s3.get_object.return_value = mocks.MockS3Response(
+            body=encoding.compress(b"<p>spliced</p>"), status=200
+        )
+
+        response = client.get("/test", headers={"Accept-Encoding": "gzip, br"})
+
+        # Pages are not recompressed for clients which accept gzip.
+        assert response.headers["content-encoding"] == "gzip"
+        assert '<div class="ql-editor"><p>spliced</p></div>' in response.text
+
+        page, _ = config.page_cache.get("test")
+        page["br"] = brotli.compress(gzip.decompress(page["gzip"]))
+
+        response = client.get("/test", headers={"Accept-Encoding": "gzip, br"})
+
+        assert response.headers["content-encoding"] == "br"
+        assert '<div class="ql-editor"><p>spliced</p></div>' in response.text
+
+    def test_read_brotli_only(self, client, redis, s3):
+        redis.hgetall.return_value = {
+            b"codec": b"gzip+flush",
+            b"secret_hash": b"s",
+            b"title": b"Test",
+        }
+        s3.get_object.return_value = mocks.MockS3Response(
+            body=encoding.compress(b"<p>spliced</p>"), status=200
+        )
+
+        response = client.get("/test", headers={"Accept-Encoding": "br"})
+
+        assert response.headers["content-encoding"] == "br"
+        assert '<div class="ql-editor"><p>spliced</p></div>' in response.text
+
+    def test_read_spliced_identity(self, client, redis, s3):
+        redis.hgetall.return_value = {
+            b"codec": b"gzip+flush",
+            b"secret_hash": b"s",
+            b"title": b"Test",
+        }
+        s3.get_object.return_value = mocks.MockS3Response(
+            body=encoding.compress(b"<p>spliced</p>"), status=200
+        )
+
+        response = client.get("/test", headers={"Accept-Encoding": "identity"})
+
+        assert response.status_code == HTTPStatus.OK
+        assert "content-encoding" not in response.headers
+        assert '<div class="ql-editor"><p>spliced</p></div>' in response.text
+
+    def test_read_dictionary(self, client, redis, s3, dictionary):
+        redis.hgetall.return_value = {
+            b"codec": b"zstd+dict",
+            b"secret_hash": b"s",
+            b"title": b"Test",
+        }
+        s3.get_object.return_value = mocks.MockS3Response(
+            body=dictionary(b"<p>Paragraph 100 of a publication.</p>"), status=200
+        )
+
+        response = client.get("/test", headers={"Accept-Encoding": "gzip"})
+
+        assert response.status_code == HTTPStatus.OK
+        assert response.headers["content-encoding"] == "gzip"
+        assert "<p>Paragraph 100 of a publication.</p>" in response.text
+
+    def test_read_pending(self, client, config, monkeypatch, redis, s3):
+        config.speculative_reads = True
+        redis.hgetall.return_value = {
+            b"codec": b"gzip+flush",
+            b"pending": b"1-0",
+            b"secret_hash": b"s",
+            b"title": b"Test",
+        }
+        xrange = AsyncMock(
+            return_value=[(b"1-0", {b"content": encoding.compress(b"<p>queued</p>")})]
+        )
+        monkeypatch.setattr(config.redis, "xrange", xrange)
+
+        response = client.get("/test", headers={"Accept-Encoding": "gzip"})
+
+        assert response.status_code == HTTPStatus.OK
+        assert '<div class="ql-editor"><p>queued</p></div>' in response.text
+        xrange.assert_awaited_once_with("uploads", b"1-0", b"1-0")
+
+    def test_validators(self, client, redis, s3):
+        redis.hgetall.return_value = {
+            b"etag": b"abc",
+            b"modified": b"1668000000",
+            b"secret_hash": b"s",
+            b"title": b"Test",
+        }
+        s3.get_object.return_value = mocks.MockS3Response(
+            body=gzip.compress(b"c"), status=200
+        )
+
+        response = client.get("/test")
+
+        assert response.status_code == HTTPStatus.OK
+        assert response.headers["etag"] == 'W/"abc-build"'
+        assert response.headers["last-modified"] == "Wed, 09 Nov 2022 13:20:00 GMT"
+
+    @pytest.mark.parametrize(
+        "headers",
+        [
+            {"If-None-Match": 'W/"abc-build"'},
+            {"If-None-Match": '"other", "abc-build"'},
+            {"If-Modified-Since": "Wed, 09 Nov 2022 13:20:00 GMT"},
+        ],
+    )
+    def test_not_modified(self, client, redis, s3, headers):
+        redis.hgetall.return_value = {
+            b"etag": b"abc",
+            b"modified": b"1668000000",
+            b"secret_hash": b"s",
+            b"title": b"Test",
+        }
+
+        response = client.get("/test", headers=headers)
+
+        assert response.status_code == HTTPStatus.NOT_MODIFIED
+        assert response.headers["etag"] == 'W/"abc-build"'
+
+        s3.get_object.assert_not_awaited()
+
+    def test_deploy_changes_validators(self, client, config, redis, s3):
+        redis.hgetall.return_value = {
+            b"etag": b"abc",
+            b"modified": b"1668000000",
+            b"secret_hash": b"s",
+            b"title": b"Test",
+        }
+        s3.get_object.return_value = mocks.MockS3Response(
+            body=gzip.compress(b"c"), status=200
+        )
+        config.build_version = "deployed"
+        config.build_modified = 1700000000
+
+        for headers in [
+            {"If-None-Match": 'W/"abc-build"'},
+            {"If-Modified-Since": "Wed, 09 Nov 2022 13:20:00 GMT"},
+        ]:
+            response = client.get("/test", headers=headers)
+
+            assert response.status_code == HTTPStatus.OK
+            assert response.headers["etag"] == 'W/"abc-deployed"'
+
+    def test_read_inline(self, client, redis, s3):
+        redis.hgetall.return_value = {
+            b"codec": b"gzip+flush",
+            b"content": encoding.compress(b"<p>inline</p>"),
+            b"secret_hash": b"s",
+            b"title": b"Test",
+        }
+
+        response = client.get("/test")
+
+        assert response.status_code == HTTPStatus.OK
+        assert "<p>inline</p>" in response.text
+
+        s3.get_object.assert_not_awaited()
+
+    @pytest.mark.parametrize(
+        "headers, codec",
+        [
+            ({}, b"gzip+flush"),
+            ({"Accept-Encoding": "identity"}, b"gzip+flush"),
+            ({"Accept-Encoding": "identity"}, b""),
+        ],
+    )
+    def test_stream(self, client, config, monkeypatch, redis, s3, headers, codec):
+        config.stream_threshold = 10
+
+        content = b"<p>streamed</p>" * 1000
+        member = encoding.compress(content)
+
+        async def stream_object(bucket_name, object_name, chunk_size=65536):
+            yield member[:100]
+            yield member[100:]
+
+        monkeypatch.setattr(config.s3, "stream_object", stream_object)
+
+        redis.hgetall.return_value = {
+            b"codec": codec,
+            b"secret_hash": b"s",
+            b"size": str(len(member)).encode(),
+            b"title": b"Test",
+        }
+
+        response = client.get("/test", headers=headers)
+
+        assert response.status_code == HTTPStatus.OK
+        assert f'<div class="ql-editor">{content.decode()}</div>' in response.text
+
+        s3.get_object.assert_not_awaited()
+
+    def test_updated_to_dictionary(self, client, redis, s3, dictionary):
+        # The content was replaced, but not the metadata yet.
+        redis.hgetall.return_value = {
+            b"codec": b"gzip+flush",
+            b"secret_hash": b"s",
+            b"title": b"Test",
+        }
+        s3.get_object.return_value = mocks.MockS3Response(
+            body=dictionary(b"<p>Paragraph 100 of a publication.</p>"), status=200
+        )
+
+        response = client.get("/test", headers={"Accept-Encoding": "gzip"})
+
+        assert response.status_code == HTTPStatus.OK
+        assert "<p>Paragraph 100 of a publication.</p>" in response.text
+
+    def test_stream_updated_to_dictionary(
+        self, client, config, monkeypatch, redis, s3, dictionary
+    ):
+        config.stream_threshold = 10
+        encoded_content = dictionary(b"<p>Paragraph 100 of a publication.</p>")
+
+        async def stream_object(bucket_name, object_name, chunk_size=65536):
+            yield encoded_content[:2]
+            yield encoded_content[2:]
+
+        monkeypatch.setattr(config.s3, "stream_object", stream_object)
+
+        redis.hgetall.return_value = {
+            b"codec": b"gzip+flush",
+            b"secret_hash": b"s",
+            b"size": str(len(encoded_content)).encode(),
+            b"title": b"Test",
+        }
+
+        response = client.get("/test", headers={"Accept-Encoding": "gzip"})
+
+        assert response.status_code == HTTPStatus.OK
+        assert "content-encoding" not in response.headers
+        assert "<p>Paragraph 100 of a publication.</p>" in response.text
+
+    def test_speculative(self, client, config, redis, s3):
+        config.speculative_reads = True
+
+        redis.hgetall.return_value = {b"secret_hash": b"s", b"title": b"Test"}
+        s3.get_object.return_value = mocks.MockS3Response(
+            body=gzip.compress(b"c"), status=200
+        )
 
         response = client.get("/test")
 
         assert response.status_code == HTTPStatus.OK
+        assert '<div class="ql-editor">c</div>' in response.text
+
+        s3.get_object.assert_awaited_once()
+
+    def test_speculative_outdated(self, client, config, redis, s3):
+        config.speculative_reads = True
+        new = gzip.compress(b"new")
+
+        redis.hgetall.return_value = {
+            b"etag": hashlib.sha256(new).hexdigest().encode(),
+            b"secret_hash": b"s",
+            b"title": b"Test",
+        }
+        # Updated after the speculative fetch read the object.
+        s3.get_object.side_effect = [
+            mocks.MockS3Response(body=gzip.compress(b"old"), status=200),
+            mocks.MockS3Response(body=new, status=200),
+        ]
+
+        response = client.get("/test")
+
+        assert '<div class="ql-editor">new</div>' in response.text
+
+    def test_speculative_not_found(self, client, config, redis, s3):
+        config.speculative_reads = True
+
+        redis.hgetall.return_value = {}
+        s3.get_object.side_effect = FileNotFoundError
+
+        wasted = counters["speculative_reads_wasted"]
+
+        with pytest.raises(HTTPException):
+            client.get("/test")
+
+        assert counters["speculative_reads_wasted"] == wasted + 1
+
+    def test_not_cached_when_invalidated(self, client, config, redis, s3):
+        config.page_cache = LRUCache(maxsize=1, ttl=60)
+        redis.hgetall.return_value = {
+            b"codec": b"gzip+flush",
+            b"secret_hash": b"s",
+            b"title": b"Test",
+        }
+
+        async def updated(*args):
+            # Updated after the metadata was read.
+            await invalidate_page("test")
+            return mocks.MockS3Response(body=encoding.compress(b"old"), status=200)
+
+        s3.get_object.side_effect = updated
+
+        response = client.get("/test")
+
+        assert '<div class="ql-editor">old</div>' in response.text
+        assert config.page_cache.get("test") is None
+
+    def test_cached(self, client, config, redis, s3):
+        config.page_cache = LRUCache(maxsize=1, ttl=60)
+
+        redis.hgetall.return_value = {
+            b"codec": b"gzip+flush",
+            b"secret_hash": b"s",
+            b"title": b"Test",
+        }
+        s3.get_object.return_value = mocks.MockS3Response(
+            body=encoding.compress(b"c"), status=200
+        )
+
+        first = client.get("/test")
+        second = client.get("/test")
+        identity = client.get("/test", headers={"Accept-Encoding": "identity"})
+
+        assert second.status_code == HTTPStatus.OK
+        assert second.content == first.content
+        assert identity.content == first.content
+
+        redis.hgetall.assert_awaited_once()
+        s3.get_object.assert_awaited_once()
+
+        assert config.page_cache.stats["hits"] == 2
+        assert config.page_cache.stats["misses"] == 1
+
+
+class TestAdminEndpoint:
+    METADATA = {
+        b"etag": b"abc",
+        b"modified": b"1668000000",
+        b"secret_hash": b"s",
+        b"title": b"Test",
+    }
+
+    def test_admin(self, client, redis, s3):
+        redis.hgetall.return_value = self.METADATA
+        s3.get_presigned_url.return_value = "http://storage/test"
+
+        response = client.get("/test/admin")
+
+        assert response.status_code == HTTPStatus.OK
+        assert response.context["content_url"] == "http://storage/test"
+        assert response.headers["etag"].startswith('W/"abc-build-')
+
+    def test_admin_inline(self, client, redis, s3):
+        redis.hgetall.return_value = self.METADATA | {b"content": b""}
+
+        response = client.get("/test/admin")
+
+        assert response.status_code == HTTPStatus.OK
+        assert response.context["content_url"] == "http://testserver/api/test/content"
+
+        s3.get_presigned_url.assert_not_awaited()
+
+    def test_admin_local(self, client, config, redis, tmp_path):
+        config.storage = FileSystemStorage(tmp_path)
+        redis.hgetall.return_value = self.METADATA
+
+        response = client.get("/test/admin")
+
+        assert response.context["content_url"] == "http://testserver/api/test/content"
 
-        assert isinstance(response.context["request"], Request)
-        assert response.context["title"] == "Test"
-        assert response.context["content"] == "c"
+    def test_admin_dictionary(self, client, redis, s3):
+        redis.hgetall.return_value = self.METADATA | {b"codec": b"zstd+dict"}
+
+        response = client.get("/test/admin")
+
+        assert response.context["content_url"] == "http://testserver/api/test/content"
+
+        s3.get_presigned_url.assert_not_awaited()
+
+    def test_not_modified(self, client, redis, s3):
+        redis.hgetall.return_value = self.METADATA
+        s3.get_presigned_url.return_value = "http://storage/test"
+
+        etag = client.get("/test/admin").headers["etag"]
+        response = client.get("/test/admin", headers={"If-None-Match": etag})
+
+        assert response.status_code == HTTPStatus.NOT_MODIFIED
+
+        s3.get_presigned_url.assert_awaited_once()
+
+    def test_stale_since_rotation(self, client, redis, s3):
+        redis.hgetall.return_value = self.METADATA
+        s3.get_presigned_url.return_value = "http://storage/test"
+
+        response = client.get(
+            "/test/admin",
+            headers={"If-Modified-Since": "Wed, 09 Nov 2022 13:20:00 GMT"},
+        )
+
+        assert response.status_code == HTTPStatus.OK
 
 
 class TestPublishEndpoint:
-    def test_not_unique(self, client, redis):
-        redis.exists.return_value = True
+    def test_not_unique(self, client, redis, s3):
+        redis.evalsha.return_value = 0
 
         response = client.post(
             "/api/publish", json={"title": "Test", "content": "<p>test</p>"}
@@ -62,24 +529,29 @@ class TestPublishEndpoint:
         data = response.json()
         assert data["title"] == ["is already being used"]
 
+        s3.put_object.assert_not_awaited()
+
     def test_publish(self, client, redis, s3):
-        redis.exists.return_value = False
+        redis.evalsha.return_value = 1
 
         response = client.post(
             "/api/publish", json={"title": "Test", "content": "<script>"}
         )
 
-        redis.hset.assert_awaited_once()
-        redis.hset.await_args.args == ["metadata:test"]
+        redis.evalsha.assert_awaited_once()
 
-        assert len(redis.hset.await_args.kwargs) == 1
-        assert "mapping" in redis.hset.await_args.kwargs
+        _, numkeys, key, *args = redis.evalsha.await_args.args
+        assert (numkeys, key) == (1, "metadata:test")
 
-        mapping = redis.hset.await_args.kwargs["mapping"]
+        mapping = dict(zip(args[::2], args[1::2]))
         assert isinstance(mapping["secret_hash"], str)
         assert mapping["title"] == "Test"
+        assert mapping["codec"] == "gzip+flush"
+        assert len(mapping["etag"]) == 64
+        assert int(mapping["modified"]) > 0
 
         s3.put_object.assert_awaited_once()
+        assert gzip.decompress(s3.put_object.await_args.args[2].read()) == b""
 
         assert response.status_code == HTTPStatus.OK
 
@@ -87,7 +559,51 @@ class TestPublishEndpoint:
         assert isinstance(data["secret"], str)
         assert isinstance(data["url"], str)
 
-        assert crypt_context.verify(data["secret"], mapping["secret_hash"])
+        assert get_crypt_context().verify(data["secret"], mapping["secret_hash"])
+
+    def test_publish_write_behind(self, client, config, redis, s3):
+        config.write_behind = True
+        redis.evalsha.return_value = b"1-0"
+
+        response = client.post(
+            "/api/publish", json={"title": "Test", "content": "<p>test</p>"}
+        )
+
+        assert response.status_code == HTTPStatus.OK
+
+        _, numkeys, *keys_and_args = redis.evalsha.await_args.args
+        assert numkeys == 2
+        assert keys_and_args[:4] == ["metadata:test", "uploads", "reserve", "test"]
+
+        s3.put_object.assert_not_awaited()
+        redis.delete.assert_not_awaited()
+
+    def test_publish_inline(self, client, config, redis, s3):
+        config.inline_content_size = 1024
+        redis.evalsha.return_value = 1
+
+        response = client.post(
+            "/api/publish", json={"title": "Test", "content": "<p>test</p>"}
+        )
+
+        assert response.status_code == HTTPStatus.OK
+
+        args = redis.evalsha.await_args.args[3:]
+        mapping = dict(zip(args[::2], args[1::2]))
+        assert gzip.decompress(mapping["content"]) == b"<p>test</p>"
+
+        s3.put_object.assert_not_awaited()
+
+    def test_upload_failed(self, client, redis, s3):
+        redis.evalsha.return_value = 1
+        s3.put_object.side_effect = ConnectionError
+
+        with pytest.raises(ConnectionError):
+            client.post(
+                "/api/publish", json={"title": "Test", "content": "<p>test</p>"}
+            )
+
+        redis.delete.assert_awaited_once_with("metadata:test")
 
 
 class TestUpdateEndpoint:
@@ -124,6 +640,13 @@ class TestUpdateEndpoint:
         )
 
         s3.put_object.assert_awaited_once()
+        redis.hset.assert_awaited_once()
+
+        mapping = redis.hset.await_args.kwargs["mapping"]
+        assert mapping["codec"] == "gzip+flush"
+        assert len(mapping["etag"]) == 64
+        assert int(mapping["modified"]) > 0
+        redis.publish.assert_awaited_once_with("invalidate:pages", "test")
 
         assert response.status_code == 200
 
@@ -132,6 +655,106 @@ class TestUpdateEndpoint:
         assert len(data) == 1
         assert "test" in data["url"]
 
+    def test_write_behind(self, client, config, redis, s3):
+        config.write_behind = True
+        redis.hgetall.return_value = {
+            b"pending": b"1-0",
+            b"secret_hash": b"$2b$12$kbGqdxpfbOCDxiVO7Dupee635ot/7PxgaQtStZwI7Lb4aQqLoNI8S",
+        }
+        redis.evalsha.return_value = b"2-0"
+
+        response = client.post(
+            "/api/test/update",
+            json={
+                "secret": "-2pTK-KBRQn7IDNMzm3oJBbAiI1QU_jC_fAz9TuZI18",
+                "content": "<p>test</p>",
+            },
+        )
+
+        assert response.status_code == 200
+
+        s3.put_object.assert_not_awaited()
+        redis.hset.assert_not_awaited()
+        redis.hdel.assert_not_awaited()
+
+    def test_drops_pending(self, client, redis, s3):
+        redis.hgetall.return_value = {
+            b"pending": b"1-0",
+            b"secret_hash": b"$2b$12$kbGqdxpfbOCDxiVO7Dupee635ot/7PxgaQtStZwI7Lb4aQqLoNI8S",
+        }
+
+        client.post(
+            "/api/test/update",
+            json={
+                "secret": "-2pTK-KBRQn7IDNMzm3oJBbAiI1QU_jC_fAz9TuZI18",
+                "content": "<p>test</p>",
+            },
+        )
+
+        s3.put_object.assert_awaited_once()
+        redis.hdel.assert_awaited_once_with("metadata:test", "pending")
+
+    def test_drops_dictionary(self, client, redis, s3):
+        redis.hgetall.return_value = {
+            b"codec": b"zstd+dict",
+            b"dictionary": b"1",
+            b"secret_hash": b"$2b$12$kbGqdxpfbOCDxiVO7Dupee635ot/7PxgaQtStZwI7Lb4aQqLoNI8S",
+        }
+
+        response = client.post(
+            "/api/test/update",
+            json={
+                "secret": "-2pTK-KBRQn7IDNMzm3oJBbAiI1QU_jC_fAz9TuZI18",
+                "content": "<p>test</p>",
+            },
+        )
+
+        assert response.status_code == 200
+        assert redis.hset.await_args.kwargs["mapping"]["codec"] == "gzip+flush"
+        redis.hdel.assert_awaited_once_with("metadata:test", "dictionary")
+
+    def test_to_inline(self, client, config, redis, s3):
+        config.inline_content_size = 1024
+        redis.hgetall.return_value = {
+            b"secret_hash": b"$2b$12$kbGqdxpfbOCDxiVO7Dupee635ot/7PxgaQtStZwI7Lb4aQqLoNI8S"
+        }
+
+        response = client.post(
+            "/api/test/update",
+            json={
+                "secret": "-2pTK-KBRQn7IDNMzm3oJBbAiI1QU_jC_fAz9TuZI18",
+                "content": "<p>test</p>",
+            },
+        )
+
+        assert response.status_code == 200
+
+        mapping = redis.hset.await_args.kwargs["mapping"]
+        assert gzip.decompress(mapping["content"]) == b"<p>test</p>"
+
+        s3.put_object.assert_not_awaited()
+        s3.remove_object.assert_awaited_once()
+
+    def test_from_inline(self, client, redis, s3):
+        redis.hgetall.return_value = {
+            b"content": b"",
+            b"secret_hash": b"$2b$12$kbGqdxpfbOCDxiVO7Dupee635ot/7PxgaQtStZwI7Lb4aQqLoNI8S",
+        }
+
+        response = client.post(
+            "/api/test/update",
+            json={
+                "secret": "-2pTK-KBRQn7IDNMzm3oJBbAiI1QU_jC_fAz9TuZI18",
+                "content": "<p>test</p>",
+            },
+        )
+
+        assert response.status_code == 200
+
+        s3.put_object.assert_awaited_once()
+        redis.hdel.assert_awaited_once_with("metadata:test", "content")
+        assert "content" not in redis.hset.await_args.kwargs["mapping"]
+
 
 class TestDeleteEndpoint:
     def test_not_found(self, client, redis):
@@ -163,9 +786,90 @@ class TestDeleteEndpoint:
 
         redis.delete.assert_awaited_once()
         s3.remove_object.assert_awaited_once()
+        redis.publish.assert_awaited_once_with("invalidate:pages", "test")
 
         assert response.status_code == 200
 
+    def test_inline(self, client, redis, s3):
+        redis.hgetall.return_value = {
+            b"content": b"",
+            b"secret_hash": b"$2b$12$kbGqdxpfbOCDxiVO7Dupee635ot/7PxgaQtStZwI7Lb4aQqLoNI8S",
+        }
+
+        response = client.post(
+            "/api/test/delete",
+            json={
+                "secret": "-2pTK-KBRQn7IDNMzm3oJBbAiI1QU_jC_fAz9TuZI18",
+            },
+        )
+
+        assert response.status_code == 200
+
+        redis.delete.assert_awaited_once()
+        s3.remove_object.assert_not_awaited()
+
+
+class TestContentEndpoint:
+    def test_inline(self, client, redis, s3):
+        redis.hgetall.return_value = {b"content": encoding.compress(b"<p>test</p>")}
+
+        response = client.get("/api/test/content")
+
+        assert response.status_code == HTTPStatus.OK
+        assert response.headers["content-encoding"] == "gzip"
+        assert response.text == "<p>test</p>"
+
+        s3.get_object.assert_not_awaited()
+
+    def test_object(self, client, redis, s3):
+        redis.hgetall.return_value = {b"title": b"Test"}
+        s3.get_object.return_value = mocks.MockS3Response(
+            body=gzip.compress(b"<p>test</p>"), status=200
+        )
+
+        response = client.get(
+            "/api/test/content", headers={"Accept-Encoding": "identity"}
+        )
+
+        assert response.status_code == HTTPStatus.OK
+        assert response.text == "<p>test</p>"
+
+    def test_local(self, client, config, redis, tmp_path):
+        config.storage = FileSystemStorage(tmp_path)
+        (tmp_path / "test").write_bytes(gzip.compress(b"<p>test</p>"))
+        redis.hgetall.return_value = {b"title": b"Test"}
+
+        response = client.get("/api/test/content", headers={"Accept-Encoding": "gzip"})
+
+        assert response.status_code == HTTPStatus.OK
+        assert response.headers["content-encoding"] == "gzip"
+        assert response.text == "<p>test</p>"
+
+        response = client.get(
+            "/api/test/content", headers={"Accept-Encoding": "identity"}
+        )
+
+        assert response.text == "<p>test</p>"
+
+    def test_local_missing(self, client, config, redis, tmp_path):
+        config.storage = FileSystemStorage(tmp_path)
+        redis.hgetall.return_value = {b"title": b"Test"}
+
+        with pytest.raises(HTTPException, match="404"):
+            client.get("/api/test/content", headers={"Accept-Encoding": "gzip"})
+
+    def test_dictionary(self, client, redis, s3, dictionary):
+        redis.hgetall.return_value = {b"codec": b"zstd+dict", b"title": b"Test"}
+        s3.get_object.return_value = mocks.MockS3Response(
+            body=dictionary(b"<p>test</p>"), status=200
+        )
+
+        response = client.get("/api/test/content", headers={"Accept-Encoding": "gzip"})
+
+        assert response.status_code == HTTPStatus.OK
+        assert "content-encoding" not in response.headers
+        assert response.text == "<p>test</p>"
+
 
 class TestHealthEndpoint:
     def test_ok(self, client, redis, s3):
@@ -175,3 +879,31 @@ class TestHealthEndpoint:
         response = client.get("/api/health")
         assert response.status_code == HTTPStatus.OK
         assert response.json() == {"redis": True, "s3": True}
+
+
+class TestStatsEndpoint:
+    def test_ok(self, client, config):
+        response = client.get("/api/stats")
+        assert response.status_code == HTTPStatus.OK
+        assert isinstance(response.json()["counters"], dict)
+        assert set(response.json()["page_cache"]) == {
+            "hits",
+            "misses",
+            "size",
+            "maxsize",
+        }
+        assert set(response.json()["pools"]) == {"redis", "s3"}
+        assert response.json()["pools"]["s3"] == {
+            "limit": config.s3_max_connections,
+            "in_use": 0,
+            "idle": 0,
+        }
+
+
+class TestMetricsEndpoint:
+    def test_ok(self, client):
+        response = client.get("/api/metrics")
+        assert response.status_code == HTTPStatus.OK
+        assert response.headers["content-type"].startswith("text/plain")
+        assert "easypub_request_duration_seconds" in response.text
+        assert "easypub_operation_duration_seconds" in response.text
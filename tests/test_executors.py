@@ -0,0 +1,73 @@
+import asyncio
+import os
+import threading
+
+import pytest
+
+from easypub.executors import BoundedExecutor, Saturated
+
+
+async def test_runs_in_pool():
+    executor = BoundedExecutor(kind="thread", workers=1, max_pending=1)
+
+    assert await executor.run(threading.get_ident) != threading.get_ident()
+
+    executor.shutdown()
+
+
+async def test_runs_inline_without_workers():
+    executor = BoundedExecutor(kind="thread", workers=0, max_pending=0)
+
+    assert await executor.run(threading.get_ident) == threading.get_ident()
+
+
+async def test_saturated():
+    executor = BoundedExecutor(kind="thread", workers=1, max_pending=1)
+    release = threading.Event()
+
+    blocked = asyncio.create_task(executor.run(release.wait))
+    await asyncio.sleep(0)
+
+    with pytest.raises(Saturated):
+        await executor.run(threading.get_ident)
+
+    release.set()
+    assert await blocked is True
+    assert executor.pending == 0
+
+    executor.shutdown()
+
+
+async def test_cancelled_call_stays_pending():
+    executor = BoundedExecutor(kind="thread", workers=1, max_pending=1)
+    release = threading.Event()
+
+    blocked = asyncio.create_task(executor.run(release.wait))
+    await asyncio.sleep(0)
+    blocked.cancel()
+
+    with pytest.raises(asyncio.CancelledError):
+        await blocked
+
+    # Still running in the pool.
+    assert executor.pending == 1
+
+    release.set()
+    await asyncio.sleep(0.1)
+    assert executor.pending == 0
+
+    executor.shutdown()
+
+
+async def test_process_pool():
+    executor = BoundedExecutor(kind="process", workers=1, max_pending=1)
+
+    assert await executor.run(os.getpid) != os.getpid()
+    assert executor.executor._mp_context.get_start_method() == "forkserver"
+
+    executor.shutdown()
+
+
+def test_invalid_kind():
+    with pytest.raises(ValueError):
+        BoundedExecutor(kind="fiber", workers=1, max_pending=1)
@@ -1,6 +1,7 @@
 import pytest
 
-from easypub.fields import SafeHTML
+from easypub.executors import BoundedExecutor
+from easypub.fields import HTML, SafeHTML, sanitize
 
 
 @pytest.mark.parametrize(
@@ -12,3 +13,25 @@ from easypub.fields import SafeHTML
 )
 def test_safe_html(value, expected):
     assert SafeHTML.validate(value) == expected
+
+
+def test_html_max_length(config):
+    config.max_content_length = 4
+
+    assert HTML.validate("<p/>") == "<p/>"
+
+    with pytest.raises(ValueError, match="less than 4"):
+        HTML.validate("<p></p>")
+
+
+@pytest.mark.parametrize("threshold", [0, 1_000_000])
+async def test_sanitize(config, threshold):
+    config.sanitize_threshold = threshold
+    config.sanitize_executor = BoundedExecutor(kind="thread", workers=1, max_pending=1)
+
+    result = await sanitize(HTML("<p>hi<script>console.log()</script></p>"))
+
+    assert isinstance(result, SafeHTML)
+    assert result == "<p>hiconsole.log()</p>"
+
+    config.sanitize_executor.shutdown()
@@ -0,0 +1,100 @@
+import time
+from unittest.mock import MagicMock
+
+import pytest
+from limits import parse
+from limits.storage import storage_from_string
+from limits.strategies import FixedWindowRateLimiter
+
+from easypub.limiting import LocalRedisStorage
+
+
+@pytest.fixture
+def storage():
+    storage = storage_from_string("local+redis://localhost:6379", sync_interval=3600)
+    storage.redis = MagicMock()
+    storage.sync_script = MagicMock()
+    return storage
+
+
+def test_scheme(storage):
+    assert isinstance(storage, LocalRedisStorage)
+
+
+def test_counts_locally(storage):
+    limiter = FixedWindowRateLimiter(storage)
+    limit = parse("2/minute")
+
+    assert limiter.hit(limit, "key")
+    assert limiter.hit(limit, "key")
+    assert not limiter.hit(limit, "key")
+    assert limiter.hit(limit, "other")
+
+    assert limiter.get_window_stats(limit, "key")[1] == 0
+    storage.redis.pipeline.assert_not_called()
+
+
+def test_expires(storage):
+    storage.incr("key", 60)
+    storage.windows["key"].expires_at = time.time()
+
+    assert storage.get("key") == 0
+    assert storage.incr("key", 60) == 1
+
+
+def test_sync(storage):
+    storage.incr("key", 60, amount=2)
+    storage.incr("other", 60)
+    storage.redis.pipeline.return_value.execute.return_value = [[5, 30], [1, 60]]
+
+    storage.sync()
+
+    storage.sync_script.assert_any_call(
+        keys=["key"], args=[60, 2], client=storage.redis.pipeline.return_value
+    )
+    assert storage.get("key") == 5
+    assert storage.get("other") == 1
+    assert 29 <= storage.get_expiry("key") - time.time() <= 30
+
+    storage.incr("key", 60)
+    assert storage.windows["key"].pending == 1
+    assert storage.get("key") == 6
+
+
+def test_hits_during_sync(storage):
+    storage.incr("key", 60)
+
+    def execute():
+        storage.incr("key", 60)
+        return [[3, 60]]
+
+    storage.redis.pipeline.return_value.execute.side_effect = execute
+
+    storage.sync()
+
+    assert storage.windows["key"].pending == 1
+    assert storage.get("key") == 4
+
+
+def test_sync_skips_idle_windows(storage):
+    storage.incr("key", 60)
+    storage.incr("other", 60)
+    storage.redis.pipeline.return_value.execute.return_value = [[1, 60], [1, 60]]
+    storage.sync()
+
+    storage.sync_script.reset_mock()
+    storage.incr("key", 60)
+    storage.redis.pipeline.return_value.execute.return_value = [[2, 60]]
+    storage.sync()
+
+    storage.sync_script.assert_called_once()
+    assert storage.sync_script.call_args.kwargs["keys"] == ["key"]
+
+    # Counts of the other workers are taken over once they are old enough.
+    storage.sync_script.reset_mock()
+    storage.windows["other"].refreshed_at -= storage.refresh_interval
+    storage.redis.pipeline.return_value.execute.return_value = [[4, 60]]
+    storage.sync()
+
+    storage.sync_script.assert_called_once()
+    assert storage.get("other") == 4
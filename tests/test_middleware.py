@@ -1,12 +1,32 @@
+import asyncio
+import gzip
+
+import brotli
 import pytest
+import zstandard
 
 from starlette.applications import Starlette
 from starlette.middleware import Middleware
-from starlette.responses import Response
-from starlette.routing import Route
+from starlette.responses import HTMLResponse, JSONResponse, Response, StreamingResponse
+from starlette.routing import Mount, Route
 from starlette.testclient import TestClient
 
-from easypub.middleware import CacheControlMiddleware
+from easypub import deadlines, metrics
+from easypub.middleware import (
+    CacheControlMiddleware,
+    CompressionMiddleware,
+    MetricsMiddleware,
+    ServerTimingMiddleware,
+    TimeoutMiddleware,
+)
+
+
+def zstd_decompress(data):
+    return zstandard.ZstdDecompressor().decompressobj().decompress(data)
+
+
+def sample(name, **labels):
+    return metrics.REGISTRY.get_sample_value(name, labels) or 0
 
 
 class TestCacheControl:
@@ -50,3 +70,267 @@ class TestCacheControl:
         response = TestClient(app).get("/")
 
         assert ("cache-control" in response.headers) is enabled
+
+
+class TestMetrics:
+    @pytest.mark.parametrize(
+        "path, route, status",
+        [
+            ("/", "hello", "200"),
+            ("/api/fail", "fail", "500"),
+            ("/api/missing", "unmatched", "404"),
+        ],
+    )
+    def test_recorded(self, path, route, status):
+        def hello(request):
+            return Response()
+
+        def fail(request):
+            raise RuntimeError
+
+        app = Starlette(
+            middleware=[Middleware(MetricsMiddleware)],
+            routes=[
+                Route("/", hello, name="hello"),
+                Mount("/api", routes=[Route("/fail", fail, name="fail")]),
+            ],
+        )
+
+        labels = {"route": route, "method": "GET"}
+        count = sample("easypub_request_duration_seconds_count", **labels)
+        responses = sample("easypub_responses_total", status=status, **labels)
+
+        TestClient(app, raise_server_exceptions=False).get(path)
+
+        assert sample("easypub_request_duration_seconds_count", **labels) == count + 1
+        assert (
+            sample("easypub_responses_total", status=status, **labels) == responses + 1
+        )
+
+
+class TestCompression:
+    @pytest.mark.parametrize("size, timed", [(100, False), (1000, True)])
+    def test_timed(self, size, timed):
+        def hello(request):
+            return HTMLResponse(b"x" * size)
+
+        app = Starlette(
+            middleware=[Middleware(CompressionMiddleware)], routes=[Route("/", hello)]
+        )
+
+        labels = {"component": "gzip", "operation": "response"}
+        count = sample("easypub_operation_duration_seconds_count", **labels)
+
+        response = TestClient(app).get("/", headers={"Accept-Encoding": "gzip"})
+
+        assert response.content == b"x" * size
+        assert (response.headers.get("content-encoding") == "gzip") is timed
+        assert sample("easypub_operation_duration_seconds_count", **labels) == (
+            count + timed
+        )
+
+    @pytest.mark.parametrize(
+        "accept_encoding, expected, decompress",
+        [
+            ("gzip, br, zstd", "br", brotli.decompress),
+            ("gzip, zstd", "zstd", lambda data: zstd_decompress(data)),
+            ("gzip", "gzip", gzip.decompress),
+            ("identity", None, None),
+        ],
+    )
+    def test_negotiates(self, accept_encoding, expected, decompress):
+        body = b"<p>hello</p>" * 100
+
+        def hello(request):
+            return HTMLResponse(body)
+
+        app = Starlette(
+            middleware=[Middleware(CompressionMiddleware)], routes=[Route("/", hello)]
+        )
+
+        # Read the raw body, the client only decodes some of these codings.
+        with TestClient(app).stream(
+            "GET", "/", headers={"Accept-Encoding": accept_encoding}
+        ) as response:
+            raw = b"".join(response.iter_raw())
+
+        assert response.headers.get("content-encoding") == expected
+        assert (decompress(raw) if decompress else raw) == body
+
+        if expected:
+            assert response.headers["vary"] == "Accept-Encoding"
+            assert response.headers["content-length"] == str(len(raw))
+
+    @pytest.mark.parametrize(
+        "response, compressed",
+        [
+            (HTMLResponse("x" * 1000), True),
+            (JSONResponse({"x": "x" * 1000}), False),
+            (Response(b"x" * 1000, media_type="text/html; charset=utf-8"), True),
+        ],
+    )
+    def test_policies(self, response, compressed):
+        app = Starlette(
+            middleware=[Middleware(CompressionMiddleware, minimum_size=10)],
+            routes=[Mount("/", response)],
+        )
+
+        response = TestClient(app).get("/", headers={"Accept-Encoding": "gzip"})
+
+        assert (response.headers.get("content-encoding") == "gzip") is compressed
+
+    def test_passes_encoded_through(self):
+        body = gzip.compress(b"x" * 1000)
+        response = HTMLResponse(body, headers={"Content-Encoding": "gzip"})
+        app = Starlette(
+            middleware=[Middleware(CompressionMiddleware, minimum_size=10)],
+            routes=[Mount("/", response)],
+        )
+
+        response = TestClient(app).get("/", headers={"Accept-Encoding": "gzip, br"})
+
+        assert response.headers["content-encoding"] == "gzip"
+        assert response.content == b"x" * 1000
+
+    async def test_streams(self):
+        async def app(scope, receive, send):
+            await send(
+                {
+                    "type": "http.response.start",
+                    "status": 200,
+                    "headers": [(b"content-type", b"text/html")],
+                }
+            )
+            for chunk in [b"head", b"", b"content" * 100]:
+                await send(
+                    {"type": "http.response.body", "body": chunk, "more_body": True}
+                )
+            await send({"type": "http.response.body", "body": b"foot"})
+
+        messages = []
+
+        async def send(message):
+            messages.append(message)
+
+        middleware = CompressionMiddleware(app, codings=["zstd"])
+        scope = {
+            "type": "http",
+            "headers": [(b"accept-encoding", b"zstd")],
+        }
+        await middleware(scope, None, send)
+
+        # Every chunk can be decoded as soon as it arrives.
+        decompressor = zstandard.ZstdDecompressor().decompressobj()
+        chunks = [decompressor.decompress(m["body"]) for m in messages[1:]]
+
+        assert chunks == [b"head", b"", b"content" * 100, b"foot"]
+        headers = dict(messages[0]["headers"])
+        assert headers[b"content-encoding"] == b"zstd"
+        assert b"content-length" not in headers
+
+    def test_exclude_routes(self):
+        def hello(request):
+            return HTMLResponse(b"x" * 1000)
+
+        app = Starlette(
+            middleware=[Middleware(CompressionMiddleware, exclude_routes={"static"})],
+            routes=[
+                Route("/", hello),
+                Mount("/static", HTMLResponse(b"x" * 1000), name="static"),
+            ],
+        )
+        client = TestClient(app)
+
+        response = client.get("/static/x", headers={"Accept-Encoding": "gzip"})
+        assert "content-encoding" not in response.headers
+
+        response = client.get("/", headers={"Accept-Encoding": "gzip"})
+        assert response.headers["content-encoding"] == "gzip"
+
+    def test_unsupported_coding(self):
+        with pytest.raises(ValueError):
+            CompressionMiddleware(None, codings=["deflate"])
+
+
+class TestServerTiming:
+    @pytest.mark.parametrize("enabled", [True, False])
+    def test_header(self, enabled):
+        async def hello(request):
+            for _ in range(2):
+                with metrics.timed("redis", "get"):
+                    pass
+            metrics.observe("s3", "get", 0.0015)
+            return Response()
+
+        app = Starlette(
+            middleware=[Middleware(ServerTimingMiddleware)],
+            routes=[Route("/", hello)],
+        )
+        app.state.server_timing = enabled
+
+        response = TestClient(app).get("/")
+
+        if not enabled:
+            assert "server-timing" not in response.headers
+            return
+
+        phases = response.headers["server-timing"].split(", ")
+        assert phases[0].startswith("redis;dur=")
+        assert phases[0].endswith(';desc="2 calls"')
+        assert phases[1] == "s3;dur=1.50"
+        assert phases[2].startswith("total;dur=")
+
+
+class TestTimeout:
+    def app(self, **options):
+        async def slow(request):
+            await asyncio.sleep(0.2)
+            return Response()
+
+        async def remaining(request):
+            return JSONResponse(deadlines.remaining())
+
+        async def stream(request):
+            async def body():
+                yield b"started"
+                await asyncio.sleep(0.2)
+                yield b"finished"
+
+            return StreamingResponse(body())
+
+        return Starlette(
+            middleware=[Middleware(TimeoutMiddleware, **options)],
+            routes=[
+                Route("/slow", slow, name="slow"),
+                Mount(
+                    "/api", routes=[Route("/remaining", remaining, name="remaining")]
+                ),
+                Route("/stream", stream, name="stream"),
+            ],
+        )
+
+    @pytest.mark.parametrize(
+        "route_timeouts, status_code",
+        [({}, 408), ({"slow": 1}, 200), ({"remaining": 1}, 408)],
+    )
+    def test_route_timeouts(self, route_timeouts, status_code):
+        app = self.app(timeout=0.05, route_timeouts=route_timeouts)
+
+        assert TestClient(app).get("/slow").status_code == status_code
+
+    def test_deadline(self):
+        app = self.app(timeout=1, route_timeouts={"remaining": 2})
+
+        response = TestClient(app).get("/api/remaining")
+
+        assert 1 < response.json() <= 2
+        assert deadlines.remaining() is None
+
+    def test_started(self):
+        app = self.app(timeout=0.05)
+
+        # No second response is started once the first one has been.
+        response = TestClient(app).get("/stream")
+
+        assert response.status_code == 200
+        assert b"finished" not in response.content
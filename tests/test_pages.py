@@ -0,0 +1,105 @@
+import asyncio
+import gzip
+from unittest.mock import MagicMock, patch
+
+import brotli
+import pytest
+
+from starlette.requests import Request
+
+from easypub import encoding, pages
+
+
+def request(accept_encoding):
+    return Request(
+        {
+            "type": "http",
+            "headers": [(b"accept-encoding", accept_encoding.encode())],
+        }
+    )
+
+
+async def test_fill_page():
+    page = {"gzip": encoding.compress(b"<p>page</p>")}
+
+    response = pages.page_response(request("gzip, br"), page, {}, fill=True)
+    assert response.headers["content-encoding"] == "gzip"
+
+    # Already being recompressed.
+    task = pages.fill_page(page, "br")
+    assert task is None
+
+    await pages._fills[(id(page), "br")]
+    assert brotli.decompress(page["br"]) == b"<p>page</p>"
+    assert not pages._fills
+
+    response = pages.page_response(request("gzip, br"), page, {})
+    assert response.headers["content-encoding"] == "br"
+    assert response.body == page["br"]
+
+
+async def test_identity():
+    page = {"gzip": gzip.compress(b"<p>page</p>")}
+
+    response = pages.page_response(request("identity"), page, {}, fill=True)
+
+    assert "content-encoding" not in response.headers
+    assert response.body == b"<p>page</p>"
+    assert set(page) == {"gzip"}
+
+
+class FakePubSub:
+    def __init__(self, messages):
+        self.messages = messages
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *args):
+        pass
+
+    async def subscribe(self, channel):
+        pass
+
+    async def get_message(self, ignore_subscribe_messages, timeout):
+        if not self.messages:
+            raise asyncio.CancelledError
+
+        return self.messages.pop(0)
+
+
+async def test_listen_for_invalidations(config):
+    config.page_cache = MagicMock()
+    pubsub = FakePubSub([None, None, {"type": "message", "data": b"slug"}, None])
+
+    with patch.object(config.redis, "pubsub", return_value=pubsub):
+        with pytest.raises(asyncio.CancelledError):
+            await pages.listen_for_invalidations()
+
+    # Waiting for messages in vain does not reconnect and clear the cache.
+    config.page_cache.clear.assert_called_once()
+    config.page_cache.delete.assert_called_once_with("slug")
+
+
+def test_generations():
+    generations = pages.Generations(size=2)
+    start = generations.current
+
+    generations.invalidate("a")
+
+    assert generations.changed_since("a", start)
+    assert not generations.changed_since("b", start)
+    assert not generations.changed_since("a", generations.current)
+
+    # Forgotten slugs count as invalidated for reads started before.
+    generations.invalidate("b")
+    generations.invalidate("c")
+
+    assert generations.changed_since("a", start)
+    assert generations.changed_since("d", start)
+    assert not generations.changed_since("d", generations.current)
+
+    middle = generations.current
+    generations.invalidate()
+
+    assert generations.changed_since("d", middle)
@@ -0,0 +1,18 @@
+from easypub.profiling import parse_importtime
+
+OUTPUT = """\
+import time: self [us] | cumulative | imported package
+import time:       120 |        120 |   redis.utils
+import time:      1000 |       1120 | redis
+import time:        50 |         50 |     jinja2.utils
+import time:      2000 |       2050 |   jinja2
+import time:       300 |       2350 | easypub.templating
+"""
+
+
+def test_parse_importtime():
+    assert parse_importtime(OUTPUT) == {
+        "redis": 1.12,
+        "jinja2": 2.05,
+        "easypub": 0.3,
+    }
@@ -0,0 +1,157 @@
+import io
+import time
+from datetime import datetime, timezone
+
+import pytest
+
+from easypub import reconcile
+from easypub.content import INLINE_FIELD, PENDING_FIELD, metadata_key
+from easypub.reconcile import CONTENT, METADATA, Orphan
+
+
+async def publish(redis, s3, slug, inline=False, stored=True, modified=0):
+    mapping = {"title": slug, "etag": f"etag-{slug}", "modified": modified}
+
+    if inline:
+        mapping[INLINE_FIELD] = b"inline"
+
+    await redis.hset(metadata_key(slug), mapping=mapping)
+
+    if stored:
+        s3.objects[slug] = b"content"
+
+
+async def collect(generator):
+    return [item async for item in generator]
+
+
+@pytest.fixture
+async def orphans(backends):
+    redis, s3 = backends
+
+    await publish(redis, s3, "complete")
+    await publish(redis, s3, "inline", inline=True, stored=False)
+    await publish(redis, s3, "missing", stored=False)
+    await publish(redis, s3, "moved", inline=True)
+    s3.objects["deleted"] = b"content"
+
+    return redis, s3
+
+
+async def test_find_orphans(orphans):
+    found = await collect(reconcile.find_orphans(grace=60, run_size=2))
+
+    assert sorted(found, key=lambda orphan: orphan.slug) == [
+        Orphan(CONTENT, "deleted"),
+        Orphan(METADATA, "missing"),
+        Orphan(CONTENT, "moved"),
+    ]
+
+
+async def test_find_orphans_skips_recent_objects(backends):
+    redis, s3 = backends
+    await publish(redis, s3, "uploading", stored=False)
+    await s3.put_object("bucket", "uploading", io.BytesIO(b"body"), 4)
+    await redis.delete(metadata_key("uploading"))
+
+    assert await collect(reconcile.find_orphans(grace=60)) == []
+
+
+async def test_dry_run(orphans):
+    redis, s3 = orphans
+    data, objects = dict(redis.data), dict(s3.objects)
+
+    results = await collect(reconcile.reconcile_orphans(grace=60))
+
+    assert len(results) == 3
+    assert not any(repaired for _, repaired in results)
+    assert (redis.data, s3.objects) == (data, objects)
+
+
+async def test_repair(orphans):
+    redis, s3 = orphans
+
+    results = await collect(reconcile.reconcile_orphans(repair=True, grace=60))
+
+    assert len(results) == 3
+    assert all(repaired for _, repaired in results)
+    assert metadata_key("missing") not in redis.data
+    assert sorted(s3.objects) == ["complete"]
+
+
+async def test_repair_skips_recent_metadata(backends):
+    redis, s3 = backends
+    await publish(redis, s3, "publishing", stored=False, modified=int(time.time()))
+
+    results = await collect(reconcile.reconcile_orphans(repair=True, grace=60))
+
+    assert results == []
+    assert metadata_key("publishing") in redis.data
+
+
+async def test_repair_skips_fixed_orphans(backends, monkeypatch):
+    redis, s3 = backends
+    await publish(redis, s3, "missing", stored=False)
+
+    found = reconcile.find_orphans
+
+    async def fixed(grace):
+        async for orphan in found(grace):
+            s3.objects[orphan.slug] = b"content"
+            yield orphan
+
+    monkeypatch.setattr(reconcile, "find_orphans", fixed)
+
+    results = await collect(reconcile.reconcile_orphans(repair=True, grace=60))
+
+    assert results == []
+    assert metadata_key("missing") in redis.data
+
+
+async def test_repair_skips_pending_uploads(backends):
+    redis, s3 = backends
+    await publish(redis, s3, "queued", stored=False)
+    await redis.hset(metadata_key("queued"), mapping={PENDING_FIELD: b"1-0"})
+
+    results = await collect(reconcile.reconcile_orphans(repair=True, grace=60))
+
+    assert results == []
+    assert metadata_key("queued") in redis.data
+
+
+async def test_repair_skips_uploads_queued_meanwhile(backends, monkeypatch):
+    redis, s3 = backends
+    await publish(redis, s3, "queued", stored=False)
+
+    confirm = reconcile._confirm_metadata
+
+    async def queued(slug, grace):
+        etag = await confirm(slug, grace)
+        await redis.hset(metadata_key(slug), mapping={PENDING_FIELD: b"1-0"})
+        return etag
+
+    monkeypatch.setattr(reconcile, "_confirm_metadata", queued)
+
+    results = await collect(reconcile.reconcile_orphans(repair=True, grace=60))
+
+    assert results == []
+    assert metadata_key("queued") in redis.data
+
+
+async def test_repair_skips_reuploaded_content(backends, monkeypatch):
+    redis, s3 = backends
+    s3.objects["orphan"] = b"content"
+
+    confirm = reconcile._confirm_content
+
+    async def reuploaded(slug):
+        confirmed = await confirm(slug)
+        s3.modified[slug] = datetime.now(timezone.utc)
+        return confirmed
+
+    monkeypatch.setattr(reconcile, "_confirm_content", reuploaded)
+
+    results = await collect(reconcile.reconcile_orphans(repair=True, grace=60))
+
+    assert results == []
+    assert "orphan" in s3.objects
@@ -0,0 +1,134 @@
+from unittest.mock import AsyncMock
+
+import pytest
+from miniopy_async.error import InvalidResponseError, S3Error, ServerError
+from yarl import URL
+
+from easypub.s3 import Minio
+
+from .mocks import MockS3Response
+
+
+def client(**kwargs):
+    return Minio(
+        "localhost:9000", access_key="a", secret_key="b", secure=False, **kwargs
+    )
+
+
+async def test_open_and_close():
+    minio = client(max_connections=4)
+
+    assert minio.pool_stats == {"limit": 4, "in_use": 0, "idle": 0}
+
+    await minio.open()
+    session = minio.session
+    assert session is not None
+    assert session.connector.limit == 4
+
+    await minio.open()
+    assert minio.session is session
+
+    await minio.close()
+    assert minio.session is None
+    assert session.closed
+
+
+async def test_session_without_pool():
+    minio = client()
+
+    async with minio._session() as session:
+        assert session.connector.force_close
+
+    assert session.closed
+
+
+def listing(names, token=None):
+    contents = "".join(
+        f"<Contents><Key>{name}</Key><LastModified>2022-01-01T00:00:00.000Z"
+        f"</LastModified><ETag>e</ETag><Size>1</Size></Contents>"
+        for name in names
+    )
+    more = f"<NextContinuationToken>{token}</NextContinuationToken>" if token else ""
+
+    return MockS3Response(
+        f"<ListBucketResult><Name>bucket</Name>{contents}"
+        f"<IsTruncated>{'true' if token else 'false'}</IsTruncated>{more}"
+        f"</ListBucketResult>".encode(),
+        200,
+    )
+
+
+async def test_iter_objects():
+    minio = client()
+    minio._execute = AsyncMock(side_effect=[listing(["a", "b"], "b"), listing(["c"])])
+
+    names = [obj.object_name async for obj in minio.iter_objects("bucket", page_size=2)]
+
+    assert names == ["a", "b", "c"]
+    queries = [call.kwargs["query_params"] for call in minio._execute.call_args_list]
+    assert "continuation-token" not in queries[0]
+    assert queries[1]["continuation-token"] == "b"
+    assert queries[1]["max-keys"] == "2"
+
+
+class ErrorResponse(MockS3Response):
+    def __init__(self, body, status, content_type="application/xml"):
+        super().__init__(body, status)
+        self.headers = {"content-type": content_type}
+        self.url = URL("http://localhost:9000/bucket/slug")
+
+
+async def url_open(minio, response, method="GET"):
+    minio._request = AsyncMock(return_value=response)
+
+    try:
+        await minio._url_open(method, "us-east-1", "bucket", "slug")
+    finally:
+        # Answered from the response, the request is not repeated.
+        minio._request.assert_awaited_once()
+
+
+async def test_error_from_body():
+    body = b"<Error><Code>NoSuchKey</Code><Message>Missing</Message></Error>"
+
+    with pytest.raises(S3Error) as error:
+        await url_open(client(), ErrorResponse(body, 404))
+
+    assert error.value.code == "NoSuchKey"
+
+
+async def test_error_without_body():
+    with pytest.raises(S3Error) as error:
+        await url_open(client(), ErrorResponse(b"", 404), method="HEAD")
+
+    assert error.value.code == "NoSuchKey"
+
+    with pytest.raises(ServerError):
+        await url_open(client(), ErrorResponse(b"", 502), method="HEAD")
+
+
+async def test_error_not_xml():
+    with pytest.raises(InvalidResponseError):
+        await url_open(client(), ErrorResponse(b"Bad Gateway", 502, "text/plain"))
+
+
+async def test_stream_error():
+    minio = client()
+    minio._get_region = AsyncMock(return_value="us-east-1")
+    minio._request = AsyncMock(
+        return_value=ErrorResponse(b"Not Found", 404, "text/plain")
+    )
+
+    with pytest.raises(InvalidResponseError):
+        async for _ in minio.stream_object("bucket", "slug"):
+            pass
+
+    body = b"<Error><Code>NoSuchKey</Code><Message>Missing</Message></Error>"
+    minio._request = AsyncMock(return_value=ErrorResponse(body, 404))
+
+    with pytest.raises(S3Error) as error:
+        async for _ in minio.stream_object("bucket", "slug"):
+            pass
+
+    assert error.value.code == "NoSuchKey"
+    minio._request.assert_awaited_once()
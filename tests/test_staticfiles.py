@@ -0,0 +1,104 @@
+import gzip
+import json
+
+import brotli
+import pytest
+
+from starlette.applications import Starlette
+from starlette.routing import Mount
+from starlette.testclient import TestClient
+
+from easypub.staticfiles import (
+    PrecompressedStaticFiles,
+    SendfileResponse,
+    compress_directory,
+)
+
+CSS = b"body { color: black; }\n" * 100
+
+
+@pytest.fixture
+def directory(tmp_path):
+    (tmp_path / "base.1234.css").write_bytes(CSS)
+    (tmp_path / "tiny.5678.js").write_bytes(b"x")
+    (tmp_path / "cache_manifest.json").write_text(
+        json.dumps({"base.css": "base.1234.css", "tiny.js": "tiny.5678.js"})
+    )
+    return tmp_path
+
+
+def test_compress_directory(directory):
+    written = compress_directory(directory)
+
+    assert sorted(path.name for path in written) == [
+        "base.1234.css.br",
+        "base.1234.css.gz",
+    ]
+    assert brotli.decompress((directory / "base.1234.css.br").read_bytes()) == CSS
+    assert gzip.decompress((directory / "base.1234.css.gz").read_bytes()) == CSS
+
+
+@pytest.mark.parametrize(
+    "accept_encoding, encoding",
+    [("gzip, br", "br"), ("gzip", "gzip"), ("identity", None)],
+)
+def test_serves_precompressed(directory, accept_encoding, encoding):
+    compress_directory(directory)
+    app = Starlette(
+        routes=[Mount("/static", PrecompressedStaticFiles(directory=directory))]
+    )
+
+    response = TestClient(app).get(
+        "/static/base.1234.css", headers={"Accept-Encoding": accept_encoding}
+    )
+
+    assert response.status_code == 200
+    assert response.content == CSS
+    assert response.headers.get("content-encoding") == encoding
+    assert response.headers["content-type"].startswith("text/css")
+    assert response.headers["vary"] == "Accept-Encoding"
+
+    etag = response.headers["etag"]
+    response = TestClient(app).get(
+        "/static/base.1234.css",
+        headers={"Accept-Encoding": accept_encoding, "If-None-Match": etag},
+    )
+    assert response.status_code == 304
+
+
+def test_serves_uncompressed_without_copies(directory):
+    app = Starlette(
+        routes=[Mount("/static", PrecompressedStaticFiles(directory=directory))]
+    )
+
+    response = TestClient(app).get(
+        "/static/tiny.5678.js", headers={"Accept-Encoding": "br, gzip"}
+    )
+
+    assert response.content == b"x"
+    assert "content-encoding" not in response.headers
+
+
+async def test_sendfile(directory):
+    path = directory / "base.1234.css"
+    response = SendfileResponse(path, stat_result=path.stat())
+    messages = []
+
+    async def send(message):
+        if message["type"] == "http.response.zerocopy":
+            message = {**message, "file": message["file"].read()}
+        messages.append(message)
+
+    scope = {
+        "type": "http",
+        "method": "GET",
+        "extensions": {"http.response.zerocopy": {}},
+    }
+    await response(scope, None, send)
+
+    assert [message["type"] for message in messages] == [
+        "http.response.start",
+        "http.response.zerocopy",
+    ]
+    assert messages[1]["file"] == CSS
+    assert messages[1]["count"] == len(CSS)
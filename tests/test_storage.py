@@ -0,0 +1,121 @@
+import pytest
+
+from benchmarks import fakes
+from easypub.storage import FileSystemStorage, ObjectNotFound, S3Storage
+
+
+async def collect(generator):
+    return [item async for item in generator]
+
+
+@pytest.fixture
+def local(tmp_path):
+    return FileSystemStorage(tmp_path / "content")
+
+
+@pytest.fixture
+def remote(config):
+    config.s3 = fakes.FakeS3()
+    return S3Storage()
+
+
+@pytest.fixture(params=["local", "remote"])
+def storage(request):
+    return request.getfixturevalue(request.param)
+
+
+async def test_round_trip(storage):
+    await storage.create()
+    await storage.put("slug", b"\x1f\x8bcontent", "gzip")
+
+    assert await storage.available()
+    assert await storage.exists("slug")
+    assert await storage.get("slug") == b"\x1f\x8bcontent"
+    assert b"".join(await collect(storage.stream("slug", chunk_size=3))) == (
+        b"\x1f\x8bcontent"
+    )
+
+    await storage.delete("slug")
+    await storage.delete("slug")
+
+    assert not await storage.exists("slug")
+
+
+async def test_missing(storage):
+    await storage.create()
+
+    with pytest.raises(ObjectNotFound):
+        await storage.get("missing")
+
+    with pytest.raises(ObjectNotFound):
+        await collect(storage.stream("missing"))
+
+
+async def test_stat(storage):
+    await storage.create()
+    await storage.put("slug", b"content")
+
+    obj = await storage.stat("slug")
+
+    assert (obj.name, obj.size) == ("slug", 7)
+    assert obj.modified is not None
+
+    with pytest.raises(ObjectNotFound):
+        await storage.stat("missing")
+
+
+async def test_iter_objects(storage):
+    await storage.create()
+
+    for name in ["b", "a", "c-1", "c"]:
+        await storage.put(name, name.encode())
+
+    objects = await collect(storage.iter_objects())
+
+    assert [(obj.name, obj.size) for obj in objects] == [
+        ("a", 1),
+        ("b", 1),
+        ("c", 1),
+        ("c-1", 3),
+    ]
+    assert all(obj.modified is not None for obj in objects)
+
+
+async def test_local_write_is_atomic(local):
+    await local.create()
+    await local.put("slug", b"first")
+    await local.put("slug", b"second")
+
+    assert [path.name for path in local.directory.iterdir()] == ["slug"]
+    assert local.local_path("slug") == str(local.directory / "slug")
+    assert await local.presign("slug") is None
+
+
+async def test_local_stream_empty(local):
+    await local.create()
+    await local.put("empty", b"")
+
+    assert await collect(local.stream("empty")) == []
+
+
+async def test_local_iter_objects_in_runs(local):
+    await local.create()
+    names = [f"slug-{i}" for i in range(7)]
+
+    for name in reversed(names):
+        await local.put(name, b"content")
+
+    objects = await collect(local.iter_objects(run_size=2))
+
+    assert [obj.name for obj in objects] == names
+
+
+@pytest.mark.parametrize("name", ["", ".hidden", "../escape", "a/b", "a\nb"])
+async def test_local_rejects_names(local, name):
+    with pytest.raises(ValueError):
+        await local.get(name)
+
+
+async def test_remote_presign(remote):
+    assert await remote.presign("slug") == "memory://content/slug"
+    assert remote.local_path("slug") is None
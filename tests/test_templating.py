@@ -0,0 +1,22 @@
+from easypub import manage
+from easypub.config import Config
+from easypub.templating import BytecodeCache
+
+
+def test_cache_key_ignores_directory(tmp_path):
+    cache = BytecodeCache(str(tmp_path))
+
+    assert cache.get_cache_key("read.html", "/tmp/build/read.html") == (
+        cache.get_cache_key("read.html", "/app/read.html")
+    )
+
+
+def test_compile_templates(config, tmp_path):
+    config.template_cache_dir = tmp_path / "_bytecode"
+    config.templates = Config().templates
+
+    manage._compile_templates()
+
+    # One entry for each of admin, base, index and read.
+    assert len(list(config.template_cache_dir.iterdir())) == 4
+    assert isinstance(config.templates.env.bytecode_cache, BytecodeCache)
@@ -0,0 +1,207 @@
+import asyncio
+import gzip
+import hashlib
+import json
+
+import pytest
+from miniopy_async.error import S3Error
+
+from benchmarks import fakes
+from easypub import dictionaries, encoding, transfer
+from easypub.content import INLINE_FIELD, metadata_key
+
+
+@pytest.fixture(autouse=True)
+def inline_content_size(config):
+    config.inline_content_size = 16
+
+
+async def seed(redis, s3, count):
+    for i in range(count):
+        slug = f"slug-{i:02}"
+        mapping = {"title": f"title {i}", "etag": f"etag-{i}"}
+
+        if i % 2:
+            mapping[INLINE_FIELD] = b"\x1f\x8binline"
+        else:
+            s3.objects[slug] = b"\x1f\x8b" + bytes(32)
+
+        await redis.hset(metadata_key(slug), mapping=mapping)
+
+
+def read_archive(path):
+    with gzip.open(path, "rt") as f:
+        return [json.loads(line) for line in f]
+
+
+async def test_bounded():
+    running = peak = 0
+
+    async def work(item):
+        nonlocal running, peak
+        running += 1
+        peak = max(peak, running)
+        await asyncio.sleep(0.001)
+        running -= 1
+        return item * 2
+
+    results = [result async for result in transfer.bounded(work, range(10), 3)]
+
+    assert sorted(results) == [item * 2 for item in range(10)]
+    assert peak == 3
+
+
+async def test_round_trip(backends, config, tmp_path):
+    redis, s3 = backends
+    await seed(redis, s3, 5)
+    archive = tmp_path / "posts.jsonl.gz"
+
+    progress = await transfer.export_archive(archive, concurrency=2, batch_size=2)
+
+    assert (progress.transferred, progress.skipped) == (5, 0)
+    assert not progress.exists
+    assert len(read_archive(archive)) == 5
+
+    source = redis.data, s3.objects
+    config.redis = fakes.FakeRedis()
+    config.s3 = fakes.FakeS3()
+
+    progress = await transfer.import_archive(archive, concurrency=2, batch_size=2)
+
+    assert (progress.transferred, progress.skipped) == (5, 0)
+    assert not progress.exists
+    assert (config.redis.data, config.s3.objects) == source
+
+
+async def test_export_without_dictionaries(backends, config, tmp_path, monkeypatch):
+    import zstandard
+
+    redis, s3 = backends
+    monkeypatch.setattr(dictionaries, "_decompressors", {})
+    samples = [f"<p>Paragraph {i} of a publication.</p>".encode() for i in range(100)]
+    dictionary_id = await dictionaries.store_dictionary(
+        zstandard.train_dictionary(1024, samples).as_bytes()
+    )
+    config.storage_dictionary = dictionary_id
+
+    content = b"<p>Paragraph 1000 of a publication.</p>" * 4
+    encoded_content, codec = await dictionaries.encode_content(content)
+    s3.objects["slug"] = encoded_content
+    await redis.hset(
+        metadata_key("slug"),
+        mapping={
+            "etag": "zstd-etag",
+            "modified": "1668000000",
+            "size": str(len(encoded_content)),
+            "title": "Slug",
+            **codec,
+        },
+    )
+
+    archive = tmp_path / "posts.jsonl.gz"
+    await transfer.export_archive(archive)
+
+    # Imported where the dictionary does not exist.
+    config.redis = fakes.FakeRedis()
+    config.s3 = fakes.FakeS3()
+    dictionaries._decompressors.clear()
+
+    progress = await transfer.import_archive(archive)
+
+    assert progress.transferred == 1
+    stored = config.s3.objects["slug"]
+
+    assert config.redis.data[metadata_key("slug")] == {
+        b"codec": encoding.SPLICEABLE_CODEC.encode(),
+        b"etag": hashlib.sha256(stored).hexdigest().encode(),
+        b"modified": b"1668000000",
+        b"size": str(len(stored)).encode(),
+        b"title": b"Slug",
+    }
+    assert gzip.decompress(stored) == content
+
+
+async def test_export_refuses_existing_archive(backends, tmp_path):
+    archive = tmp_path / "posts.jsonl.gz"
+    archive.touch()
+
+    with pytest.raises(FileExistsError):
+        await transfer.export_archive(archive)
+
+
+async def test_export_resumes(backends, tmp_path):
+    redis, s3 = backends
+    await seed(redis, s3, 6)
+    archive = tmp_path / "posts.jsonl.gz"
+
+    get_object = s3.get_object
+    calls = 0
+
+    async def interrupted(bucket_name, object_name):
+        nonlocal calls
+        calls += 1
+        if calls == 2:
+            raise RuntimeError("interrupted")
+        return await get_object(bucket_name, object_name)
+
+    s3.get_object = interrupted
+
+    with pytest.raises(RuntimeError):
+        await transfer.export_archive(archive, batch_size=2)
+
+    checkpoint = transfer.Checkpoint.for_archive(archive, "export")
+    assert (checkpoint.position, checkpoint.transferred) == (2, 2)
+
+    progress = await transfer.export_archive(archive, batch_size=2)
+
+    assert progress.transferred == 6
+    assert sorted(record["slug"] for record in read_archive(archive)) == [
+        f"slug-{i:02}" for i in range(6)
+    ]
+
+
+async def test_export_skips_missing_objects(backends, tmp_path):
+    redis, s3 = backends
+    await seed(redis, s3, 2)
+
+    async def missing(bucket_name, object_name):
+        raise S3Error("NoSuchKey", "", "", "", "", None)
+
+    s3.get_object = missing
+
+    progress = await transfer.export_archive(tmp_path / "posts.jsonl.gz")
+
+    assert (progress.transferred, progress.skipped) == (1, 1)
+
+
+async def test_import_skips_taken_slugs(backends, tmp_path):
+    redis, s3 = backends
+    await seed(redis, s3, 2)
+    archive = tmp_path / "posts.jsonl.gz"
+    await transfer.export_archive(archive)
+
+    redis.data = {metadata_key("slug-00"): {b"title": b"taken"}}
+
+    progress = await transfer.import_archive(archive)
+
+    assert (progress.transferred, progress.skipped) == (1, 1)
+    assert redis.data[metadata_key("slug-00")] == {b"title": b"taken"}
+
+
+async def test_import_resumes(backends, tmp_path):
+    redis, s3 = backends
+    await seed(redis, s3, 3)
+    archive = tmp_path / "posts.jsonl.gz"
+    await transfer.export_archive(archive)
+    redis.data.clear()
+    _, *rest = [record["slug"] for record in read_archive(archive)]
+
+    checkpoint = transfer.Checkpoint.for_archive(archive, "import")
+    checkpoint.position = 1
+    checkpoint.transferred = 1
+    checkpoint.save()
+
+    progress = await transfer.import_archive(archive)
+
+    assert (progress.transferred, progress.skipped) == (3, 0)
+    assert sorted(redis.data) == sorted(metadata_key(slug) for slug in rest)
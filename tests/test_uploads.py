@@ -0,0 +1,105 @@
+import pytest
+
+from easypub import uploads
+from easypub.content import (
+    PENDING_FIELD,
+    UPLOAD_STREAM,
+    enqueue_upload,
+    get_content,
+    metadata_key,
+)
+
+
+@pytest.fixture(autouse=True)
+async def group(backends, config):
+    config.coalesce_reads = "off"
+    await uploads.create_group()
+
+
+async def test_create_group_twice(backends):
+    await uploads.create_group()
+
+
+async def test_enqueue(backends):
+    redis, s3 = backends
+
+    entry_id = await enqueue_upload("slug", b"content", {"title": "Slug"}, True)
+
+    assert redis.data[metadata_key("slug")] == {
+        b"pending": entry_id,
+        b"title": b"Slug",
+    }
+    assert await get_content("slug", redis.data[metadata_key("slug")]) == b"content"
+    assert s3.objects == {}
+
+    assert await enqueue_upload("slug", b"other", {"title": "Taken"}, True) is None
+    assert len(await redis.xrange(UPLOAD_STREAM)) == 1
+
+
+async def test_consume(backends):
+    redis, s3 = backends
+    entry_id = await enqueue_upload("slug", b"content", {"title": "Slug"}, True)
+    metadata = await redis.hgetall(metadata_key("slug"))
+
+    assert await uploads.consume("worker") == [(entry_id, True)]
+
+    assert s3.objects == {"slug": b"content"}
+    assert PENDING_FIELD.encode() not in redis.data[metadata_key("slug")]
+    assert await redis.xrange(UPLOAD_STREAM) == []
+
+    # Reads which found the entry before it was removed get the object.
+    assert await get_content("slug", metadata) == b"content"
+
+
+async def test_skips_superseded(backends):
+    redis, s3 = backends
+    first = await enqueue_upload("slug", b"first", {"title": "Slug"}, True)
+    second = await enqueue_upload("slug", b"second", {"title": "Slug"})
+    deleted = await enqueue_upload("deleted", b"deleted", {"title": "Deleted"}, True)
+    await redis.delete(metadata_key("deleted"))
+
+    results = await uploads.consume("worker")
+
+    assert sorted(results) == sorted([(first, False), (second, True), (deleted, False)])
+    assert s3.objects == {"slug": b"second"}
+    assert await redis.xrange(UPLOAD_STREAM) == []
+
+
+async def test_retries(backends, monkeypatch):
+    redis, s3 = backends
+    entry_id = await enqueue_upload("slug", b"content", {"title": "Slug"}, True)
+
+    put_object = s3.put_object
+    calls = 0
+
+    async def flaky(*args, **kwargs):
+        nonlocal calls
+        calls += 1
+        if calls < 3:
+            raise ConnectionError
+        return await put_object(*args, **kwargs)
+
+    monkeypatch.setattr(s3, "put_object", flaky)
+
+    assert await uploads.consume("worker", backoff=0) == [(entry_id, True)]
+    assert calls == 3
+
+
+async def test_claims_failed_uploads(backends, monkeypatch):
+    redis, s3 = backends
+    entry_id = await enqueue_upload("slug", b"content", {"title": "Slug"}, True)
+
+    async def failing(*args, **kwargs):
+        raise ConnectionError
+
+    monkeypatch.setattr(s3, "put_object", failing)
+
+    assert await uploads.consume("worker", attempts=2, backoff=0) == [(entry_id, None)]
+    assert len(await redis.xrange(UPLOAD_STREAM)) == 1
+
+    # Not idle for long enough to be claimed, and not delivered again.
+    assert await uploads.consume("worker") == []
+
+    monkeypatch.undo()
+    assert await uploads.consume("other", claim_idle=0) == [(entry_id, True)]
+    assert s3.objects == {"slug": b"content"}